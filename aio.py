@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, has_request_context, _request_ctx_stack
+from models import db
+
+
+# ----------------------------------------------------------------------------#
+# Async read path.
+# ----------------------------------------------------------------------------#
+
+# The async views never touch db.session themselves: the coroutine runs on an
+# event loop thread that outlives the request, so a session opened there would
+# never be removed. Each query instead runs on a worker thread, inside a copy
+# of the request context, with its own scoped session and a connection from
+# the shared engine pool. Independent queries of a page run side by side.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config.get('ASYNC_QUERY_WORKERS', 16),
+                                           thread_name_prefix='fyyur-query')
+        return _executor
+
+
+def _call(context, queries, call):
+    with context:
+        if queries is not None:
+            g.queries = queries
+        db.use_replica()
+        return call()
+
+
+async def run(call):
+    # runs call() on a query worker thread and waits for its result
+    return (await gather(call))[0]
+
+
+async def gather(*calls):
+    # runs every call concurrently; results come back in order
+    loop = asyncio.get_running_loop()
+    queries = g.get('queries') if has_request_context() else None
+    pool = executor()
+    futures = [loop.run_in_executor(pool, _call, _request_ctx_stack.top.copy(), queries, call)
+               for call in calls]
+    return await asyncio.gather(*futures)
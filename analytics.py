@@ -0,0 +1,373 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import (db, Venue, Artist, Genre, Show, artist_genres, venue_show_rollup, artist_show_rollup,
+                    state_show_rollup, genre_show_rollup, show_rollup_days)
+from jobs import task, last_done, record
+
+
+# ----------------------------------------------------------------------------#
+# Buckets.
+# ----------------------------------------------------------------------------#
+
+# Shows are counted per day, and the day counts add up to weeks (starting on
+# Monday) and calendar months. Every row also keeps the count of the bucket
+# before it, so a list for one bucket, with its trend, is a single index
+# range: no range of buckets is ever summed at read time.
+
+PERIODS = ('day', 'week', 'month')
+
+
+def bucket(day, period):
+    # first day of the `period` holding `day`
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_end(start, period):
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_before(start, period):
+    return bucket(start - timedelta(days=1), period)
+
+
+# ----------------------------------------------------------------------------#
+# Refresh.
+# ----------------------------------------------------------------------------#
+
+# The day rows of a day are recounted from Shows with the (start_time, id)
+# index, and the week and month rows holding it are summed again from the
+# day rows. `analytics.refresh` does that for the days that gained shows
+# (by Shows.updated_at) or lost them (recorded in show_rollup_days by the
+# session hooks below) since its last run. Venue states and artist genres
+# are counted as they are when a day is recounted; the daily rebuild
+# catches up on edits to them.
+
+shows = Show.__table__
+venues = Venue.__table__
+artists = Artist.__table__
+ROLLUPS = (venue_show_rollup, artist_show_rollup, state_show_rollup, genre_show_rollup)
+# writes committed shortly after the previous refresh started are covered
+# by the next one
+OVERLAP = timedelta(minutes=1)
+
+
+def _keys(table):
+    return [column.name for column in table.primary_key.columns if column.name not in ('period', 'bucket')]
+
+
+def _columns(table):
+    return ['period', 'bucket'] + _keys(table) + ['shows', 'previous_shows', 'trend']
+
+
+def count_day(table, day):
+    # SELECT of (keys..., shows) of `table` for `day`, counted from Shows
+    start = datetime.combine(day, datetime.min.time())
+    during = db.and_(shows.c.start_time >= start, shows.c.start_time < start + timedelta(days=1))
+    state = db.func.coalesce(venues.c.state, '').label('state')
+    at_venue = shows.join(venues, venues.c.id == shows.c.venue_id)
+    if table is venue_show_rollup:
+        keys, source, during = [shows.c.venue_id], shows, db.and_(during, shows.c.venue_id.isnot(None))
+    elif table is artist_show_rollup:
+        keys, source, during = [shows.c.artist_id], shows, db.and_(during, shows.c.artist_id.isnot(None))
+    elif table is state_show_rollup:
+        keys, source = [state], at_venue
+    else:
+        keys = [state, artist_genres.c.genre_id]
+        source = at_venue.join(artist_genres, artist_genres.c.artist_id == shows.c.artist_id)
+    return (db.select(keys + [db.func.count().label('shows')])
+            .select_from(source).where(during).group_by(*keys))
+
+
+def sum_days(table, period, start):
+    # SELECT of (keys..., shows) of the `period` starting at `start`, summed
+    # from the day rows
+    keys = [table.c[key] for key in _keys(table)]
+    return (db.select(keys + [db.func.sum(table.c.shows).label('shows')])
+            .where(db.and_(table.c.period == 'day', table.c.bucket >= start,
+                           table.c.bucket < bucket_end(start, period)))
+            .group_by(*keys))
+
+
+def _replace(connection, table, period, start, counts):
+    # the rows of a bucket from the (keys..., shows) of `counts`, next to the
+    # counts of the bucket before; then the trend of the bucket after
+    keys = _keys(table)
+    counts = counts.alias('counts')
+    before = table.alias('before')
+    shows_before = db.func.coalesce(before.c.shows, 0)
+    joined = counts.outerjoin(before, db.and_(before.c.period == period,
+                                              before.c.bucket == bucket_before(start, period),
+                                              *[before.c[key] == counts.c[key] for key in keys]))
+    rows = (db.select([db.literal(period), db.literal(start, db.Date)] + [counts.c[key] for key in keys]
+                      + [counts.c.shows, shows_before, counts.c.shows - shows_before])
+            .select_from(joined))
+    connection.execute(table.delete().where(db.and_(table.c.period == period, table.c.bucket == start)))
+    connection.execute(table.insert().from_select(_columns(table), rows))
+    current = table.alias('current')
+    shows_now = db.func.coalesce(
+        db.select([current.c.shows])
+        .where(db.and_(current.c.period == period, current.c.bucket == start,
+                       *[current.c[key] == table.c[key] for key in keys]))
+        .as_scalar(), 0)
+    connection.execute(table.update()
+                       .where(db.and_(table.c.period == period, table.c.bucket == bucket_end(start, period)))
+                       .values(previous_shows=shows_now, trend=table.c.shows - shows_now))
+
+
+def refresh(connection, days):
+    # recounts `days` and the weeks and months they are in, oldest first so
+    # each bucket is compared with an up to date one; returns how many days
+    # were recounted
+    days = sorted(set(days))
+    for day in days:
+        for table in ROLLUPS:
+            _replace(connection, table, 'day', day, count_day(table, day))
+    for period in PERIODS[1:]:
+        for start in sorted(set(bucket(day, period) for day in days)):
+            for table in ROLLUPS:
+                _replace(connection, table, period, start, sum_days(table, period, start))
+    return len(days)
+
+
+def show_days(connection):
+    # the days that have shows, one index seek each
+    day = None
+    while True:
+        query = db.select([db.func.min(shows.c.start_time)])
+        if day is not None:
+            query = query.where(shows.c.start_time >= datetime.combine(day + timedelta(days=1), datetime.min.time()))
+        first = connection.execute(query).scalar()
+        if first is None:
+            return
+        day = first.date()
+        yield day
+
+
+def _recorded(connection):
+    # (days recorded by the session hooks, id of the last one read)
+    last_id = connection.execute(db.select([db.func.max(show_rollup_days.c.id)])).scalar()
+    if last_id is None:
+        return set(), None
+    days = set(row[0] for row in connection.execute(
+        db.select([show_rollup_days.c.day]).distinct().where(show_rollup_days.c.id <= last_id)))
+    return days, last_id
+
+
+def _forget(connection, last_id):
+    # days recorded while the refresh ran stay for the next one
+    if last_id is not None:
+        connection.execute(show_rollup_days.delete().where(show_rollup_days.c.id <= last_id))
+
+
+def rebuild(connection, as_job=False):
+    # recounts everything; returns the number of days with shows. Runs
+    # outside the job queue (the command, the seed) pass as_job=True to
+    # log themselves as an analytics.rebuild job, which moves last_run() and
+    # so the page validators
+    started = datetime.utcnow()
+    last_id = _recorded(connection)[1]
+    for table in ROLLUPS:
+        connection.execute(table.delete())
+    done = refresh(connection, list(show_days(connection)))
+    _forget(connection, last_id)
+    if as_job:
+        record('analytics.rebuild', started, connection)
+    return done
+
+
+def stale_days(connection, since):
+    # (days that gained or lost shows since `since`, id of the last recorded day)
+    days, last_id = _recorded(connection)
+    days.update(row[0].date() for row in connection.execute(
+        db.select([shows.c.start_time]).distinct()
+        .where(db.and_(shows.c.updated_at >= since, shows.c.start_time.isnot(None)))))
+    return days, last_id
+
+
+def last_run():
+    # start of the newest refresh or rebuild that finished
+    return last_done(('analytics.refresh', 'analytics.rebuild'))
+
+
+def update(connection):
+    # what `analytics.refresh` does: recounts the stale days, or everything
+    # before the first run; returns how many days were recounted
+    since = last_run()
+    if since is None:
+        return rebuild(connection)
+    days, last_id = stale_days(connection, since - OVERLAP)
+    done = refresh(connection, days)
+    _forget(connection, last_id)
+    return done
+
+
+# ----------------------------------------------------------------------------#
+# Session hooks.
+# ----------------------------------------------------------------------------#
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_days(session, flush_context, instances):
+    # days this flush takes shows away from: deleted shows, the old day of a
+    # moved show, and the shows of a deleted venue or artist, which go
+    # through ON DELETE CASCADE
+    days = set()
+    for instance in session.dirty | session.deleted:
+        if isinstance(instance, Show):
+            history = inspect(instance).attrs.start_time.history
+            values = list(history.deleted or ())
+            if instance in session.deleted:
+                values.extend(history.unchanged or ())
+            days.update(_day(value) for value in values)
+        elif isinstance(instance, (Venue, Artist)) and instance in session.deleted:
+            column = shows.c.venue_id if isinstance(instance, Venue) else shows.c.artist_id
+            days.update(_day(row[0]) for row in session.execute(
+                db.select([shows.c.start_time]).distinct().where(column == instance.id)))
+    days.discard(None)
+    if days:
+        session.info.setdefault('show_rollup_days', set()).update(days)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_days(session, flush_context):
+    days = session.info.pop('show_rollup_days', None)
+    if days:
+        session.connection().execute(show_rollup_days.insert(), [{'day': day} for day in sorted(days)])
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+# Every list is for one bucket: its shows and those of the bucket before
+# (previous_shows), busiest first, or with trending=True the largest
+# increase first.
+
+def _rows(query):
+    # dict(row) is keyed by the columns' quoted_name, which orjson refuses
+    return [dict((str(key), value) for key, value in row.items()) for row in db.session.execute(query)]
+
+
+def _order(table, trending, key):
+    return [(table.c.trend if trending else table.c.shows).desc(), key.desc()]
+
+
+def _bucket(table, period, start):
+    return db.and_(table.c.period == period, table.c.bucket == start)
+
+
+def top_venues(period, start, limit, trending=False, state=None):
+    table = venue_show_rollup
+    query = (db.select([venues.c.id, venues.c.name, venues.c.city, venues.c.state,
+                        table.c.shows, table.c.previous_shows])
+             .select_from(table.join(venues, venues.c.id == table.c.venue_id))
+             .where(_bucket(table, period, start))
+             .order_by(*_order(table, trending, table.c.venue_id)).limit(limit))
+    if state:
+        query = query.where(venues.c.state == state)
+    return _rows(query)
+
+
+def top_artists(period, start, limit, trending=False):
+    table = artist_show_rollup
+    query = (db.select([artists.c.id, artists.c.name, table.c.shows, table.c.previous_shows])
+             .select_from(table.join(artists, artists.c.id == table.c.artist_id))
+             .where(_bucket(table, period, start))
+             .order_by(*_order(table, trending, table.c.artist_id)).limit(limit))
+    return _rows(query)
+
+
+def top_states(period, start, limit, trending=False):
+    table = state_show_rollup
+    query = (db.select([table.c.state, table.c.shows, table.c.previous_shows])
+             .where(_bucket(table, period, start))
+             .order_by(*_order(table, trending, table.c.state)).limit(limit))
+    return _rows(query)
+
+
+def top_genres(period, start, limit, trending=False, state=None):
+    # over every state unless one is given. A genre's row in a state only
+    # carries the previous count when it has shows in both buckets, so the
+    # bucket before is summed too.
+    table = genre_show_rollup
+    before = bucket_before(start, period)
+    total = db.func.sum(db.case([(table.c.bucket == start, table.c.shows)], else_=0))
+    total_before = db.func.sum(db.case([(table.c.bucket == before, table.c.shows)], else_=0))
+    query = (db.select([Genre.name.label('genre'), total.label('shows'), total_before.label('previous_shows')])
+             .select_from(table.join(Genre, Genre.id == table.c.genre_id))
+             .where(db.and_(table.c.period == period, table.c.bucket.in_([before, start])))
+             .group_by(Genre.id, Genre.name).having(total > 0)
+             .order_by((total - total_before if trending else total).desc(), Genre.name).limit(limit))
+    if state:
+        query = query.where(table.c.state == state)
+    return _rows(query)
+
+
+def genres_by_state(period, start, limit, trending=False):
+    # [{'state': ..., 'genres': [...]}], the `limit` first genres of each
+    # state, states in order
+    table = genre_show_rollup
+    query = (db.select([table.c.state, Genre.name.label('genre'), table.c.shows, table.c.previous_shows])
+             .select_from(table.join(Genre, Genre.id == table.c.genre_id))
+             .where(_bucket(table, period, start))
+             .order_by(table.c.state, (table.c.trend if trending else table.c.shows).desc(), Genre.name))
+    states = []
+    for row in db.session.execute(query):
+        if not states or states[-1]['state'] != row.state:
+            states.append({'state': row.state, 'genres': []})
+        if len(states[-1]['genres']) < limit:
+            states[-1]['genres'].append({'genre': row.genre, 'shows': row.shows,
+                                         'previous_shows': row.previous_shows})
+    return states
+
+
+def analytics_version():
+    # the rollups only change when a refresh or rebuild runs, and the
+    # default range moves with the (UTC, like analytics_args) day
+    last = last_run()
+    return last, (last, datetime.utcnow().date())
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+@task('analytics.refresh', retries=0)
+def refresh_task():
+    update(db.session.connection())
+
+
+@task('analytics.rebuild', retries=0)
+def rebuild_task():
+    rebuild(db.session.connection())
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+analytics_cli = AppGroup('analytics', help='Maintain the show rollups behind /analytics.')
+
+
+@analytics_cli.command('rebuild', help='Recount every rollup from Shows.')
+def rebuild_command():
+    started = time.perf_counter()
+    done = rebuild(db.session.connection(), as_job=True)
+    db.session.commit()
+    click.echo('counted %d days in %.1fs' % (done, time.perf_counter() - started))
+
@@ -0,0 +1,403 @@
+import gzip
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+import analytics
+import booking
+import geo
+import search
+from cache import conditional
+from queries import (
+    venue_areas,
+    artist_list,
+    show_list,
+    venue_detail,
+    artist_detail,
+    venue_shows,
+    artist_shows,
+    venues_version,
+    artists_version,
+    shows_version,
+    venue_version,
+    artist_version,
+    decode_show_cursor
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+# ----------------------------------------------------------------------------#
+# Encoding.
+# ----------------------------------------------------------------------------#
+
+# orjson when it is installed, the standard library otherwise; both write
+# datetimes as ISO 8601.
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+# Bodies smaller than this are sent as they are.
+MIN_COMPRESS_SIZE = 1024
+
+
+def content_encoding():
+    # brotli when the client takes it and the module is installed, then gzip
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, 6)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def json_response(value, status=200):
+    body = dumps(value)
+    encoding = content_encoding() if len(body) >= MIN_COMPRESS_SIZE else None
+    response = Response(compress(body, encoding) if encoding else body, status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def stream_response(chunks):
+    encoding = content_encoding()
+    if encoding:
+        chunks = compress_stream(chunks, encoding)
+    response = Response(stream_with_context(chunks), mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Request arguments.
+# ----------------------------------------------------------------------------#
+
+VENUE_LIST_FIELDS = ('id', 'name', 'city', 'state', 'num_upcoming_shows')
+ARTIST_LIST_FIELDS = ('id', 'name')
+SHOW_LIST_FIELDS = ('id', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link',
+                    'start_time')
+SEARCH_FIELDS = ('id', 'name', 'num_upcoming_shows')
+SHOWS_FIELDS = ('upcoming_shows', 'past_shows', 'upcoming_shows_count', 'past_shows_count', 'past_shows_next')
+VENUE_FIELDS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'image_link') + SHOWS_FIELDS
+ARTIST_FIELDS = ('id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'image_link') + SHOWS_FIELDS
+
+
+def requested_fields(allowed):
+    # ?fields=id,name; every field when the argument is missing
+    fields = request.args.get('fields')
+    if not fields:
+        return allowed
+    fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, 'unknown fields: %s' % ', '.join(unknown))
+    return fields
+
+
+def pick(item, fields):
+    return dict((field, item[field]) for field in fields)
+
+
+def cursor_arg():
+    cursor = request.args.get('cursor')
+    if cursor in (None, ''):
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        abort(400, 'invalid cursor')
+
+
+def show_cursor_arg():
+    # the shows' (start_time, id) cursor, checked like the numeric ones
+    cursor = request.args.get('cursor')
+    if cursor in (None, ''):
+        return None
+    if decode_show_cursor(cursor) is None:
+        abort(400, 'invalid cursor')
+    return cursor
+
+
+def limit_arg():
+    limit = request.args.get('limit', current_app.config['LISTING_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['LISTING_MAX_PAGE_SIZE']))
+
+
+def parse_day(value, name):
+    # ?from=/?to= take a date or a date and time (ISO 8601)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, 'invalid %s: %s' % (name, value))
+
+
+def near_arg():
+    # ?near=lat,lon&radius=km -> (latitude, longitude, radius_km), or None
+    near = request.args.get('near', '').strip()
+    if not near:
+        return None
+    try:
+        return geo.parse_near(near, request.args.get('radius', '').strip(),
+                              current_app.config['GEO_DEFAULT_RADIUS_KM'], current_app.config['GEO_MAX_RADIUS_KM'])
+    except ValueError:
+        abort(400, 'near takes latitude,longitude and radius up to %s km'
+              % current_app.config['GEO_MAX_RADIUS_KM'])
+
+
+def show_filters():
+    # ?from=&to=&city=&state=&genre=&near=&radius= of the show listings;
+    # returns the arguments as given and the show_list() criteria. A
+    # date-only `to` includes that day.
+    filters = {}
+    for name in ('from', 'to', 'city', 'state', 'genre', 'near', 'radius'):
+        value = request.args.get(name, '').strip()
+        if value:
+            filters[name] = value
+    criteria = {'city': filters.get('city'), 'state': filters.get('state'), 'genre': filters.get('genre'),
+                'near': near_arg()}
+    if 'from' in filters:
+        criteria['start'] = parse_day(filters['from'], 'from')
+    if 'to' in filters:
+        criteria['end'] = parse_day(filters['to'], 'to')
+        if len(filters['to']) == 10:
+            criteria['end'] += timedelta(days=1)
+    return filters, criteria
+
+
+def analytics_args():
+    # ?period=day|week|month&date=YYYY-MM-DD (the bucket holding that day,
+    # today's by default), ?order=shows|trending and ?limit= of the
+    # analytics lists; returns the arguments as given and the criteria
+    filters = {}
+    for name in ('period', 'date', 'state', 'order', 'limit'):
+        value = request.args.get(name, '').strip()
+        if value:
+            filters[name] = value
+    period = filters.get('period', 'month')
+    if period not in analytics.PERIODS:
+        abort(400, 'period is one of %s' % ', '.join(analytics.PERIODS))
+    if filters.get('order', 'shows') not in ('shows', 'trending'):
+        abort(400, 'order is shows or trending')
+    day = parse_day(filters['date'], 'date').date() if 'date' in filters else datetime.utcnow().date()
+    limit = request.args.get('limit', current_app.config['ANALYTICS_TOP_N'], type=int)
+    criteria = {'period': period, 'start': analytics.bucket(day, period),
+                'limit': max(1, min(limit, current_app.config['LISTING_MAX_PAGE_SIZE'])),
+                'trending': filters.get('order') == 'trending'}
+    return filters, criteria
+
+
+def _cursor(value):
+    return None if value is None else str(value)
+
+
+def list_response(page, items):
+    # {"data": [...], "next_cursor": "..."}; ?stream=1 sends items while the
+    # page is still being fetched
+    if request.args.get('stream', type=int):
+        def generate():
+            yield b'{"data":['
+            for n, item in enumerate(items):
+                yield (b',' if n else b'') + dumps(item)
+            yield b'],"next_cursor":' + dumps(_cursor(page.next)) + b'}'
+        return stream_response(generate())
+    data = list(items)
+    return json_response({'data': data, 'next_cursor': _cursor(page.next)})
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+@api.route('/venues')
+@conditional(venues_version)
+def venues():
+    fields = requested_fields(VENUE_LIST_FIELDS)
+    page = venue_areas(after=cursor_arg(), limit=limit_arg(), genre=request.args.get('genre'), near=near_arg()).page
+    return list_response(page, (pick(row._asdict(), fields) for row in page))
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional(venue_version)
+def venue(venue_id):
+    fields = requested_fields(VENUE_FIELDS)
+    data = venue_detail(venue_id)
+    if data is None:
+        abort(404)
+    if any(field in SHOWS_FIELDS for field in fields):
+        data.update(venue_shows(venue_id, past_limit=request.args.get('past_limit', type=int),
+                                past_before=request.args.get('past_before')))
+    return json_response(pick(data, fields))
+
+
+@api.route('/artists')
+@conditional(artists_version)
+def artists():
+    fields = requested_fields(ARTIST_LIST_FIELDS)
+    page = artist_list(after=cursor_arg(), limit=limit_arg(), genre=request.args.get('genre'))
+    return list_response(page, (pick(item, fields) for item in page))
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional(artist_version)
+def artist(artist_id):
+    fields = requested_fields(ARTIST_FIELDS)
+    data = artist_detail(artist_id)
+    if data is None:
+        abort(404)
+    if any(field in SHOWS_FIELDS for field in fields):
+        data.update(artist_shows(artist_id, past_limit=request.args.get('past_limit', type=int),
+                                 past_before=request.args.get('past_before')))
+    return json_response(pick(data, fields))
+
+
+@api.route('/shows')
+@conditional(shows_version)
+def shows():
+    # ?from=&to=&city=&state=&genre=&near=&radius= as on /shows, in start
+    # time order
+    fields = requested_fields(SHOW_LIST_FIELDS)
+    page = show_list(after=show_cursor_arg(), limit=limit_arg(), **show_filters()[1])
+    return list_response(page, (pick(item, fields) for item in page))
+
+
+@api.route('/shows', methods=['POST'])
+def create_shows():
+    # {"shows": [{"artist_id": 1, "venue_id": 2, "start_time": "2030-05-01T20:00"}, ...}
+    # books every show or none: 201 {"created": n}, or 400/409 {"errors": [...]}
+    body = request.get_json(silent=True)
+    items = body.get('shows') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        abort(400, 'expected {"shows": [...]} with at least one show')
+    limit = current_app.config['BULK_SHOWS_MAX_ROWS']
+    if len(items) > limit:
+        abort(400, 'at most %d shows can be listed at once' % limit)
+    rows, errors = [], []
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            errors.append('row %d: expected an object' % number)
+            continue
+        row, error = booking.parse_row(number, item.get('artist_id'), item.get('venue_id'), item.get('start_time'))
+        if error:
+            errors.append(error)
+        else:
+            rows.append(row)
+    if errors:
+        return json_response({'errors': errors}, 400)
+    errors = booking.book(rows)
+    if errors:
+        return json_response({'errors': errors}, 409)
+    return json_response({'created': len(rows)}, 201)
+
+
+@api.route('/search/venues')
+def search_venues():
+    return _search(search.search_venues)
+
+
+@api.route('/search/artists')
+def search_artists():
+    return _search(search.search_artists)
+
+
+def _search(search_function):
+    # results are ranked, so the cursor is the next page number
+    fields = requested_fields(SEARCH_FIELDS)
+    page = cursor_arg() or 1
+    results = search_function(request.args.get('q', ''), page=page,
+                              per_page=current_app.config['SEARCH_PAGE_SIZE'])
+    return json_response({'data': [pick(item, fields) for item in results['data']],
+                          'count': results['count'],
+                          'next_cursor': _cursor(page + 1 if page < results['pages'] else None)})
+
+
+@api.route('/analytics/venues')
+@conditional(analytics.analytics_version)
+def analytics_venues():
+    return _analytics(analytics.top_venues, state=True)
+
+
+@api.route('/analytics/artists')
+@conditional(analytics.analytics_version)
+def analytics_artists():
+    return _analytics(analytics.top_artists)
+
+
+@api.route('/analytics/states')
+@conditional(analytics.analytics_version)
+def analytics_states():
+    return _analytics(analytics.top_states)
+
+
+@api.route('/analytics/genres')
+@conditional(analytics.analytics_version)
+def analytics_genres():
+    return _analytics(analytics.top_genres, state=True)
+
+
+@api.route('/analytics/genres/by-state')
+@conditional(analytics.analytics_version)
+def analytics_genres_by_state():
+    # the `limit` first genres of every state
+    return _analytics(analytics.genres_by_state)
+
+
+def _analytics(function, state=False):
+    # {"period": ..., "from": ..., "to": ..., "data": [...]}, read from the
+    # rollups only
+    criteria = analytics_args()[1]
+    if state:
+        criteria['state'] = request.args.get('state', '').strip() or None
+    end = analytics.bucket_end(criteria['start'], criteria['period'])
+    return json_response({'period': criteria['period'], 'from': criteria['start'], 'to': end - timedelta(days=1),
+                          'data': function(**criteria)})
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def error(error):
+    return json_response({'error': error.description}, error.code)
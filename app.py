@@ -3,8 +3,12 @@
 # ----------------------------------------------------------------------------#
 from models import *
 import sys
+import config
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 import dateutil.parser
-import babel
+from babel import Locale
+from babel.dates import parse_pattern
 from flask import (
     Flask,
     render_template,
@@ -12,13 +16,48 @@ from flask import (
     Response,
     flash,
     redirect,
-    url_for
+    url_for,
+    abort,
+    stream_with_context,
+    jsonify
 )
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from forms import ArtistForm, VenueForm, ShowForm
+from forms import ArtistForm, VenueForm, ShowForm, BulkShowForm
+from queries import (
+    venue_areas,
+    artist_list,
+    show_list,
+    venue_shows,
+    artist_shows,
+    venue_detail,
+    artist_detail,
+    recommended_artists,
+    recommended_venues,
+    venues_version,
+    artists_version,
+    shows_version,
+    venue_version,
+    artist_version,
+    Fetched,
+    Days
+)
+import search
+import aio
+from cache import Cache, conditional
+from database import on_primary
+from instrumentation import QueryStats
+from assets import Assets, assets_cli
+from bulk import import_cli, export_cli
+from summaries import summaries_cli
+import jobs
+import booking
+from geo import geo_cli
+from recommendations import recommendations_cli
+import analytics
+from seed import seed_command
+from api import api, show_filters, near_arg, analytics_args
 from flask_migrate import Migrate
 
 # ----------------------------------------------------------------------------#
@@ -27,9 +66,23 @@ from flask_migrate import Migrate
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.from_object(config.profile())
+db.init_app(app)
 migrate = Migrate(app, db)
+cache = Cache(app, models=(Venue, Artist, Show))
+query_stats = QueryStats(app)
+assets = Assets(app)
+job_queue = jobs.JobQueue(app)
+app.cli.add_command(import_cli)
+app.cli.add_command(export_cli)
+app.cli.add_command(summaries_cli)
+app.cli.add_command(seed_command)
+app.cli.add_command(assets_cli)
+app.cli.add_command(jobs.jobs_cli)
+app.cli.add_command(geo_cli)
+app.cli.add_command(recommendations_cli)
+app.cli.add_command(analytics.analytics_cli)
+app.register_blueprint(api)
 
 
 # TODO: connect to a local postgresql database
@@ -39,18 +92,124 @@ migrate = Migrate(app, db)
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+    'day': "EEEE MMMM d, y",
+}
+DATETIME_LOCALE = 'en'
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+    # Babel pattern and locale data, parsed once per (format, locale)
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, format, locale):
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=DATETIME_LOCALE):
+    # takes date/datetime objects as they come out of the queries; strings
+    # are still parsed for templates that pass them
+    if not isinstance(value, date):
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Listings.
+# ----------------------------------------------------------------------------#
+
+def page_args():
+    # keyset pagination arguments: ?after=<id>&limit=N
+    limit = request.args.get('limit', app.config['LISTING_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['LISTING_MAX_PAGE_SIZE']))
+    return request.args.get('after', type=int), limit
+
+
+def render_listing(template_name, **context):
+    # ?stream=1 sends the page while rows are still being fetched
+    if request.args.get('stream', type=int):
+        app.update_template_context(context)
+        template = app.jinja_env.get_template(template_name)
+        return Response(stream_with_context(template.generate(context)))
+    return render_template(template_name, **context)
+
+
+# ----------------------------------------------------------------------------#
+# Page contexts.
+# ----------------------------------------------------------------------------#
+
+# The views and their /async copies build their pages from these, so the two
+# cannot drift apart. A listing context reads its arguments from the request
+# and passes its rows through `fetch`: the async views give Fetched, so the
+# rows are read on the query thread rather than while rendering.
+
+def _fetch_lazily(rows):
+    return rows
+
+
+def venues_page(fetch=_fetch_lazily):
+    # ?genre=, and ?near=lat,lon&radius=km for the venues around a point
+    after, limit = page_args()
+    genre = request.args.get('genre')
+    filters = dict((name, request.args[name]) for name in ('genre', 'near', 'radius') if request.args.get(name))
+    return dict(areas=fetch(venue_areas(after=after, limit=limit, genre=genre, near=near_arg())),
+                limit=limit, filters=filters)
+
+
+def artists_page(fetch=_fetch_lazily):
+    after, limit = page_args()
+    genre = request.args.get('genre')
+    return dict(artists=fetch(artist_list(after=after, limit=limit, genre=genre)), limit=limit, genre=genre)
+
+
+def shows_page(fetch=_fetch_lazily):
+    limit = page_args()[1]
+    filters, criteria = show_filters()
+    return dict(shows=fetch(show_list(after=request.args.get('after'), limit=limit, **criteria)),
+                limit=limit, filters=filters)
+
+
+def search_page(search_function):
+    search_term = request.values.get("search_term", "")
+    results = search_function(search_term, page=request.values.get("page", 1, type=int),
+                              per_page=app.config['SEARCH_PAGE_SIZE'])
+    return dict(results=results, search_term=search_term)
+
+
+def detail_queries(shows, recommended, entity_id, split=False):
+    # the show and recommendation queries of a venue/artist page, to run
+    # after its detail query. split=True fetches the upcoming and past shows
+    # separately so the async views can run them side by side.
+    past_limit = request.args.get('past_limit', type=int)
+    past_before = request.args.get('past_before')
+    if split:
+        now = datetime.utcnow()
+        queries = [lambda: shows(entity_id, now=now, past=False),
+                   lambda: shows(entity_id, now=now, past_limit=past_limit, past_before=past_before, upcoming=False)]
+    else:
+        queries = [lambda: shows(entity_id, past_limit=past_limit, past_before=past_before)]
+    return queries + [lambda: recommended(entity_id)]
+
+
+def detail_page(data, results, recommended_key):
+    # the detail dict with the results of detail_queries() added
+    if data is None:
+        abort(404)
+    for shows in results[:-1]:
+        data.update(shows)
+    data[recommended_key] = results[-1]
+    return data
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -64,75 +223,27 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@conditional(venues_version)
+@cache.cached_page()
 def venues():
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-    record = []
-    try:
-        venues = Venue.query.distinct(Venue.city, Venue.state).all()
-        if venues:
-            for venue in venues:
-                upcoming_shows = len(Venue.query.join(Shows)
-                                     .filter(Shows.c.start_time > datetime.utcnow(),
-                                             Shows.c.venue_id == venue.id).all())
-                data = []
-                for i in Venue.query.filter_by(city=venue.city, state=venue.state).all():
-                    data.append({"id": i.id, "name": i.name, "num_upcoming_shows": upcoming_shows})
-                record.append({"city": venue.city, "state": venue.state, "venues": data})
-    except Exception as e:
-        print(e)
-    return render_template("pages/venues.html", areas=record)
+    return render_listing("pages/venues.html", **venues_page())
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-    # seach for Hop should return "The Musical Hop".
-    # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    search_term = request.form.get("search_term", "")
-    search_response = Venue.query.filter(Venue.name.ilike(f"%{search_term}%")).all()
-    records = []
-    for venue in search_response:
-        records.append({"id": venue.id, "name": venue.name,
-                        "num_upcoming_shows": len(Venue.query.join(Shows).filter(Shows.c.start_time > datetime.utcnow(),
-                                                                                 Shows.c.venue_id == venue.id).all())
-                        })
-    response = {"count": len(search_response), "data": records}
-    return render_template("pages/search_venues.html", results=response,
-                           search_term=request.form.get("search_term", ""))
+    return render_template("pages/search_venues.html", **search_page(search.search_venues))
 
 
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_version)
+@cache.cached_page()
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    # TODO: replace with real venue data from the venues table, using venue_id
-    try:
-        venue_f = Venue.query.filter_by(id=venue_id).first()
-        #list_shows = db.session.query(Shows).filter(Shows.c.venue_id == venue_f.id).all()
-        #print(venue_f, list_shows)
-        records = {}
-        list_shows = db.session.query(Shows).join(Venue).filter(Shows.c.venue_id==venue_f.id)
-        artist_up_show = []
-        artist_past_show = []
-        for show in list_shows:
-            artist = Artist.query.filter_by(id=show.artist_id).first()
-            start_time = format_datetime(str(show.start_time))
-            artist_show = {"artist_id": artist.id, "artist_name": artist.name, "artist_image_link": artist.image_link,
-                           "start_time": start_time}
-            if show.start_time >= datetime.utcnow():
-                artist_up_show.append(artist_show)
-            elif show.start_time < datetime.utcnow():
-                artist_past_show.append(artist_show)
-        records = {"id": venue_f.id, "name": venue_f.name, "genres": venue_f.genres, "address": venue_f.address,
-                   "city": venue_f.city, "state": venue_f.state, "phone": venue_f.phone,
-                   "website": venue_f.website_link,
-                   "facebook_link": venue_f.facebook_link, "seeking_talent": venue_f.seeking_talent,
-                   "seeking_description": venue_f.seeking_description, "image_link": venue_f.image_link,
-                   "upcoming_shows": artist_up_show, "upcoming_shows_count": len(artist_up_show),
-                   "past_shows": artist_past_show, "past_shows_count": len(artist_past_show)}
-    except Exception as e:
-        sys.exit(e)
-    return render_template("pages/show_venue.html", venue=records)
+    records = venue_detail(venue_id)
+    if records is None:
+        abort(404)
+    results = [query() for query in detail_queries(venue_shows, recommended_artists, venue_id)]
+    return render_template("pages/show_venue.html", venue=detail_page(records, results, "recommended_artists"))
 
 
 #  Create Venue
@@ -186,6 +297,7 @@ def create_venue_submission():
 
 
 @app.route('/venues/<venue_id>/delete', methods=['POST', 'GET', 'DELETE'])
+@on_primary
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
@@ -205,94 +317,27 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists', methods=['GET'])
+@conditional(artists_version)
+@cache.cached_page()
 def artists():
-    # TODO: replace with real data returned from querying the database
-    all_artist = []
-    try:
-        all_artist = Artist.query.all()
-    except Exception as e:
-        db.session.rollback()
-        db.session.close()
-    data = []
-    if all_artist:
-        for artist in all_artist:
-            data.append({"id": artist.id, "name": artist.name})
-    return render_template("pages/artists.html", artists=all_artist)
+    return render_listing("pages/artists.html", **artists_page())
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-    # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-    # search for "band" should return "The Wild Sax Band".
-    search_term = request.form.get("search_term", "")
-    search_response = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
-    data = []
-    for artist in search_response:
-        data.append({
-            "id": artist.id,
-            "name": artist.name,
-            "num_upcoming_shows": len(Artist.query.join(Shows).
-                                      filter(Shows.c.start_time > datetime.now(), Shows.c.artist_id == artist.id).all())
-        })
-
-    response = {
-        "count": len(search_response),
-        "data": data
-    }
-    return render_template("pages/search_artists.html", results=response,
-                           search_term=request.form.get("search_term", ""))
+    return render_template("pages/search_artists.html", **search_page(search.search_artists))
 
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_version)
+@cache.cached_page()
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
-    # TODO: replace with real artist data from the artist table, using artist_id
-    # shows = db.session.query(Shows).filter(Shows.c.artist_id == artist_id).all()
-    shows = db.session.query(Shows).join(Artist).filter(Shows.c.artist_id == artist_id)
-    # list_shows = db.session.query(Shows).join(Venue).filter(Shows.c.venue_id == venue_f.id)
-    venue_past_shows = []
-    venue_up_shows = []
-    artist = Artist.query.filter_by(id=artist_id).first()
-    data = None
-
-    for show in shows:
-        venue = Venue.query.filter_by(id=show.venue_id).first()
-        start_time = format_datetime(str(show.start_time))
-
-        venue_show = {
-            "venue_id": venue.id,
-            "venue_name": venue.name,
-            "venue_image_link": venue.image_link,
-            "start_time": str(start_time)
-        }
-        if show.start_time >= datetime.utcnow():
-            venue_up_shows.append(venue_show)
-        elif show.start_time < datetime.utcnow():
-            venue_past_shows.append(venue_show)
-
-    data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": artist.genres,
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "facebook_link": artist.facebook_link,
-        "website": artist.website_link,
-        "image_link": artist.image_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "upcoming_shows_count": len(venue_up_shows),
-        "upcoming_shows": venue_up_shows,
-        "past_shows": venue_past_shows,
-        "past_shows_count": len(venue_past_shows),
-
-    }
-    data['genres'] = list(data.get('genres'))
-    data['genres'].remove('{')
-    data['genres'].remove('}')
-    return render_template("pages/show_artist.html", artist=data)
+    data = artist_detail(artist_id)
+    if data is None:
+        abort(404)
+    results = [query() for query in detail_queries(artist_shows, recommended_venues, artist_id)]
+    return render_template("pages/show_artist.html", artist=detail_page(data, results, "recommended_venues"))
 
 
 #  Update
@@ -303,7 +348,7 @@ def edit_artist(artist_id):
     artist = Artist.query.filter_by(id=artist_id).first()
 
     form.name.data = artist.name
-    form.genres.data = artist.genres
+    form.genres.data = list(artist.genres)
     form.city.data = artist.city
     form.state.data = artist.state
     form.phone.data = artist.phone
@@ -336,9 +381,9 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
-    venue = Venue.query.get(id=venue_id)
+    venue = Venue.query.get(venue_id)
     form.name.data = venue.name
-    form.genres.data = venue.genres
+    form.genres.data = list(venue.genres)
     form.city.data = venue.city
     form.state.data = venue.state
     form.address.data = venue.address
@@ -354,7 +399,7 @@ def edit_venue_submission(venue_id):
     # TODO: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
     form = VenueForm()
-    venue = Venue.query.get(id=venue_id)
+    venue = Venue.query.get(venue_id)
 
     venue.name = form.name.data
     venue.genres = form.genres.data
@@ -421,30 +466,48 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_version)
+@cache.cached_page()
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-    all_shows = []
-    try:
-        venues_all = Venue.query.join(Artist, Venue.state == Artist.state).all()
-        data = db.session.query(Shows).all()
-        for show in data:
-            artist = Artist.query.filter_by(id=show.artist_id).first()
-            venue = Venue.query.filter_by(id=show.venue_id).first()
-            all_shows.append({
-                "venue_id": show.id,
-                "venue_name": venue.name,
-                "artist_id": artist.id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": show.start_time
-            })
-    except Exception as e:
-        print(e)
-        pass
-
-    return render_template("pages/shows.html", shows=all_shows)
+    # displays list of shows at /shows, in start time order
+    return render_listing("pages/shows.html", **shows_page())
+
+
+def calendar_version():
+    # without ?from= the calendar starts today, so the day is a validator too
+    last_modified, token = shows_version()
+    return last_modified, token + (datetime.utcnow().date(),)
+
+
+@app.route('/shows/calendar')
+@conditional(calendar_version)
+@cache.cached_page()
+def shows_calendar():
+    # what's on, grouped by day; starts today unless ?from= is given
+    limit = page_args()[1]
+    filters, criteria = show_filters()
+    criteria.setdefault('start', datetime.combine(datetime.utcnow().date(), datetime.min.time()))
+    days = Days(show_list(after=request.args.get('after'), limit=limit, **criteria))
+    return render_listing("pages/calendar.html", days=days, limit=limit, filters=filters)
+
+
+@app.route('/analytics')
+@conditional(analytics.analytics_version)
+def analytics_dashboard():
+    # busiest and trending venues, artists, states and genres of a day, week
+    # or month (this month by default), from the rollup tables
+    filters, criteria = analytics_args()
+    state = request.args.get('state', '').strip() or None
+    period, start = criteria['period'], criteria['start']
+    end = analytics.bucket_end(start, period)
+    return render_template('pages/analytics.html', filters=filters, period=period, start=start,
+                           end=end - timedelta(days=1), before=analytics.bucket_before(start, period), after=end,
+                           venues=analytics.top_venues(state=state, **criteria),
+                           artists=analytics.top_artists(**criteria),
+                           trending_artists=analytics.top_artists(**dict(criteria, trending=True)),
+                           states=analytics.top_states(**criteria),
+                           genres=analytics.top_genres(state=state, **criteria),
+                           genres_by_state=analytics.genres_by_state(**dict(criteria, limit=3)))
 
 
 @app.route('/shows/create')
@@ -456,31 +519,114 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
-    # TODO: insert form data as a new Show record in the db, instead
-
-    # on successful db insert, flash success
+    # the artist and venue must exist and be free at that time (booking.py)
     show_form = ShowForm()
-    artist_id = show_form.artist_id.data
-    venue_id = show_form.venue_id.data
-    start_time = show_form.start_time.data
-
-    show = Shows.insert().values(artist_id=artist_id,
-                                 venue_id=venue_id, start_time=start_time)
-    try:
-        db.session.execute(show)
-        db.session.commit()
+    row, error = booking.parse_row(1, (show_form.artist_id.data or '').strip(),
+                                   (show_form.venue_id.data or '').strip(), show_form.start_time.data)
+    errors = [error] if error else booking.book([row])
+    if errors:
+        flash("An error occurred. Show could not be listed: " + "; ".join(
+            error.split(': ', 1)[1] for error in errors))
+    else:
         flash("Show was successfully listed!")
-    except Exception as e:
-        flash("An error occurred. Show could not be listed.")
-        db.session.rollback()
-        db.session.flush()
-        print(e)
-        # TODO: on unsuccessful db insert, flash an error instead.
-        # e.g., flash('An error occurred. Show could not be listed.')
-        # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     return render_template("pages/home.html")
 
 
+@app.route('/shows/bulk', methods=['GET', 'POST'])
+def create_shows_bulk():
+    # a whole tour in one submission: every show is listed, or none is
+    form = BulkShowForm()
+    errors = []
+    if form.validate_on_submit():
+        rows, errors = booking.parse_lines(form.shows.data)
+        limit = app.config['BULK_SHOWS_MAX_ROWS']
+        if not errors and not rows:
+            errors = ['list at least one show']
+        elif not errors and len(rows) > limit:
+            errors = ['at most %d shows can be listed at once' % limit]
+        if not errors:
+            errors = booking.book(rows)
+            if not errors:
+                flash("%d shows were successfully listed!" % len(rows))
+                return render_template("pages/home.html")
+    elif request.method == 'POST':
+        errors = ['list at least one show']
+    return render_template('forms/new_shows.html', form=form, errors=errors)
+
+
+#  Async read path
+#  ----------------------------------------------------------------
+#  The same pages under /async, from the same page contexts: queries run on
+#  worker threads (see aio.py) and the independent ones run concurrently.
+
+@app.route('/async/venues')
+async def venues_async():
+    return render_template("pages/venues.html", **(await aio.run(lambda: venues_page(Fetched))))
+
+
+@app.route('/async/venues/search', methods=['GET', 'POST'])
+async def search_venues_async():
+    return render_template("pages/search_venues.html", **(await aio.run(lambda: search_page(search.search_venues))))
+
+
+@app.route('/async/venues/<int:venue_id>')
+async def show_venue_async(venue_id):
+    queries = detail_queries(venue_shows, recommended_artists, venue_id, split=True)
+    records, *results = await aio.gather(lambda: venue_detail(venue_id), *queries)
+    return render_template("pages/show_venue.html", venue=detail_page(records, results, "recommended_artists"))
+
+
+@app.route('/async/artists')
+async def artists_async():
+    return render_template("pages/artists.html", **(await aio.run(lambda: artists_page(Fetched))))
+
+
+@app.route('/async/artists/search', methods=['GET', 'POST'])
+async def search_artists_async():
+    return render_template("pages/search_artists.html",
+                           **(await aio.run(lambda: search_page(search.search_artists))))
+
+
+@app.route('/async/artists/<int:artist_id>')
+async def show_artist_async(artist_id):
+    queries = detail_queries(artist_shows, recommended_venues, artist_id, split=True)
+    data, *results = await aio.gather(lambda: artist_detail(artist_id), *queries)
+    return render_template("pages/show_artist.html", artist=detail_page(data, results, "recommended_venues"))
+
+
+@app.route('/async/shows')
+async def shows_async():
+    return render_template("pages/shows.html", **(await aio.run(lambda: shows_page(Fetched))))
+
+
+#  Monitoring
+#  ----------------------------------------------------------------
+
+def internal():
+    # the /_stats/ endpoints are not for the public
+    if not (app.debug or app.config['STATS_ENDPOINTS']):
+        abort(404)
+
+
+@app.route('/_stats/cache')
+def cache_stats():
+    internal()
+    return jsonify(cache.stats())
+
+
+@app.route('/_stats/jobs')
+def job_stats():
+    internal()
+    return jsonify(jobs.stats())
+
+
+@app.route('/_stats/queries')
+def query_patterns():
+    # statements repeated within a single request (likely N+1 queries)
+    internal()
+    return jsonify(query_stats.n_plus_one())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -500,6 +646,16 @@ if not app.debug:
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
+    # one JSON line per request: query count, database time, slowest statements
+    query_handler = FileHandler('queries.log')
+    query_handler.setFormatter(Formatter('%(message)s'))
+    query_stats.logger.setLevel(logging.INFO)
+    query_stats.logger.addHandler(query_handler)
+    # one JSON line per job run: status, attempt, queue wait and run time
+    job_handler = FileHandler('jobs.log')
+    job_handler.setFormatter(Formatter('%(message)s'))
+    jobs.logger.setLevel(logging.INFO)
+    jobs.logger.addHandler(job_handler)
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -507,7 +663,7 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run()
 
 # Or specify port manually:
 '''
@@ -0,0 +1,240 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+# ----------------------------------------------------------------------------#
+# Bundles.
+# ----------------------------------------------------------------------------#
+
+# Files of each bundle in load order, relative to static/. The layout loads
+# one bundle per type; `flask assets build` writes them, minified and named
+# after their content, to static/dist/ with .gz/.br siblings. Until a build
+# exists the layout links the files one by one.
+BUNDLES = {
+    'app.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'app.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+# copied under a fingerprinted name so static_url() can link them
+FINGERPRINTED = ('img',)
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSED_TYPES = ('.css', '.js', '.svg')
+MIN_COMPRESS_SIZE = 1024
+ONE_YEAR = 365 * 24 * 3600
+
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.MULTILINE)
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.DOTALL)
+CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # comments (but /*! licenses) and whitespace only
+    text = CSS_COMMENT.sub('', text)
+    text = re.sub(r'\s+', ' ', text)
+    return CSS_SPACE.sub(r'\1', text).strip()
+
+
+def minify_js(text):
+    text = SOURCE_MAP.sub('', text)
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    return text.strip()
+
+
+def _read(static_folder, filename):
+    with open(os.path.join(static_folder, filename), encoding='utf-8') as source:
+        return source.read()
+
+
+def bundle(static_folder, name):
+    files = BUNDLES[name]
+    if name.endswith('.css'):
+        return '\n'.join(minify_css(_read(static_folder, filename)) for filename in files)
+    # `;` keeps a file that ends without one from running into the next
+    return ';\n'.join(minify_js(_read(static_folder, filename)) for filename in files)
+
+
+def fingerprint(filename, data):
+    root, ext = os.path.splitext(filename)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as output:
+        output.write(data)
+
+
+def _compress(path, data):
+    # mtime=0 keeps the .gz byte for byte the same between builds
+    _write(path + '.gz', gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+
+
+def build(static_folder):
+    # writes the bundles and fingerprinted copies to static/dist/, removes
+    # the files of earlier builds and returns the manifest
+    dist = os.path.join(static_folder, DIST)
+    manifest = {}
+    outputs = []
+    for name in BUNDLES:
+        data = bundle(static_folder, name).encode('utf-8')
+        manifest[name] = fingerprint(name, data)
+        outputs.append((manifest[name], data))
+    for directory in FINGERPRINTED:
+        for root, dirs, files in os.walk(os.path.join(static_folder, directory)):
+            for filename in sorted(files):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as source:
+                    data = source.read()
+                manifest[name] = fingerprint(name, data)
+                outputs.append((manifest[name], data))
+    written = set()
+    for name, data in outputs:
+        path = os.path.join(dist, name)
+        _write(path, data)
+        written.add(path)
+        if name.endswith(COMPRESSED_TYPES) and len(data) >= MIN_COMPRESS_SIZE:
+            _compress(path, data)
+            written.update((path + '.gz', path + '.br'))
+    manifest_path = os.path.join(dist, MANIFEST)
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    written.add(manifest_path)
+    for root, dirs, files in os.walk(dist):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if path not in written:
+                os.remove(path)
+    return manifest
+
+
+# ----------------------------------------------------------------------------#
+# Flask integration.
+# ----------------------------------------------------------------------------#
+
+class Assets(object):
+    # static_url() links the fingerprinted copy of a file once `flask assets
+    # build` has run, asset_urls() a bundle (or its files before a build),
+    # and the static route serves fingerprinted files precompressed with
+    # far-future, immutable cache headers.
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.load()
+        app.view_functions['static'] = self.send_static_file
+        app.jinja_env.globals.update(static_url=self.static_url, asset_urls=self.asset_urls)
+        app.extensions['assets'] = self
+
+    def load(self):
+        path = os.path.join(self.app.static_folder, DIST, MANIFEST)
+        try:
+            with open(path) as manifest:
+                self.manifest = json.load(manifest)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def static_url(self, filename, **values):
+        # url_for('static', filename=...) with the fingerprinted name
+        built = self.manifest.get(filename)
+        if built is not None:
+            filename = DIST + '/' + built
+        return url_for('static', filename=filename, **values)
+
+    def asset_urls(self, name):
+        if name in self.manifest:
+            return [self.static_url(name)]
+        return [url_for('static', filename=filename) for filename in BUNDLES[name]]
+
+    def send_static_file(self, filename):
+        if not filename.startswith(DIST + '/'):
+            return self.app.send_static_file(filename)
+        folder = self.app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.isfile(os.path.join(folder, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(folder, filename, mimetype=mimetype, max_age=ONE_YEAR)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build the static asset bundles.')
+
+
+@assets_cli.command('build', help='Bundle, minify and fingerprint the static assets into static/dist/.')
+def build_command():
+    manifest = build(current_app.static_folder)
+    current_app.extensions['assets'].load()
+    for name in sorted(manifest):
+        path = os.path.join(current_app.static_folder, DIST, manifest[name])
+        sizes = ['%d' % os.path.getsize(path)]
+        for suffix in ('.gz', '.br'):
+            if os.path.exists(path + suffix):
+                sizes.append('%s %d' % (suffix[1:], os.path.getsize(path + suffix)))
+        click.echo('%s -> %s/%s (%s bytes)' % (name, DIST, manifest[name], ', '.join(sizes)))
+
+
+@assets_cli.command('clean', help='Remove static/dist/; pages link the files one by one again.')
+def clean_command():
+    shutil.rmtree(os.path.join(current_app.static_folder, DIST), ignore_errors=True)
+    current_app.extensions['assets'].load()
+    click.echo('removed %s' % os.path.join(current_app.static_folder, DIST))
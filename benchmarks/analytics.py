@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------------#
+# Analytics benchmark.
+#
+# Seeds a database with `flask seed`'s generator (a million shows by
+# default), times the rollup rebuild and an incremental refresh, and then
+# requests /analytics and the /api/v1/analytics/ endpoints for the current
+# day, week and month and for a month of history. For comparison it also
+# times "top venues" as a GROUP BY over Shows. Exits 1 when a p95 is over
+# --budget milliseconds.
+#
+#   python benchmarks/analytics.py --database-url sqlite:////tmp/analytics.db
+#   python benchmarks/analytics.py --database-url postgresql://localhost/fyyur_bench --shows 3000000
+#   python benchmarks/analytics.py --database-url ... --no-seed
+# ----------------------------------------------------------------------------#
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+import analytics  # noqa: E402
+import seed  # noqa: E402
+
+ENDPOINTS = (
+    "/analytics",
+    "/api/v1/analytics/venues",
+    "/api/v1/analytics/venues?state=CA",
+    "/api/v1/analytics/artists",
+    "/api/v1/analytics/artists?order=trending",
+    "/api/v1/analytics/states",
+    "/api/v1/analytics/genres",
+    "/api/v1/analytics/genres/by-state",
+)
+# (name, period, days back)
+BUCKETS = (("today", "day", 0), ("this week", "week", 0), ("this month", "month", 0), ("a year ago", "month", 365))
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    return sorted_values[max(0, int(math.ceil(p / 100.0 * len(sorted_values))) - 1)]
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return percentile(timings, 50), percentile(timings, 95)
+
+
+def raw_top_venues(start, end):
+    # the same list counted from Shows, as it would be without the rollups
+    shows = Show.__table__
+    count = db.func.count()
+    query = (db.select([shows.c.venue_id, count])
+             .where(db.and_(shows.c.start_time >= start, shows.c.start_time < end))
+             .group_by(shows.c.venue_id).order_by(count.desc()).limit(10))
+    return db.session.execute(query).fetchall()
+
+
+def refresh_after_booking(count, rng):
+    # books `count` shows over the last month and recounts their days
+    venues = db.session.query(db.func.max(Venue.id)).scalar()
+    artists = db.session.query(db.func.max(Artist.id)).scalar()
+    now = datetime.utcnow()
+    rows = [{"venue_id": rng.randint(1, venues), "artist_id": rng.randint(1, artists),
+             "start_time": now - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1440)), "updated_at": now}
+            for _ in range(count)]
+    db.session.execute(Show.__table__.insert(), rows)
+    started = time.perf_counter()
+    connection = db.session.connection()
+    days = analytics.refresh(connection, analytics.stale_days(connection, now)[0])
+    db.session.commit()
+    return days, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # the database is dropped and re-seeded: never point this at real data
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--no-seed", action="store_true", help="measure the data already there")
+    parser.add_argument("--venues", type=int, default=20000)
+    parser.add_argument("--artists", type=int, default=50000)
+    parser.add_argument("--shows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=730, help="days of history the shows are spread over")
+    parser.add_argument("--requests", type=int, default=30, help="requests per endpoint and range")
+    parser.add_argument("--budget", type=float, default=100.0, help="p95 budget in milliseconds")
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    app.extensions["cache"].backend = None
+    app.jinja_env.fragment_cache = None
+    with app.app_context():
+        if not args.no_seed:
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            seed.seed(args.venues, args.artists, args.shows, days=args.days)
+            print("seeded %d shows in %.1fs" % (args.shows, time.perf_counter() - started))
+            if db.engine.dialect.name == "postgresql":
+                db.session.execute("ANALYZE")
+                db.session.commit()
+        started = time.perf_counter()
+        days = analytics.rebuild(db.session.connection())
+        db.session.commit()
+        print("rebuild: %d days in %.1fs" % (days, time.perf_counter() - started))
+        days, elapsed = refresh_after_booking(1000, random.Random(0))
+        print("refresh after booking 1000 shows: %d days in %.0fms" % (days, elapsed))
+        db.session.remove()
+
+    client = app.test_client()
+    today = datetime.utcnow().date()
+    over = []
+    print("\n%-48s %-12s %9s %9s" % ("endpoint", "bucket", "p50 ms", "p95 ms"))
+    for name, period, back in BUCKETS:
+        day = today - timedelta(days=back)
+        for endpoint in ENDPOINTS:
+            path = "%s%speriod=%s&date=%s" % (endpoint, "&" if "?" in endpoint else "?", period, day)
+            status = client.get(path).status_code
+            if status != 200:
+                print("%s: %d" % (path, status))
+                over.append(path)
+                continue
+            p50, p95 = timed(lambda: client.get(path).get_data(), args.requests)
+            print("%-48s %-12s %9.2f %9.2f" % (endpoint, name, p50, p95))
+            if p95 > args.budget:
+                over.append(path)
+        with app.app_context():
+            start = analytics.bucket(day, period)
+            start_time = datetime.combine(start, datetime.min.time())
+            end_time = datetime.combine(analytics.bucket_end(start, period), datetime.min.time())
+            p50, p95 = timed(lambda: raw_top_venues(start_time, end_time), min(args.requests, 5))
+            print("%-48s %-12s %9.2f %9.2f" % ("(GROUP BY over Shows: top venues)", name, p50, p95))
+    if over:
+        print("\nover %.0fms at p95: %s" % (args.budget, ", ".join(over)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
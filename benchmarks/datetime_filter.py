@@ -0,0 +1,80 @@
+# ----------------------------------------------------------------------------#
+# datetime filter benchmark.
+#
+# Formats the start times of a page of shows with the previous filter
+# (str() -> dateutil parse -> babel.dates.format_datetime) and with the
+# current one (datetime in, precompiled pattern, memoized output).
+#
+#   python benchmarks/datetime_filter.py
+#   python benchmarks/datetime_filter.py --shows 500 --distinct 50 --repeat 20
+# ----------------------------------------------------------------------------#
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+from app import format_datetime, _format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def start_times(shows, distinct):
+    # pages repeat start times (weekly slots, festivals), `distinct` of them
+    rng = random.Random(0)
+    base = datetime(2030, 1, 1, 20, 0)
+    slots = [base + timedelta(days=rng.randint(0, 365), minutes=30 * rng.randint(0, 8))
+             for _ in range(distinct)]
+    return [rng.choice(slots) for _ in range(shows)]
+
+
+def measure(name, render, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - started)
+    median = statistics.median(timings)
+    print("%-28s median=%8.2fms" % (name, median * 1000))
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shows", type=int, default=300)
+    parser.add_argument("--distinct", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    values = start_times(args.shows, args.distinct)
+    for value in values:
+        assert format_datetime(value, 'full') == legacy_format_datetime(str(value), 'full')
+
+    before = measure("before (str + parse)",
+                     lambda: [legacy_format_datetime(str(value), 'full') for value in values], args.repeat)
+
+    def cold():
+        _format_datetime.cache_clear()
+        return [format_datetime(value, 'full') for value in values]
+
+    after = measure("after, cold memo", cold, args.repeat)
+    warm = measure("after, warm memo",
+                   lambda: [format_datetime(value, 'full') for value in values], args.repeat)
+    print("speedup: %.1fx cold, %.1fx warm" % (before / after, before / warm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------#
+# Sync vs async views load test.
+#
+# Hits each page and its /async twin with concurrent clients for a fixed time
+# and reports throughput and latency percentiles. Run it against a server
+# started the way production runs it, e.g.
+#
+#   gunicorn -w 4 -b 127.0.0.1:8000 app:app
+#   python benchmarks/load_test.py --base-url http://127.0.0.1:8000
+#   python benchmarks/load_test.py --base-url ... --path /venues/1 --concurrency 64 --duration 30
+#
+# The page cache and conditional requests only wrap the sync views: start the
+# server with CACHE_BACKEND=None in its profile to compare the database paths.
+# ----------------------------------------------------------------------------#
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_PATHS = ["/venues", "/artists", "/shows", "/venues/1", "/artists/1",
+                 "/venues/search?search_term=the"]
+
+
+def worker(url, deadline, timings, errors, lock):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings.append(elapsed)
+        except (urllib.error.URLError, OSError):
+            with lock:
+                errors.append(url)
+
+
+def run(url, concurrency, duration):
+    timings, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url, deadline, timings, errors, lock))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+def report(name, timings, errors, duration):
+    if not timings:
+        print("%-44s no successful requests (%d errors)" % (name, len(errors)))
+        return
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print("%-44s %8.1f req/s  p50=%7.1fms  p95=%7.1fms  errors=%d" % (
+        name, len(timings) / duration, statistics.median(timings) * 1000, p95 * 1000, len(errors)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="page to test, repeatable (default: listings, detail pages, search)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    for path in args.paths or DEFAULT_PATHS:
+        for name in (path, "/async" + path):
+            timings, errors = run(base_url + name, args.concurrency, args.duration)
+            report(name, timings, errors, args.duration)
+
+
+if __name__ == "__main__":
+    main()
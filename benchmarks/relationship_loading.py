@@ -0,0 +1,86 @@
+# ----------------------------------------------------------------------------#
+# Relationship loading benchmark.
+#
+# Compares the rows fetched and the latency of the plain catalogue queries
+# (Artist.query.all(), Venue.query.filter_by(...)) under the old
+# lazy='joined' many-to-many relationships and the current opt-in loading.
+#
+#   python benchmarks/relationship_loading.py --database-url postgresql://localhost/fyyur_bench
+#   python benchmarks/relationship_loading.py --database-url ... --venues 1000 --shows 100000
+# ----------------------------------------------------------------------------#
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from sqlalchemy.orm import joinedload  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+
+CHUNK = 10000
+
+
+def seed(venues, artists, shows):
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+    db.session.execute(Venue.__table__.insert(),
+                       [{"id": i, "name": "Venue %d" % i, "city": "City %d" % (i % 200),
+                         "state": "ST%d" % (i % 50)} for i in range(1, venues + 1)])
+    db.session.execute(Artist.__table__.insert(),
+                       [{"id": i, "name": "Artist %d" % i, "city": "City %d" % (i % 200),
+                         "state": "ST%d" % (i % 50)} for i in range(1, artists + 1)])
+    rng = random.Random(0)
+    for start in range(0, shows, CHUNK):
+        db.session.execute(Show.__table__.insert(),
+                           [{"venue_id": rng.randint(1, venues), "artist_id": rng.randint(1, artists),
+                             "start_time": now + timedelta(hours=rng.randint(-24 * 365 * 3, 24 * 365))}
+                            for _ in range(start, min(start + CHUNK, shows))])
+    db.session.commit()
+
+
+def measure(name, build, repeat):
+    statement = build().statement
+    rows = len(db.session.execute(statement).fetchall())
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        objects = len(build().all())
+        timings.append(time.perf_counter() - started)
+    print("%-36s rows=%-9d objects=%-7d median=%8.1fms" % (
+        name, rows, objects, statistics.median(timings) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # the database is dropped and re-seeded: never point this at real data
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--venues", type=int, default=10000)
+    parser.add_argument("--artists", type=int, default=50000)
+    parser.add_argument("--shows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.venues, args.artists, args.shows)
+        venue_id = args.venues // 2
+        # lazy='joined' is what every query used to do implicitly
+        measure("artists, lazy='joined' (before)",
+                lambda: Artist.query.options(joinedload(Artist.venues)), args.repeat)
+        measure("artists, opt-in (now)", lambda: Artist.query, args.repeat)
+        measure("one venue, lazy='joined' (before)",
+                lambda: Venue.query.filter_by(id=venue_id).options(joinedload(Venue.artists)), args.repeat)
+        measure("one venue, opt-in (now)", lambda: Venue.query.filter_by(id=venue_id), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
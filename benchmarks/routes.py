@@ -0,0 +1,271 @@
+# ----------------------------------------------------------------------------#
+# Route benchmark.
+#
+# Requests every GET page and API endpoint of app.py a fixed number of times
+# and reports p50/p95/p99 latency, queries per request (from the
+# Server-Timing header) and RSS. Results are written as JSON so two commits
+# can be compared on the same seeded database:
+#
+#   FYYUR_ENV=testing flask seed --reset --venues 2000 --artists 10000 --shows 200000
+#   python benchmarks/routes.py --output before.json
+#   git checkout my-branch
+#   python benchmarks/routes.py --output after.json --compare before.json
+#
+# By default the Flask test client runs the app in this process. Pass
+# --base-url to measure a server started the way production runs it
+# (gunicorn -w 4 -b 127.0.0.1:8000 app:app), and --server-pid to read its
+# RSS. The venue/artist pages use the venue and artist with the most shows.
+# ----------------------------------------------------------------------------#
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show, venue_show_summary, artist_show_summary  # noqa: E402
+
+# query strings for the pages that do nothing useful without one
+QUERY_STRINGS = {
+    "/venues/search": "search_term=the",
+    "/artists/search": "search_term=band",
+    "/async/venues/search": "search_term=the",
+    "/async/artists/search": "search_term=band",
+    "/api/v1/search/venues": "q=the",
+    "/api/v1/search/artists": "q=band",
+}
+# never requested: they change data or only exist for debugging
+SKIP = re.compile(r"/delete$|^/static/|^/_stats/")
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+# ----------------------------------------------------------------------------#
+# Routes.
+# ----------------------------------------------------------------------------#
+
+def busiest(summary, key):
+    total = summary.c.upcoming_shows + summary.c.past_shows
+    return db.session.execute(db.select([summary.c[key]]).order_by(total.desc()).limit(1)).scalar()
+
+
+def sample_ids():
+    return {
+        "venue_id": busiest(venue_show_summary, "venue_id") or db.session.query(db.func.min(Venue.id)).scalar(),
+        "artist_id": busiest(artist_show_summary, "artist_id") or db.session.query(db.func.min(Artist.id)).scalar(),
+    }
+
+
+def routes(ids, only):
+    # (name, path) of every GET route, its arguments filled in from `ids`
+    found = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if "GET" not in rule.methods or SKIP.search(rule.rule):
+            continue
+        if any(ids.get(argument) is None for argument in rule.arguments):
+            continue
+        path = rule.build(dict((argument, ids[argument]) for argument in rule.arguments))[1]
+        if rule.rule in QUERY_STRINGS:
+            path += "?" + QUERY_STRINGS[rule.rule]
+        if only and not any(re.search(pattern, rule.rule) for pattern in only):
+            continue
+        found.append((rule.rule, path))
+    return found
+
+
+# ----------------------------------------------------------------------------#
+# Measurement.
+# ----------------------------------------------------------------------------#
+
+def rss_mb(pid=None):
+    # current resident set size; None where /proc is not available
+    try:
+        with open("/proc/%s/status" % (pid or "self")) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+
+
+def max_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    return sorted_values[max(0, int(math.ceil(p / 100.0 * len(sorted_values))) - 1)]
+
+
+def test_client_get():
+    client = app.test_client()
+
+    def get(path):
+        response = client.get(path)
+        response.get_data()
+        return response.status_code, response.headers.get("Server-Timing", "")
+    return get
+
+
+def http_get(base_url):
+    def get(path):
+        request = urllib.request.Request(base_url + path, headers={"Accept-Encoding": "identity"})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get("Server-Timing", "")
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get("Server-Timing", "")
+    return get
+
+
+def measure(get, path, requests, warmup, server_pid):
+    for _ in range(warmup):
+        get(path)
+    timings, queries, statuses = [], [], set()
+    for _ in range(requests):
+        started = time.perf_counter()
+        status, timing = get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses.add(status)
+        match = QUERIES.search(timing)
+        if match:
+            queries.append(int(match.group(1)))
+    timings.sort()
+    return {
+        "path": path,
+        "status": sorted(statuses),
+        "requests": requests,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "queries": max(queries) if queries else None,
+        "rss_mb": rss_mb(server_pid),
+    }
+
+
+def git(*args):
+    try:
+        return subprocess.check_output(("git",) + args, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def counts():
+    return dict((model.__tablename__, db.session.query(db.func.count(model.id)).scalar())
+                for model in (Venue, Artist, Show))
+
+
+# ----------------------------------------------------------------------------#
+# Reports.
+# ----------------------------------------------------------------------------#
+
+def print_results(results):
+    print("%-36s %6s %9s %9s %9s %8s %8s" % ("route", "status", "p50 ms", "p95 ms", "p99 ms", "queries", "rss MB"))
+    for name, result in results["routes"].items():
+        print("%-36s %6s %9.2f %9.2f %9.2f %8s %8s" % (
+            name, ",".join(str(status) for status in result["status"]), result["p50_ms"], result["p95_ms"],
+            result["p99_ms"], "-" if result["queries"] is None else result["queries"],
+            "-" if result["rss_mb"] is None else "%.1f" % result["rss_mb"]))
+
+
+def compare(results, previous, threshold):
+    # prints the change of every route against `previous`; returns the
+    # routes whose p95 grew by more than `threshold` percent or that make
+    # more queries
+    print("\ncompared with %s (%s)" % (previous.get("commit") or "?", previous.get("created")))
+    print("%-36s %16s %16s %10s" % ("route", "p50 ms", "p95 ms", "queries"))
+    regressions = []
+    for name, result in results["routes"].items():
+        before = previous["routes"].get(name)
+        if before is None:
+            print("%-36s new" % name)
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+        queries = "%s -> %s" % (before["queries"], result["queries"])
+        print("%-36s %7.2f -> %6.2f %7.2f -> %6.2f %10s  %+.0f%%" % (
+            name, before["p50_ms"], result["p50_ms"], before["p95_ms"], result["p95_ms"], queries, change))
+        if change > threshold or (result["queries"] or 0) > (before["queries"] or 0):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", help="measure a running server instead of the test client")
+    parser.add_argument("--server-pid", type=int, help="pid of the --base-url server, for its RSS")
+    parser.add_argument("--database-url", help="defaults to the configuration profile's")
+    parser.add_argument("--requests", type=int, default=50, help="requests per route")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--route", action="append", dest="only",
+                        help="only the routes matching this regular expression, repeatable")
+    parser.add_argument("--cache", action="store_true",
+                        help="keep the page and fragment caches on (test client only; they are off by default so the "
+                             "database paths are measured)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="p95 growth in percent that --compare reports as a regression")
+    args = parser.parse_args()
+
+    if args.database_url:
+        app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    if not args.cache:
+        app.extensions["cache"].backend = None
+        app.jinja_env.fragment_cache = None
+    with app.app_context():
+        ids = sample_ids()
+        data = counts()
+        database = db.engine.dialect.name
+        db.session.remove()
+    get = http_get(args.base_url.rstrip("/")) if args.base_url else test_client_get()
+
+    results = {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "target": args.base_url or "test client",
+        "database": database,
+        "data": data,
+        "ids": ids,
+        "settings": {"requests": args.requests, "warmup": args.warmup,
+                     "cache": None if args.base_url else args.cache},
+        "routes": {},
+    }
+    for name, path in routes(ids, args.only):
+        results["routes"][name] = measure(get, path, args.requests, args.warmup, args.server_pid)
+    results["max_rss_mb"] = None if args.base_url else round(max_rss_mb(), 1)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    failed = [name for name, result in results["routes"].items() if max(result["status"]) >= 500]
+    if failed:
+        print("\nserver errors: %s" % ", ".join(failed))
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(results, json.load(previous), args.threshold)
+        if regressions:
+            print("\nregressions: %s" % ", ".join(regressions))
+            failed.extend(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------------#
+# Show range benchmark.
+#
+# Grows the history of past shows step by step (into the millions) while the
+# number of upcoming shows stays fixed, and times the /shows filters at each
+# step: "next week in one city" and "next week everywhere". With the
+# (start_time, id) and (venue_id, start_time) indexes the latency should stay
+# flat however much history accumulates.
+#
+#   python benchmarks/show_range.py --database-url postgresql://localhost/fyyur_bench
+#   python benchmarks/show_range.py --database-url ... --steps 10000,100000,1000000,3000000
+# ----------------------------------------------------------------------------#
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+from queries import show_list  # noqa: E402
+
+CHUNK = 10000
+CITIES = 200
+
+
+def seed(venues, artists, upcoming):
+    db.drop_all()
+    db.create_all()
+    now = datetime.utcnow()
+    db.session.execute(Venue.__table__.insert(),
+                       [{"id": i, "name": "Venue %d" % i, "city": "City %d" % (i % CITIES),
+                         "state": "ST%d" % (i % 50)} for i in range(1, venues + 1)])
+    db.session.execute(Artist.__table__.insert(),
+                       [{"id": i, "name": "Artist %d" % i} for i in range(1, artists + 1)])
+    add_shows(upcoming, venues, artists, now, now + timedelta(days=90), random.Random(0))
+    db.session.commit()
+
+
+def add_shows(count, venues, artists, start, end, rng):
+    seconds = int((end - start).total_seconds())
+    for offset in range(0, count, CHUNK):
+        db.session.execute(Show.__table__.insert(),
+                           [{"venue_id": rng.randint(1, venues), "artist_id": rng.randint(1, artists),
+                             "start_time": start + timedelta(seconds=rng.randint(0, seconds))}
+                            for _ in range(offset, min(offset + CHUNK, count))])
+    db.session.commit()
+
+
+def measure(name, criteria, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        rows = len(list(show_list(limit=50, **criteria)))
+        timings.append(time.perf_counter() - started)
+    print("  %-28s rows=%-4d median=%8.2fms" % (name, rows, statistics.median(timings) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # the database is dropped and re-seeded: never point this at real data
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--venues", type=int, default=10000)
+    parser.add_argument("--artists", type=int, default=50000)
+    parser.add_argument("--upcoming", type=int, default=50000)
+    parser.add_argument("--steps", default="0,100000,1000000,3000000",
+                        help="total past shows to measure at, comma separated")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    with app.app_context():
+        seed(args.venues, args.artists, args.upcoming)
+        rng = random.Random(1)
+        now = datetime.utcnow()
+        week = {"start": now, "end": now + timedelta(days=7)}
+        history = 0
+        for step in (int(step) for step in args.steps.split(",")):
+            # history goes back ten years, never into the measured window
+            add_shows(step - history, args.venues, args.artists,
+                      now - timedelta(days=3650), now - timedelta(days=1), rng)
+            history = step
+            if db.engine.dialect.name == "postgresql":
+                db.session.execute("ANALYZE")
+                db.session.commit()
+            print("past shows: %d" % history)
+            measure("next week in one city", dict(week, city="City 7"), args.repeat)
+            measure("next week everywhere", week, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
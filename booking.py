@@ -0,0 +1,180 @@
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from models import db, Venue, Artist, Show
+from cache import pages_changed
+from summaries import shows_changed
+
+
+# ----------------------------------------------------------------------------#
+# Bookings.
+# ----------------------------------------------------------------------------#
+
+# A tour is booked all or nothing: the artist and venue ids of every row are
+# checked with one IN query per side, the rows are checked for double
+# bookings (another show of the venue or the artist starting less than
+# SHOW_BOOKING_WINDOW minutes before or after) against Shows and each other,
+# and the shows go in as one multi-row INSERT in a single transaction.
+
+shows = Show.__table__
+# rows per overlap query and per INSERT; 4 columns keep an INSERT under
+# SQLite's default limit of 999 bound parameters
+CHUNK = 200
+
+
+class Row(object):
+    # one show of a booking; `number` counts from 1 for the error messages
+
+    def __init__(self, number, artist_id, venue_id, start_time):
+        self.number = number
+        self.artist_id = artist_id
+        self.venue_id = venue_id
+        self.start_time = start_time
+
+    def values(self, now):
+        return {'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': self.start_time,
+                'updated_at': now}
+
+
+def parse_id(value):
+    # a JSON integer or a string of digits; anything int() would round or
+    # coerce (1.9, true, " 3 ") is None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def parse_row(number, artist_id, venue_id, start_time):
+    # returns (row, None) or (None, error) for the strings of a form line or
+    # the values of a JSON object. Start times with an offset are converted
+    # to UTC, the others are taken as UTC already.
+    artist_id, venue_id = parse_id(artist_id), parse_id(venue_id)
+    if artist_id is None or venue_id is None:
+        return None, 'row %d: artist and venue ids must be whole numbers' % number
+    if not isinstance(start_time, datetime):
+        try:
+            start_time = datetime.fromisoformat(str(start_time).strip())
+        except ValueError:
+            return None, 'row %d: start time must look like YYYY-MM-DD HH:MM' % number
+    if start_time.tzinfo is not None:
+        start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return Row(number, artist_id, venue_id, start_time.replace(microsecond=0)), None
+
+
+def parse_lines(text):
+    # "artist_id, venue_id, YYYY-MM-DD HH:MM" per line; blank lines and
+    # lines starting with # are skipped
+    rows, errors = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [part.strip() for part in line.replace('\t', ',').split(',')]
+        if len(parts) != 3:
+            errors.append('row %d: expected artist id, venue id and start time' % number)
+            continue
+        row, error = parse_row(number, *parts)
+        if error:
+            errors.append(error)
+        else:
+            rows.append(row)
+    return rows, errors
+
+
+def lock(query):
+    # SELECT ... FOR NO KEY UPDATE (key_share without read): the lock
+    # conflicts with itself, so a second booking of the same venue or artist
+    # waits until the first commits and then sees its shows, while the
+    # foreign key checks of plain show inserts (FOR KEY SHARE) still pass
+    return query.with_for_update(key_share=True)
+
+
+def _existing(model, ids):
+    # on PostgreSQL the rows stay locked until the booking commits, so two
+    # bookings of the same venue or artist are checked one after the other
+    query = db.session.query(model.id).filter(model.id.in_(sorted(set(ids)))).order_by(model.id)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        query = lock(query)
+    return set(row[0] for row in query)
+
+
+def check_references(rows):
+    # the checks return (row number, message) pairs
+    artists = _existing(Artist, [row.artist_id for row in rows])
+    venues = _existing(Venue, [row.venue_id for row in rows])
+    errors = []
+    for row in rows:
+        if row.artist_id not in artists:
+            errors.append((row.number, 'there is no artist %d' % row.artist_id))
+        if row.venue_id not in venues:
+            errors.append((row.number, 'there is no venue %d' % row.venue_id))
+    return errors
+
+
+def _booked(kind, id_, start_time):
+    return '%s %d is already booked at %s' % (kind, id_, start_time.strftime('%Y-%m-%d %H:%M'))
+
+
+def check_batch(rows, window):
+    # double bookings inside the booking itself: sorted by start time, a row
+    # only has to be compared with the previous one of the same venue/artist
+    errors = []
+    for kind, key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        previous = {}
+        for row in sorted(rows, key=lambda row: (row.start_time, row.number)):
+            other = previous.get(getattr(row, key))
+            if other is not None and row.start_time - other.start_time < window:
+                errors.append((row.number, '%s (row %d)' % (_booked(kind, getattr(row, key), other.start_time),
+                                                           other.number)))
+            previous[getattr(row, key)] = row
+    return errors
+
+
+def check_shows(rows, window):
+    # double bookings against Shows: one query per CHUNK rows, each row a
+    # range on the (venue_id, start_time) and (artist_id, start_time) indexes
+    errors = []
+    for start in range(0, len(rows), CHUNK):
+        chunk = rows[start:start + CHUNK]
+        ranges = []
+        for row in chunk:
+            during = db.and_(shows.c.start_time > row.start_time - window, shows.c.start_time < row.start_time + window)
+            ranges.append(db.and_(shows.c.venue_id == row.venue_id, during))
+            ranges.append(db.and_(shows.c.artist_id == row.artist_id, during))
+        found = {'venue_id': {}, 'artist_id': {}}
+        for show in db.session.execute(db.select([shows.c.venue_id, shows.c.artist_id, shows.c.start_time])
+                                       .where(db.or_(*ranges))):
+            for key in found:
+                found[key].setdefault(show[key], []).append(show.start_time)
+        for row in chunk:
+            for kind, key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+                for start_time in found[key].get(getattr(row, key), ()):
+                    if abs(start_time - row.start_time) < window:
+                        errors.append((row.number, _booked(kind, getattr(row, key), start_time)))
+                        break
+    return errors
+
+
+def book(rows):
+    # books every row or none; returns the errors, empty when the shows were
+    # added. Commits on success and rolls back otherwise.
+    window = timedelta(minutes=current_app.config['SHOW_BOOKING_WINDOW'])
+    try:
+        errors = check_references(rows)
+        if not errors:
+            errors = check_batch(rows, window) + check_shows(rows, window)
+        if errors:
+            db.session.rollback()
+            return ['row %d: %s' % error for error in sorted(errors)]
+        now = datetime.utcnow()
+        values = [row.values(now) for row in rows]
+        for start in range(0, len(values), CHUNK):
+            db.session.execute(shows.insert().values(values[start:start + CHUNK]))
+        shows_changed(db.session.connection(), [row.venue_id for row in rows], [row.artist_id for row in rows])
+        pages_changed(db.session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return []
@@ -0,0 +1,366 @@
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from cache import pages_changed
+from forms import ArtistForm, VenueForm, ShowForm
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from summaries import refresh_shows
+import geo
+
+
+# ----------------------------------------------------------------------------#
+# Entities.
+# ----------------------------------------------------------------------------#
+
+# Column lists of the import/export files. Genres are written as a list in
+# NDJSON and as a ';' separated string in CSV.
+VENUE_FIELDS = ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                'website_link', 'seeking_talent', 'seeking_description', 'genres']
+ARTIST_FIELDS = ['id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+                 'website_link', 'seeking_venue', 'seeking_description', 'genres']
+SHOW_FIELDS = ['id', 'artist_id', 'venue_id', 'start_time']
+BOOLEAN_FIELDS = ['seeking_talent', 'seeking_venue']
+# CSV spellings of the boolean fields (case-insensitive); an empty cell is False
+BOOLEANS = {'true': True, 'false': False, '1': True, '0': False, 'yes': True, 'no': False, '': False}
+
+ENTITIES = {
+    'venues': (Venue, VenueForm, VENUE_FIELDS, venue_genres, 'venue_id'),
+    'artists': (Artist, ArtistForm, ARTIST_FIELDS, artist_genres, 'artist_id'),
+    'shows': (Show, ShowForm, SHOW_FIELDS, None, None),
+}
+
+
+# ----------------------------------------------------------------------------#
+# Files.
+# ----------------------------------------------------------------------------#
+
+def file_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+def read_rows(stream, fmt):
+    # yields row dicts without reading the whole file in memory
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            if row.get('genres') is not None:
+                row['genres'] = [genre for genre in row['genres'].split(';') if genre]
+            yield row
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _formdata(row):
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres':
+            for genre in value or []:
+                data.add(key, genre)
+        elif isinstance(value, bool):
+            if value:
+                data.add(key, 'y')
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def parse_bool(value):
+    # NDJSON has real booleans, CSV has strings; raises ValueError for
+    # anything BOOLEANS does not spell
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    try:
+        return BOOLEANS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(value)
+
+
+def validate(form_class, row):
+    # the same rules as the create forms; returns (values, errors)
+    row = dict(row)
+    for field in BOOLEAN_FIELDS:
+        if field in row:
+            try:
+                row[field] = parse_bool(row[field])
+            except ValueError:
+                return None, {field: ['must be true/false, 1/0 or yes/no']}
+    form = form_class(formdata=_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    values = dict((name, field.data) for name, field in form._fields.items())
+    if row.get('id') not in (None, ''):
+        try:
+            values['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            return None, {'id': ['must be an integer']}
+    if form_class is ShowForm:
+        try:
+            values['artist_id'] = int(values['artist_id'])
+            values['venue_id'] = int(values['venue_id'])
+        except (TypeError, ValueError):
+            return None, {'artist_id/venue_id': ['must be integers']}
+    return values, None
+
+
+# ----------------------------------------------------------------------------#
+# Writers.
+# ----------------------------------------------------------------------------#
+
+def _allocate_ids(table, count):
+    # ids for rows inserted without one, so their genres can be linked
+    # without reading the rows back
+    if db.engine.dialect.name == 'postgresql':
+        sequence = '"%s_id_seq"' % table.name
+        result = db.session.execute('SELECT nextval(\'%s\') FROM generate_series(1, :count)' % sequence,
+                                    {'count': count})
+        return [row[0] for row in result]
+    start = (db.session.execute(db.select([db.func.max(table.c.id)])).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+def _copy(table, columns, rows):
+    # PostgreSQL COPY ... FROM STDIN; everything else uses executemany
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row.get(column) is None else row.get(column) for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)' % (
+        table.name, ', '.join(columns)), buffer)
+
+
+def _genre_ids(names):
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(names)).all())
+    missing = [{'name': name} for name in names if name not in ids]
+    if missing:
+        db.session.execute(Genre.__table__.insert(), missing)
+        ids.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(names)).all())
+    return ids
+
+
+def insert_chunk(entity, values, summaries=True):
+    model, form_class, fields, association, key = ENTITIES[entity]
+    table = model.__table__
+    now = datetime.utcnow()
+    missing_ids = [row for row in values if 'id' not in row]
+    for row, id_ in zip(missing_ids, _allocate_ids(table, len(missing_ids)) if missing_ids else []):
+        row['id'] = id_
+    columns = [column for column in fields if column != 'genres'] + ['updated_at']
+    rows = [dict((column, row.get(column)) for column in columns if column != 'updated_at') for row in values]
+    for row in rows:
+        row['updated_at'] = now
+    if entity == 'venues':
+        # the session hook that places venues does not see Core inserts
+        columns += ['latitude', 'longitude', 'geohash']
+        for row, value in zip(rows, values):
+            row['latitude'], row['longitude'] = value.get('latitude'), value.get('longitude')
+            geo.place(row)
+    _copy(table, columns, rows)
+    if association is not None:
+        ids = _genre_ids(genre for row in values for genre in row['genres'])
+        links = [{key: row['id'], 'genre_id': ids[genre]} for row in values for genre in set(row['genres'])]
+        if links:
+            db.session.execute(association.insert(), links)
+    if entity == 'shows' and summaries:
+        # Core inserts skip the session hooks that keep the summaries; pass
+        # summaries=False to rebuild them once after many chunks instead
+        refresh_shows(db.session.connection(), [row['venue_id'] for row in values],
+                      [row['artist_id'] for row in values])
+    pages_changed(db.session)
+    db.session.commit()
+
+
+def _existing(column, ids):
+    return set(row[0] for row in db.session.query(column).filter(column.in_(set(ids))).all())
+
+
+def check_new_ids(model, values):
+    # rows whose id is already taken, in the table or earlier in the chunk
+    taken = _existing(model.id, [row['id'] for row in values if 'id' in row])
+    valid, errors = [], []
+    for row in values:
+        if row.get('id') in taken:
+            errors.append(row)
+        else:
+            valid.append(row)
+            if 'id' in row:
+                taken.add(row['id'])
+    return valid, errors
+
+
+def check_show_references(values):
+    # one IN query per chunk for each side instead of a lookup per row
+    artists = _existing(Artist.id, [row['artist_id'] for row in values])
+    venues = _existing(Venue.id, [row['venue_id'] for row in values])
+    valid, errors = [], []
+    for row in values:
+        if row['artist_id'] in artists and row['venue_id'] in venues:
+            valid.append(row)
+        else:
+            errors.append(row)
+    return valid, errors
+
+
+def sync_sequence(table):
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute("SELECT setval('\"%s_id_seq\"', COALESCE((SELECT MAX(id) FROM \"%s\"), 1))"
+                           % (table.name, table.name))
+        db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+import_cli = AppGroup('import', help='Bulk import venues, artists or shows from CSV/NDJSON.')
+export_cli = AppGroup('export', help='Stream venues, artists or shows to CSV/NDJSON.')
+
+
+def _report(action, count, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    click.echo('%s %d rows in %.1fs (%.0f rows/s)' % (action, count, elapsed, count / elapsed), err=True)
+
+
+def run_import(entity, path, fmt, chunk_size):
+    model, form_class, fields, association, key = ENTITIES[entity]
+    fmt = file_format(path, fmt)
+    started = time.perf_counter()
+    imported = rejected = 0
+    stream = sys.stdin if path == '-' else open(path, newline='' if fmt == 'csv' else None)
+    try:
+        for index, chunk in enumerate(chunked(read_rows(stream, fmt), chunk_size)):
+            values = []
+            for number, row in enumerate(chunk, start=index * chunk_size + 1):
+                cleaned, errors = validate(form_class, row)
+                if errors:
+                    rejected += 1
+                    click.echo('row %d rejected: %s' % (number, errors), err=True)
+                else:
+                    values.append(cleaned)
+            values, taken = check_new_ids(model, values)
+            for row in taken:
+                rejected += 1
+                click.echo('row rejected, id %s is already taken' % row['id'], err=True)
+            if entity == 'shows':
+                values, unknown = check_show_references(values)
+                for row in unknown:
+                    rejected += 1
+                    click.echo('show rejected, unknown artist %s or venue %s'
+                               % (row['artist_id'], row['venue_id']), err=True)
+            if values:
+                try:
+                    insert_chunk(entity, values)
+                except IntegrityError as e:
+                    # a constraint the checks above do not cover: the whole
+                    # chunk is rejected, the rest of the file still imported
+                    db.session.rollback()
+                    rejected += len(values)
+                    click.echo('rows %d-%d rejected: %s' % (index * chunk_size + 1, index * chunk_size + len(chunk),
+                                                            e.orig), err=True)
+                    continue
+                imported += len(values)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    sync_sequence(model.__table__)
+    _report('imported', imported, started)
+    if rejected:
+        click.echo('rejected %d rows' % rejected, err=True)
+
+
+def export_rows(entity, chunk_size):
+    # yields export dicts; genres are fetched with one query per chunk
+    model, form_class, fields, association, key = ENTITIES[entity]
+    columns = [getattr(model, column) for column in fields if column != 'genres']
+    query = db.session.query(*columns).order_by(model.id).yield_per(chunk_size)
+    for chunk in chunked(query, chunk_size):
+        genres = {}
+        if association is not None:
+            links = (db.session.query(association.c[key], Genre.name)
+                     .join(Genre, Genre.id == association.c.genre_id)
+                     .filter(association.c[key].in_([row.id for row in chunk]))
+                     .order_by(Genre.name))
+            for id_, name in links:
+                genres.setdefault(id_, []).append(name)
+        for row in chunk:
+            data = dict(zip([column.key for column in columns], row))
+            if association is not None:
+                data['genres'] = genres.get(row.id, [])
+            yield data
+
+
+def run_export(entity, path, fmt, chunk_size):
+    model, form_class, fields, association, key = ENTITIES[entity]
+    fmt = file_format(path, fmt)
+    started = time.perf_counter()
+    count = 0
+    stream = sys.stdout if path == '-' else open(path, 'w', newline='' if fmt == 'csv' else None)
+    try:
+        writer = csv.DictWriter(stream, fieldnames=fields) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for data in export_rows(entity, chunk_size):
+            if writer:
+                if 'genres' in data:
+                    data['genres'] = ';'.join(data['genres'])
+                writer.writerow(data)
+            else:
+                stream.write(json.dumps(data, default=str) + '\n')
+            count += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    _report('exported', count, started)
+
+
+def _register(entity):
+    file_options = [
+        click.argument('path'),
+        click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+                     help='Defaults to the file extension (.csv, otherwise NDJSON).'),
+        click.option('--chunk-size', default=5000, show_default=True),
+    ]
+
+    def importer(path, fmt, chunk_size):
+        run_import(entity, path, fmt, chunk_size)
+
+    def exporter(path, fmt, chunk_size):
+        run_export(entity, path, fmt, chunk_size)
+
+    for option in reversed(file_options):
+        importer = option(importer)
+        exporter = option(exporter)
+    import_cli.command(entity, help='Import %s; PATH may be - for stdin.' % entity)(importer)
+    export_cli.command(entity, help='Export %s; PATH may be - for stdout.' % entity)(exporter)
+
+
+for _entity in ENTITIES:
+    _register(_entity)
@@ -0,0 +1,368 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, g, make_response, Response
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class CacheStats(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class LRUCache(object):
+    # in-process cache: least recently used entries are evicted once
+    # `max_entries` is reached and entries older than `timeout` are dropped
+    # on access
+
+    def __init__(self, max_entries=1024, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + (timeout or self.timeout)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats.invalidations += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache(object):
+    # cache shared by every worker on the host: one pickle file per entry.
+    # Invalidation bumps a generation number kept in its own file, so a clear
+    # issued by one worker is seen by all of them without deleting files
+    # under their feet; stale generations are swept on the next eviction.
+
+    def __init__(self, directory=None, max_entries=4096, timeout=300):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'fyyur-cache')
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.stats = CacheStats()
+        os.makedirs(self.directory, exist_ok=True)
+        self._generation_file = os.path.join(self.directory, 'generation')
+
+    def _generation(self):
+        try:
+            with open(self._generation_file) as f:
+                return f.read().strip() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '%s-%s.cache' % (self._generation(), digest))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.stats.misses += 1
+            return None
+        if expires < time.time():
+            self._remove(path)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + (timeout or self.timeout)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self._evict()
+
+    def clear(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(int(self._generation()) + 1))
+        os.replace(tmp, self._generation_file)
+        self.stats.invalidations += 1
+
+    def _evict(self):
+        generation = self._generation() + '-'
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.cache'):
+                continue
+            if not entry.name.startswith(generation):
+                self._remove(entry.path)
+                continue
+            entries.append(entry)
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            self._remove(entry.path)
+            self.stats.evictions += 1
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        generation = self._generation() + '-'
+        return sum(1 for name in os.listdir(self.directory)
+                   if name.startswith(generation) and name.endswith('.cache'))
+
+
+# ----------------------------------------------------------------------------#
+# Flask integration.
+# ----------------------------------------------------------------------------#
+
+# session.info key set when a transaction changed what the pages show
+CHANGED = 'page_cache_changed'
+
+
+def pages_changed(session):
+    # for Core writes to the catalogue (bulk import and booking, summary and
+    # recommendation refreshes), which the flush hook does not see
+    session.info[CHANGED] = True
+
+
+class Cache(object):
+    # Read-through cache for rendered pages and view data. It is cleared by
+    # the commit of any transaction that added, changed or deleted one of
+    # `models`, or that called pages_changed(), so the create/edit/delete
+    # handlers never need to know which pages they affect; commits that only
+    # touch jobs, rollups and the like leave it alone.
+
+    def __init__(self, app=None, models=()):
+        self.backend = None
+        self.fragments = None
+        self.models = tuple(models)
+        self.invalidated_at = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 1024)
+        if backend == 'memory':
+            self.backend = LRUCache(max_entries=max_entries, timeout=timeout)
+        elif backend == 'file':
+            self.backend = FileCache(app.config.get('CACHE_DIR'), max_entries=max_entries, timeout=timeout)
+        else:
+            self.backend = None
+        # fragment keys carry the updated_at of what they render, so a
+        # commit never needs to clear them; old versions age out of the LRU
+        if app.config.get('FRAGMENT_CACHE_BACKEND', 'memory') == 'memory':
+            self.fragments = LRUCache(max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000),
+                                      timeout=app.config.get('FRAGMENT_CACHE_TIMEOUT', 3600))
+        else:
+            self.fragments = None
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self.fragments
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+        app.extensions['cache'] = self
+
+    def _after_flush(self, db_session, flush_context):
+        if CHANGED in db_session.info:
+            return
+        for instance in db_session.new | db_session.dirty | db_session.deleted:
+            if isinstance(instance, self.models):
+                pages_changed(db_session)
+                return
+
+    def _after_commit(self, db_session):
+        if db_session.info.pop(CHANGED, False):
+            self.invalidate()
+
+    def _after_rollback(self, db_session):
+        db_session.info.pop(CHANGED, None)
+
+    def invalidate(self):
+        self.invalidated_at = time.time()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _settled(self):
+        # a read replica can still be behind the write that cleared the
+        # cache for DB_REPLICA_LAG seconds; pages rendered until then are
+        # not stored
+        config = current_app.config
+        if 'replica' not in (config.get('SQLALCHEMY_BINDS') or {}):
+            return True
+        return time.time() - self.invalidated_at >= config.get('DB_REPLICA_LAG', 5)
+
+    def get_or_set(self, key, create, timeout=None):
+        if self.backend is None:
+            return create()
+        value = self.backend.get(key)
+        if value is None:
+            value = create()
+            self.backend.set(key, value, timeout)
+        return value
+
+    def stats(self):
+        stats = _backend_stats(self.backend)
+        stats['fragments'] = _backend_stats(self.fragments)
+        return stats
+
+    def cached_page(self, timeout=None):
+        # caches the rendered HTML of a GET view, keyed by path and query
+        # string, and under @conditional by its ETag as well, so a page whose
+        # validators moved on (a show started, the day changed) is rendered
+        # again instead of served under the new ETag; streamed responses
+        # and pages carrying flashed messages are never cached
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if (self.backend is None or request.method != 'GET'
+                        or request.args.get('stream') or session.get('_flashes')):
+                    return view(*args, **kwargs)
+                key = 'page:' + request.full_path
+                if g.get('page_etag'):
+                    key += '#' + g.page_etag
+                html = self.backend.get(key)
+                if html is None:
+                    html = view(*args, **kwargs)
+                    if not isinstance(html, str) or not self._settled():
+                        return html
+                    self.backend.set(key, html, timeout)
+                return html
+            return wrapper
+        return decorator
+
+
+def _backend_stats(backend):
+    if backend is None:
+        return {'backend': None}
+    stats = backend.stats.as_dict()
+    stats['backend'] = type(backend).__name__
+    stats['entries'] = len(backend)
+    return stats
+
+
+# ----------------------------------------------------------------------------#
+# Template fragments.
+# ----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'venue-item', venue.id, venue.updated_at %}...{% endcache %}
+    # renders its body once per distinct key and reuses the HTML on every
+    # page that uses the same key. The first value names the fragment, the
+    # rest are what it depends on; when one of them is None the body is
+    # rendered uncached.
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        backend = self.environment.fragment_cache
+        if backend is None or any(part is None for part in parts):
+            return caller()
+        key = 'fragment:' + ':'.join(str(part) for part in parts)
+        html = backend.get(key)
+        if html is None:
+            html = caller()
+            backend.set(key, html)
+        return html
+
+
+# ----------------------------------------------------------------------------#
+# Conditional requests.
+# ----------------------------------------------------------------------------#
+
+def conditional(version):
+    # Answers If-None-Match / If-Modified-Since with 304 before the view
+    # runs. `version` is called with the view arguments and returns
+    # (last_modified, token), or None to let the view handle the request.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+            validators = version(*args, **kwargs)
+            if validators is None:
+                return view(*args, **kwargs)
+            last_modified, token = validators
+            etag = hashlib.sha1(repr((token, request.full_path)).encode('utf-8')).hexdigest()
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0)
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                # read by cached_page, which keys the HTML on it
+                g.page_etag = etag
+                try:
+                    response = make_response(view(*args, **kwargs))
+                finally:
+                    g.pop('page_etag', None)
+            else:
+                response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # let clients keep the page but revalidate it on every use
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+import time
+from flask import current_app, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import UpdateBase
+
+
+# ----------------------------------------------------------------------------#
+# Replica routing.
+# ----------------------------------------------------------------------------#
+
+REPLICA = 'replica'
+# flask.session key: until when this browser reads from the primary
+PINNED = '_primary_until'
+
+
+def has_replica(app):
+    return REPLICA in (app.config['SQLALCHEMY_BINDS'] or {})
+
+
+def on_primary(view):
+    # for views that write even when called with GET (/venues/<id>/delete):
+    # they never read from the replica
+    view.on_primary = True
+    return view
+
+
+class RoutingSession(SignallingSession):
+    # Reads go to the 'replica' bind (SQLALCHEMY_BINDS) while the session is
+    # flagged with use_replica(). Flushes, Core INSERT/UPDATE/DELETE and
+    # every unflagged session use the primary; after a write the session
+    # stays on the primary until it is flagged again, so a request reads its
+    # own writes.
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info[REPLICA] = False
+        if self.info.get(REPLICA) and has_replica(self.app):
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class Database(SQLAlchemy):
+
+    def init_app(self, app):
+        SQLAlchemy.init_app(self, app)
+        app.before_request(self._route_request)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def _route_request(self):
+        # GET listing/detail pages read from the replica. Form submissions,
+        # deletes and @on_primary views stay on the primary, and so does the
+        # browser that sent them for DB_REPLICA_LAG seconds, so the page it
+        # is redirected to shows what it just wrote.
+        if not has_replica(current_app):
+            self.use_replica(False)
+            return
+        now = time.time()
+        view = current_app.view_functions.get(request.endpoint)
+        if request.method not in ('GET', 'HEAD') or getattr(view, 'on_primary', False):
+            session[PINNED] = now + current_app.config.get('DB_REPLICA_LAG', 5)
+            self.use_replica(False)
+        elif session.get(PINNED, 0) > now:
+            self.use_replica(False)
+        else:
+            if PINNED in session:
+                del session[PINNED]
+            self.use_replica(True)
+
+    def use_replica(self, enabled=True):
+        self.session.info[REPLICA] = enabled
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        # pool settings from the DB_* config keys; SQLite keeps the
+        # Flask-SQLAlchemy defaults
+        SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+        if sa_url.drivername.startswith('sqlite'):
+            return
+        config = app.config
+        options.setdefault('pool_size', config.get('DB_POOL_SIZE', 5))
+        options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 10))
+        options.setdefault('pool_pre_ping', config.get('DB_POOL_PRE_PING', True))
+        options.setdefault('pool_recycle', config.get('DB_POOL_RECYCLE', -1))
+        timeout = config.get('DB_STATEMENT_TIMEOUT')
+        if timeout and sa_url.drivername.startswith('postgresql'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args.setdefault('options', '-c statement_timeout=%d' % timeout)
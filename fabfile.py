@@ -7,7 +7,9 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest -q tests"
+            " && FYYUR_ENV=testing flask seed --reset --yes --venues 200 --artists 1000 --shows 10000"
+            " && FYYUR_ENV=testing python benchmarks/routes.py --requests 5", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -40,7 +42,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python benchmarks/routes.py --requests 3 --route '^/(venues|artists|shows)$'"
     )
 
 
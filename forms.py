@@ -1,6 +1,6 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
 from wtforms.validators import DataRequired, AnyOf, URL, Length, ValidationError
 import re
 
@@ -94,6 +94,14 @@ class ShowForm(FlaskForm):
     )
 
 
+class BulkShowForm(FlaskForm):
+    # one "artist_id, venue_id, YYYY-MM-DD HH:MM" per line
+    shows = TextAreaField(
+        'shows',
+        validators=[DataRequired()]
+    )
+
+
 class VenueForm(FlaskForm):
     def validate_phone(form, field):
         rule = re.compile(r"^[0-9]{3}-[0-9]{3}-[0-9]{4}$")
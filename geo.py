@@ -0,0 +1,216 @@
+import csv
+import math
+import os
+from functools import lru_cache
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event, inspect
+from sqlalchemy.orm import Session
+from models import db, Venue
+from cache import pages_changed
+
+
+# ----------------------------------------------------------------------------#
+# Gazetteer.
+# ----------------------------------------------------------------------------#
+
+# Venues are placed from their city and state with gazetteer.csv, an offline
+# list of state centroids and the larger cities; a city that is not listed
+# gets its state's centroid. Nothing is geocoded over the network.
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    # (STATE, city) -> (latitude, longitude); (STATE, '') is the centroid
+    places = {}
+    with open(GAZETTEER, newline='') as source:
+        for row in csv.DictReader(source):
+            places[(row['state'], row['city'].lower())] = (float(row['latitude']), float(row['longitude']))
+    return places
+
+
+def locate(city, state):
+    # (latitude, longitude), or (None, None) for an unknown state
+    places = gazetteer()
+    state = (state or '').strip().upper()
+    return places.get((state, (city or '').strip().lower())) or places.get((state, ''), (None, None))
+
+
+# ----------------------------------------------------------------------------#
+# Geohash.
+# ----------------------------------------------------------------------------#
+
+# Every venue also stores the geohash of its point as an integer (45 bits,
+# the precision of a 9 character geohash), indexed with a plain B-tree. A
+# geohash prefix is a contiguous range of these integers, so the venues in a
+# few cells around a point are a few index range scans on any database.
+# Integers rather than strings keep the ranges independent of collations.
+
+GEOHASH_BITS = 45
+# upper bound on the cells (index ranges) a radius query is split into
+MAX_CELLS = 12
+KM_PER_DEGREE = 111.195
+
+
+def encode(latitude, longitude, bits=GEOHASH_BITS):
+    # bits alternate longitude, latitude, each halving its interval
+    intervals = [[-180.0, 180.0], [-90.0, 90.0]]
+    values = (longitude, latitude)
+    code = 0
+    for bit in range(bits):
+        interval, value = intervals[bit % 2], values[bit % 2]
+        middle = (interval[0] + interval[1]) / 2
+        code <<= 1
+        if value >= middle:
+            code |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+    return code
+
+
+def _cells(low, high, origin, size):
+    count = int(round(-2 * origin / size))
+    return min(int((low - origin) // size), count - 1), min(int((high - origin) // size), count - 1)
+
+
+def cover(south, north, west, east):
+    # [start, stop) geohash ranges covering the box, using the smallest cells
+    # that keep their number under MAX_CELLS
+    for bits in range(GEOHASH_BITS, 0, -1):
+        lat_size = 180.0 / 2 ** (bits // 2)
+        lon_size = 360.0 / 2 ** ((bits + 1) // 2)
+        first_lat, last_lat = _cells(south, north, -90.0, lat_size)
+        first_lon, last_lon = _cells(west, east, -180.0, lon_size)
+        if (last_lat - first_lat + 1) * (last_lon - first_lon + 1) <= MAX_CELLS:
+            break
+    shift = GEOHASH_BITS - bits
+    prefixes = sorted(encode(-90.0 + (i + 0.5) * lat_size, -180.0 + (j + 0.5) * lon_size, bits)
+                      for i in range(first_lat, last_lat + 1) for j in range(first_lon, last_lon + 1))
+    ranges = []
+    for prefix in prefixes:
+        if ranges and ranges[-1][1] == prefix << shift:
+            ranges[-1][1] = (prefix + 1) << shift
+        else:
+            ranges.append([prefix << shift, (prefix + 1) << shift])
+    return ranges
+
+
+def bounding_box(latitude, longitude, radius_km):
+    # (south, north, west, east), clipped at the poles and the antimeridian
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0),
+            max(longitude - lon_delta, -180.0), min(longitude + lon_delta, 180.0))
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+# PostgreSQL answers radius queries with the earthdistance extension and a
+# GiST index on ll_to_earth(latitude, longitude) (see the "venue locations"
+# migration). Elsewhere the geohash ranges narrow the venues down and an
+# equirectangular distance, plain arithmetic that SQLite can evaluate, drops
+# the corners of the cells.
+
+EARTH_INDEX_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS cube',
+    'CREATE EXTENSION IF NOT EXISTS earthdistance',
+    'CREATE INDEX "ix_Venue_earth" ON "Venue" USING gist (ll_to_earth(latitude, longitude))',
+]
+
+# keep db.create_all() in line with the migration
+for _statement in EARTH_INDEX_DDL:
+    event.listen(Venue.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+
+def within(latitude, longitude, radius_km):
+    # criterion on Venue: within radius_km of the point
+    if db.engine.dialect.name == 'postgresql':
+        center = db.func.ll_to_earth(latitude, longitude)
+        point = db.func.ll_to_earth(Venue.latitude, Venue.longitude)
+        meters = radius_km * 1000.0
+        return db.and_(db.func.earth_box(center, meters).op('@>')(point),
+                       db.func.earth_distance(center, point) < meters)
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+    cells = db.or_(*[db.and_(Venue.geohash >= start, Venue.geohash < stop)
+                     for start, stop in cover(south, north, west, east)])
+    lat_km = (Venue.latitude - latitude) * KM_PER_DEGREE
+    lon_km = (Venue.longitude - longitude) * (KM_PER_DEGREE * math.cos(math.radians(latitude)))
+    return db.and_(cells, lat_km * lat_km + lon_km * lon_km < radius_km * radius_km)
+
+
+def parse_near(near, radius, default_radius, max_radius):
+    # ?near=lat,lon&radius=km -> (latitude, longitude, radius_km); raises
+    # ValueError
+    latitude, longitude = (float(part) for part in near.split(','))
+    radius = float(radius) if radius else default_radius
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius <= max_radius):
+        raise ValueError(near)
+    return latitude, longitude, radius
+
+
+# ----------------------------------------------------------------------------#
+# Placing venues.
+# ----------------------------------------------------------------------------#
+
+def place(row):
+    # fills latitude/longitude (unless given) and geohash of a row dict
+    try:
+        row['latitude'], row['longitude'] = float(row['latitude']), float(row['longitude'])
+    except (KeyError, TypeError, ValueError):
+        row['latitude'], row['longitude'] = locate(row.get('city'), row.get('state'))
+    row['geohash'] = None if row['latitude'] is None else encode(row['latitude'], row['longitude'])
+    return row
+
+
+@event.listens_for(Session, 'before_flush')
+def _place_venues(session, flush_context, instances):
+    # a venue moved to another city is placed again, unless its coordinates
+    # were set at the same time
+    for instance in session.new | session.dirty:
+        if not isinstance(instance, Venue):
+            continue
+        state = inspect(instance)
+        moved = state.attrs.city.history.has_changes() or state.attrs.state.history.has_changes()
+        pinned = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+        if instance.latitude is None or (moved and not pinned):
+            instance.latitude, instance.longitude = locate(instance.city, instance.state)
+        geohash = None if instance.latitude is None else encode(instance.latitude, instance.longitude)
+        if instance.geohash != geohash:
+            instance.geohash = geohash
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+geo_cli = AppGroup('geo', help='Place venues on the map.')
+
+
+@geo_cli.command('locate', help='Place the venues without coordinates from the gazetteer.')
+@click.option('--all', 'everything', is_flag=True, help='Place every venue again, from its city and state.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def locate_command(everything, chunk_size):
+    table = Venue.__table__
+    query = db.select([table.c.id, table.c.city, table.c.state]).order_by(table.c.id)
+    if not everything:
+        query = query.where(table.c.latitude.is_(None))
+    placed, after = 0, None
+    while True:
+        chunk = query if after is None else query.where(table.c.id > after)
+        rows = [dict(row) for row in db.session.execute(chunk.limit(chunk_size))]
+        if not rows:
+            break
+        for row in rows:
+            place(row)
+            db.session.execute(table.update().where(table.c.id == row['id']).values(
+                latitude=row['latitude'], longitude=row['longitude'], geohash=row['geohash']))
+        pages_changed(db.session)
+        db.session.commit()
+        placed += sum(1 for row in rows if row['latitude'] is not None)
+        after = rows[-1]['id']
+    click.echo('placed %d venues' % placed)
@@ -0,0 +1,168 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ----------------------------------------------------------------------------#
+# Per-request query log.
+# ----------------------------------------------------------------------------#
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_statement(statement):
+    # statements that only differ in their parameters (IN lists included)
+    # are the same pattern
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    statement = re.sub(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)', '(?)', statement)
+    return re.sub(r'\b\d+\b', '?', statement)
+
+
+class RequestQueries(object):
+    # shared by the query worker threads of an async view (see aio.py)
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+        self._lock = threading.Lock()
+
+    def record(self, statement, duration):
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.statements.append((duration, statement))
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda entry: entry[0], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        counts = Counter(normalize_statement(statement) for duration, statement in self.statements)
+        return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+
+# ----------------------------------------------------------------------------#
+# Flask integration.
+# ----------------------------------------------------------------------------#
+
+class QueryStats(object):
+    # Counts and times every statement run while a request is handled (engine
+    # events), reports them in a Server-Timing header and a JSON log line,
+    # and remembers the statements a single request repeated often enough to
+    # look like an N+1. The header only carries the SQL of the slowest
+    # statements when SERVER_TIMING_STATEMENTS is set (default: in debug).
+    # Budgets come from QUERY_BUDGET (every endpoint) and QUERY_BUDGETS (per
+    # endpoint); going over one is logged, and raises QueryBudgetExceeded
+    # when QUERY_BUDGET_RAISE is set (default: in tests).
+
+    max_patterns = 100
+
+    def __init__(self, app=None):
+        self.logger = logging.getLogger('fyyur.queries')
+        self._patterns = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.extensions['query_stats'] = self
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        if has_request_context() and 'queries' in g:
+            g.queries.record(statement, time.perf_counter() - started)
+
+    def _start(self):
+        g.queries = RequestQueries()
+
+    def budget(self, endpoint):
+        config = current_app.config
+        return (config.get('QUERY_BUDGETS') or {}).get(endpoint, config.get('QUERY_BUDGET'))
+
+    def _finish(self, response):
+        queries = g.get('queries')
+        if queries is None or request.endpoint == 'static':
+            g.pop('queries', None)
+            return response
+        context = {'method': request.method, 'path': request.full_path.rstrip('?'), 'endpoint': request.endpoint,
+                   'status': response.status_code}
+        if response.is_streamed:
+            # a streamed body (?stream=1) runs its queries after this, so
+            # they are reported, and held to the budget, once it has been
+            # sent; its headers are gone by then, so it has no Server-Timing
+            app = current_app._get_current_object()
+
+            def close():
+                with app.app_context():
+                    self._report(queries, context)
+            response.call_on_close(close)
+            return response
+        g.pop('queries')
+        slowest = self._report(queries, context)
+        statements = current_app.config.get('SERVER_TIMING_STATEMENTS', current_app.debug)
+        response.headers.add('Server-Timing', server_timing(queries, slowest if statements else ()))
+        return response
+
+    def _report(self, queries, context):
+        # logs the request's queries and checks its budget; returns the
+        # slowest statements
+        config = current_app.config
+        slowest = queries.slowest(config.get('QUERY_STATS_SLOWEST', 3))
+        repeated = queries.repeated(config.get('N_PLUS_ONE_THRESHOLD', 5))
+        for statement, count in repeated:
+            self._remember(context['endpoint'], context['path'], statement, count)
+
+        self.logger.info(json.dumps(dict(context, **{
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 2),
+            'slowest': [{'ms': round(duration * 1000, 2), 'statement': statement}
+                        for duration, statement in slowest],
+            'n_plus_one': [{'count': count, 'statement': statement} for statement, count in repeated],
+        })))
+
+        budget = self.budget(context['endpoint'])
+        if budget is not None and queries.count > budget:
+            message = '%s issued %d queries, over its budget of %d' % (context['endpoint'], queries.count, budget)
+            self.logger.warning(message)
+            if config.get('QUERY_BUDGET_RAISE', current_app.testing):
+                raise QueryBudgetExceeded(message)
+        return slowest
+
+    def _remember(self, endpoint, path, statement, count):
+        key = (endpoint, statement)
+        with self._lock:
+            pattern = self._patterns.pop(key, None) or {
+                'endpoint': endpoint, 'statement': statement, 'requests': 0, 'max_count': 0}
+            pattern['requests'] += 1
+            pattern['max_count'] = max(pattern['max_count'], count)
+            pattern['last_path'] = path
+            self._patterns[key] = pattern
+            while len(self._patterns) > self.max_patterns:
+                self._patterns.popitem(last=False)
+
+    def n_plus_one(self):
+        # most recently seen first
+        with self._lock:
+            return [dict(pattern) for pattern in reversed(self._patterns.values())]
+
+
+def server_timing(queries, slowest):
+    metrics = ['db;dur=%.2f;desc="%d queries"' % (queries.duration * 1000, queries.count)]
+    for n, (duration, statement) in enumerate(slowest, start=1):
+        description = re.sub(r'\s+', ' ', statement).replace('"', '')[:60]
+        metrics.append('sql%d;dur=%.2f;desc="%s"' % (n, duration * 1000, description))
+    return ', '.join(metrics)
@@ -0,0 +1,381 @@
+import calendar
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, jobs
+
+logger = logging.getLogger('fyyur.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+
+# ----------------------------------------------------------------------------#
+# Tasks.
+# ----------------------------------------------------------------------------#
+
+# name -> (function, retries). A task takes keyword arguments that survive a
+# JSON round trip and runs in an app context; the worker commits its session
+# together with the job's "done" status.
+TASKS = {}
+
+
+def task(name, retries=3):
+    def decorator(function):
+        TASKS[name] = (function, retries)
+        return function
+    return decorator
+
+
+def enqueue(name, args=None, delay=0, key=None, connection=None):
+    # adds a job in the caller's transaction, so workers only see it once
+    # the write it belongs to has committed (and never if it rolls back).
+    # Core insert: safe to call from the session's flush hooks.
+    if name not in TASKS:
+        raise KeyError('unknown task %r' % name)
+    now = datetime.utcnow()
+    (connection or db.session.connection()).execute(jobs.insert().values(
+        name=name, args=json.dumps(args or {}, sort_keys=True), key=key, status=QUEUED, attempts=0,
+        max_attempts=TASKS[name][1] + 1, run_at=now + timedelta(seconds=delay), created_at=now))
+    db.session.info['jobs_enqueued'] = True
+
+
+# set when a session that queued jobs commits; wakes the worker threads of
+# this process without waiting for the next poll
+_wakeup = threading.Event()
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_jobs(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+# ----------------------------------------------------------------------------#
+# Queue.
+# ----------------------------------------------------------------------------#
+
+def record(name, started, connection=None):
+    # a finished job row for work a command did outside the queue, so
+    # last_done() (and what is built on it) sees that run too
+    now = datetime.utcnow()
+    (connection or db.session.connection()).execute(jobs.insert().values(
+        name=name, args='{}', status=DONE, attempts=1, max_attempts=1, run_at=started, created_at=started,
+        started_at=started, finished_at=now))
+
+
+def claim(worker_id, now=None):
+    # the next due job, marked running; None when the queue is empty. Two
+    # workers racing for a row are told apart by the status check of the
+    # UPDATE; PostgreSQL also skips rows another worker has locked.
+    now = now or datetime.utcnow()
+    candidates = (db.select([jobs.c.id]).where(db.and_(jobs.c.status == QUEUED, jobs.c.run_at <= now))
+                  .order_by(jobs.c.run_at, jobs.c.id).limit(10))
+    if db.engine.dialect.name == 'postgresql':
+        candidates = candidates.with_for_update(skip_locked=True)
+    try:
+        for (job_id,) in db.session.execute(candidates).fetchall():
+            claimed = db.session.execute(
+                jobs.update().where(db.and_(jobs.c.id == job_id, jobs.c.status == QUEUED))
+                .values(status=RUNNING, locked_by=worker_id, started_at=now, attempts=jobs.c.attempts + 1))
+            if claimed.rowcount == 1:
+                row = db.session.execute(jobs.select().where(jobs.c.id == job_id)).first()
+                db.session.commit()
+                return row
+        # nothing claimed: end the read without a commit, so idle polls do
+        # not fire the commit hooks
+        db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+    return None
+
+
+def run(job):
+    # runs a claimed job; on failure it is queued again with exponential
+    # backoff until max_attempts, then marked failed. Returns the status.
+    started = time.perf_counter()
+    error = None
+    try:
+        function, retries = TASKS[job.name]
+        function(**json.loads(job.args))
+        db.session.execute(jobs.update().where(jobs.c.id == job.id)
+                           .values(status=DONE, finished_at=datetime.utcnow(), error=None, locked_by=None))
+        db.session.commit()
+        status = DONE
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        now = datetime.utcnow()
+        if job.attempts < job.max_attempts:
+            status = QUEUED
+            delay = current_app.config.get('JOB_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+            values = dict(status=QUEUED, run_at=now + timedelta(seconds=delay))
+        else:
+            status = FAILED
+            values = dict(status=FAILED, finished_at=now)
+        db.session.execute(jobs.update().where(jobs.c.id == job.id)
+                           .values(error=error, locked_by=None, **values))
+        db.session.commit()
+    logger.log(logging.ERROR if status == FAILED else logging.INFO, json.dumps({
+        'job': job.id,
+        'name': job.name,
+        'status': status,
+        'attempt': job.attempts,
+        'wait_ms': round((job.started_at - job.run_at).total_seconds() * 1000, 1),
+        'run_ms': round((time.perf_counter() - started) * 1000, 1),
+        'error': error.strip().splitlines()[-1] if error else None,
+    }))
+    return status
+
+
+def requeue_stale(timeout, now=None):
+    # jobs left running by a worker that died; counts as a failed attempt
+    now = now or datetime.utcnow()
+    stale = db.and_(jobs.c.status == RUNNING, jobs.c.started_at < now - timedelta(seconds=timeout))
+    failed = db.session.execute(jobs.update().where(db.and_(stale, jobs.c.attempts >= jobs.c.max_attempts))
+                                .values(status=FAILED, finished_at=now, error='timed out', locked_by=None))
+    requeued = db.session.execute(jobs.update().where(stale)
+                                  .values(status=QUEUED, run_at=now, error='timed out', locked_by=None))
+    if failed.rowcount or requeued.rowcount:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return requeued.rowcount
+
+
+# periodic task -> the last slot this process queued, or found queued by
+# another worker; saves an INSERT per task on every poll
+_scheduled = {}
+
+
+def schedule(periodic, now=None):
+    # queues each periodic task once per interval (seconds); the unique key
+    # makes every worker process agree on who queued it
+    now = now or datetime.utcnow()
+    queued = []
+    for name, interval in periodic.items():
+        slot = calendar.timegm(now.utctimetuple()) // interval
+        if _scheduled.get(name) == slot:
+            continue
+        try:
+            enqueue(name, key='%s@%d' % (name, slot))
+            db.session.commit()
+            queued.append(name)
+        except IntegrityError:
+            db.session.rollback()
+        _scheduled[name] = slot
+    return queued
+
+
+def purge(days, now=None):
+    now = now or datetime.utcnow()
+    result = db.session.execute(jobs.delete().where(db.and_(
+        jobs.c.status.in_([DONE, FAILED]), jobs.c.finished_at < now - timedelta(days=days))))
+    db.session.commit()
+    return result.rowcount
+
+
+def last_done(names):
+    # start of the newest finished job of these tasks, None before the first;
+    # the watermark of tasks that catch up on what changed since their last run
+    return (db.session.query(db.func.max(jobs.c.started_at))
+            .filter(jobs.c.name.in_(names), jobs.c.status == DONE)
+            .scalar())
+
+
+@task('jobs.purge', retries=0)
+def purge_task():
+    purge(current_app.config.get('JOB_RETENTION_DAYS', 7))
+
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+# ----------------------------------------------------------------------------#
+
+def _percentile(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))], 1) if values else None
+
+
+def stats(now=None, recent=1000):
+    # queue depth by status, how overdue the oldest due job is, and wait
+    # (run_at -> started) / run (started -> finished) times of the most
+    # recent finished jobs per task, in milliseconds
+    now = now or datetime.utcnow()
+    depth = dict((status, 0) for status in STATUSES)
+    depth.update(db.session.execute(db.select([jobs.c.status, db.func.count()]).group_by(jobs.c.status)).fetchall())
+    oldest = db.session.execute(db.select([db.func.min(jobs.c.run_at)])
+                                .where(db.and_(jobs.c.status == QUEUED, jobs.c.run_at <= now))).scalar()
+    rows = db.session.execute(db.select([jobs.c.name, jobs.c.run_at, jobs.c.started_at, jobs.c.finished_at])
+                              .where(jobs.c.status == DONE)
+                              .order_by(jobs.c.finished_at.desc()).limit(recent)).fetchall()
+    tasks = {}
+    for row in rows:
+        times = tasks.setdefault(row.name, ([], []))
+        times[0].append((row.started_at - row.run_at).total_seconds() * 1000)
+        times[1].append((row.finished_at - row.started_at).total_seconds() * 1000)
+    return {
+        'depth': depth,
+        'oldest_due_age_s': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'tasks': dict((name, {'done': len(wait), 'wait_p50_ms': _percentile(wait, 0.5),
+                              'wait_p95_ms': _percentile(wait, 0.95), 'run_p50_ms': _percentile(runs, 0.5),
+                              'run_p95_ms': _percentile(runs, 0.95)})
+                      for name, (wait, runs) in sorted(tasks.items())),
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Workers.
+# ----------------------------------------------------------------------------#
+
+class Worker(object):
+    # `threads` threads claiming and running jobs; the first one also queues
+    # the periodic tasks and requeues stale jobs. Idle threads sleep for
+    # JOB_POLL_INTERVAL or until a commit in this process queued a job.
+
+    def __init__(self, app, threads=1):
+        self.app = app
+        self.threads = threads
+        self.id = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for n in range(self.threads):
+            thread = threading.Thread(target=self.loop, args=(n,), name='fyyur-jobs-%d' % n, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join()
+
+    def work(self, n):
+        # one pass: maintenance (thread 0), then jobs until the queue is
+        # empty; returns the number of jobs run
+        config = self.app.config
+        if n == 0:
+            schedule(config.get('JOB_SCHEDULE') or {})
+            requeue_stale(config.get('JOB_TIMEOUT', 600))
+        count = 0
+        while not self.stopping.is_set():
+            job = claim('%s/%d' % (self.id, n))
+            if job is None:
+                break
+            run(job)
+            count += 1
+        return count
+
+    def loop(self, n, once=False):
+        interval = self.app.config.get('JOB_POLL_INTERVAL', 1.0)
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    ran = self.work(n)
+                except Exception:
+                    logger.exception('job worker %s/%d', self.id, n)
+                    db.session.rollback()
+                    ran = 0
+                finally:
+                    db.session.remove()
+                if once:
+                    return
+                if not ran:
+                    _wakeup.wait(interval)
+                    _wakeup.clear()
+
+
+class JobQueue(object):
+    # JOB_QUEUE_MODE 'thread' runs JOB_WORKERS worker threads inside the web
+    # process (started with the first request); 'worker' leaves the jobs to
+    # `flask jobs work` processes.
+
+    def __init__(self, app=None):
+        self.worker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get('JOB_QUEUE_MODE') == 'thread':
+            app.before_first_request(lambda: self.start(app))
+        app.extensions['jobs'] = self
+
+    def start(self, app):
+        if self.worker is None:
+            self.worker = Worker(app, app.config.get('JOB_WORKERS', 2))
+            self.worker.start()
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+jobs_cli = AppGroup('jobs', help='Run and inspect the background job queue.')
+
+
+@jobs_cli.command('work', help='Run jobs and the periodic tasks until interrupted.')
+@click.option('--threads', default=None, type=int, help='Defaults to JOB_WORKERS.')
+@click.option('--once', is_flag=True, help='Run the due jobs, then exit.')
+def work_command(threads, once):
+    app = current_app._get_current_object()
+    worker = Worker(app, threads or app.config.get('JOB_WORKERS', 2))
+    if once:
+        worker.loop(0, once=True)
+        return
+    click.echo('worker %s running %d threads' % (worker.id, worker.threads), err=True)
+    worker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        click.echo('stopping after the running jobs', err=True)
+        worker.stop()
+
+
+@jobs_cli.command('enqueue', help='Queue task NAME with JSON keyword arguments.')
+@click.argument('name')
+@click.argument('args', default='{}')
+def enqueue_command(name, args):
+    enqueue(name, json.loads(args))
+    db.session.commit()
+
+
+@jobs_cli.command('stats', help='Queue depth and job latency as JSON.')
+def stats_command():
+    click.echo(json.dumps(stats(), indent=2))
+
+
+@jobs_cli.command('retry', help='Queue the failed jobs again.')
+def retry_command():
+    result = db.session.execute(jobs.update().where(jobs.c.status == FAILED).values(
+        status=QUEUED, attempts=0, run_at=datetime.utcnow(), finished_at=None))
+    db.session.commit()
+    click.echo('queued %d failed jobs again' % result.rowcount)
+
+
+@jobs_cli.command('purge', help='Delete finished jobs older than --days.')
+@click.option('--days', default=None, type=int, help='Defaults to JOB_RETENTION_DAYS.')
+def purge_command(days):
+    click.echo('deleted %d jobs' % purge(days or current_app.config.get('JOB_RETENTION_DAYS', 7)))
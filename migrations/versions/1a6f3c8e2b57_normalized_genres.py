@@ -0,0 +1,167 @@
+"""normalized genres
+
+Revision ID: 1a6f3c8e2b57
+Revises: e5d81b0c6a72
+Create Date: 2026-10-18 14:26:13.774208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6f3c8e2b57'
+down_revision = 'e5d81b0c6a72'
+branch_labels = None
+depends_on = None
+
+genre = sa.table('Genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+venue_genres = sa.table('venue_genres', sa.column('venue_id', sa.Integer), sa.column('genre_id', sa.Integer))
+artist_genres = sa.table('artist_genres', sa.column('artist_id', sa.Integer), sa.column('genre_id', sa.Integer))
+
+
+def parse_array_literal(value):
+    # Artist.genres held a Postgres array literal such as {Jazz,"Rock n Roll"}
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    names = []
+    for name in value.strip('{}').split(','):
+        name = name.strip().strip('"')
+        if name:
+            names.append(name)
+    return names
+
+
+def format_array_literal(names):
+    return '{%s}' % ','.join('"%s"' % name if ' ' in name else name for name in names)
+
+
+def upgrade():
+    op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genres_genre_id_venue_id', 'venue_genres', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genres_genre_id_artist_id', 'artist_genres', ['genre_id', 'artist_id'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # the array literal in Artist.genres parses as text[] directly
+        op.execute('INSERT INTO "Genre" (name) '
+                   'SELECT unnest(genres) FROM "Venue" '
+                   'UNION SELECT unnest(CAST(genres AS text[])) FROM "Artist" WHERE genres IS NOT NULL')
+        op.execute('INSERT INTO venue_genres (venue_id, genre_id) '
+                   'SELECT DISTINCT v.id, g.id FROM "Venue" v '
+                   'CROSS JOIN LATERAL unnest(v.genres) AS t(name) JOIN "Genre" g ON g.name = t.name')
+        op.execute('INSERT INTO artist_genres (artist_id, genre_id) '
+                   'SELECT DISTINCT a.id, g.id FROM "Artist" a '
+                   'CROSS JOIN LATERAL unnest(CAST(a.genres AS text[])) AS t(name) JOIN "Genre" g ON g.name = t.name '
+                   'WHERE a.genres IS NOT NULL')
+        op.drop_index('ix_Venue_genres', table_name='Venue')
+        op.drop_index('ix_Artist_genres_trgm', table_name='Artist')
+    else:
+        venues = [(row[0], parse_array_literal(row[1]))
+                  for row in bind.execute(sa.text('SELECT id, genres FROM "Venue"'))]
+        artists = [(row[0], parse_array_literal(row[1]))
+                   for row in bind.execute(sa.text('SELECT id, genres FROM "Artist"'))]
+        names = sorted({name for _, genres in venues + artists for name in genres})
+        if names:
+            op.bulk_insert(genre, [{'name': name} for name in names])
+        ids = dict((row[1], row[0]) for row in bind.execute(sa.text('SELECT id, name FROM "Genre"')))
+        rows = [{'venue_id': id_, 'genre_id': ids[name]} for id_, genres in venues for name in set(genres)]
+        if rows:
+            op.bulk_insert(venue_genres, rows)
+        rows = [{'artist_id': id_, 'genre_id': ids[name]} for id_, genres in artists for name in set(genres)]
+        if rows:
+            op.bulk_insert(artist_genres, rows)
+        # the FTS tables index `genres`; rebuild them over name/city only
+        for table_name in ('Venue', 'Artist'):
+            _recreate_fts(table_name, ('name', 'city'))
+
+    with op.batch_alter_table('Venue') as batch_op:
+        batch_op.drop_column('genres')
+    with op.batch_alter_table('Artist') as batch_op:
+        batch_op.drop_column('genres')
+    if bind.dialect.name == 'sqlite':
+        for table_name in ('Venue', 'Artist'):
+            _create_fts_triggers(table_name, ('name', 'city'))
+
+
+def downgrade():
+    bind = op.get_bind()
+    venue_type = postgresql.ARRAY(sa.String()) if bind.dialect.name == 'postgresql' else sa.String()
+    op.add_column('Venue', sa.Column('genres', venue_type, nullable=True))
+    op.add_column('Artist', sa.Column('genres', sa.String(length=120), nullable=True))
+
+    for table_name, association, key in (('Venue', 'venue_genres', 'venue_id'),
+                                         ('Artist', 'artist_genres', 'artist_id')):
+        genres = {}
+        rows = bind.execute(sa.text('SELECT a.%s, g.name FROM %s a JOIN "Genre" g ON g.id = a.genre_id '
+                                    'ORDER BY g.name' % (key, association)))
+        for id_, name in rows:
+            genres.setdefault(id_, []).append(name)
+        table = sa.table(table_name, sa.column('id', sa.Integer),
+                         sa.column('genres', venue_type if table_name == 'Venue' else sa.String()))
+        for id_, names in genres.items():
+            if table_name == 'Artist' or bind.dialect.name != 'postgresql':
+                names = format_array_literal(names)
+            op.execute(table.update().where(table.c.id == id_).values(genres=names))
+
+    op.drop_index('ix_artist_genres_genre_id_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_index('ix_venue_genres_genre_id_venue_id', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_table('Genre')
+
+    if bind.dialect.name == 'postgresql':
+        op.create_index('ix_Venue_genres', 'Venue', ['genres'], postgresql_using='gin')
+        op.create_index('ix_Artist_genres_trgm', 'Artist', ['genres'],
+                        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+    else:
+        for table_name in ('Venue', 'Artist'):
+            _recreate_fts(table_name, ('name', 'city', 'genres'))
+            _create_fts_triggers(table_name, ('name', 'city', 'genres'))
+
+
+def _recreate_fts(table_name, columns):
+    # triggers are dropped here and created again by _create_fts_triggers
+    # once the content table has its final shape
+    fts = table_name.lower() + '_search'
+    for suffix in ('ai', 'ad', 'au'):
+        op.execute('DROP TRIGGER IF EXISTS %s_%s' % (fts, suffix))
+    op.execute('DROP TABLE IF EXISTS %s' % fts)
+    op.execute("CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', tokenize='trigram')"
+               % (fts, ', '.join(columns), table_name))
+
+
+def _create_fts_triggers(table_name, columns):
+    fts = table_name.lower() + '_search'
+    column_list = ', '.join(columns)
+    new_values = ', '.join('new.' + column for column in columns)
+    old_values = ', '.join('old.' + column for column in columns)
+    delete = ("INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);"
+              % (fts, fts, column_list, old_values))
+    insert = 'INSERT INTO %s(rowid, %s) VALUES (new.id, %s);' % (fts, column_list, new_values)
+    op.execute('CREATE TRIGGER %s_ai AFTER INSERT ON "%s" BEGIN %s END' % (fts, table_name, insert))
+    op.execute('CREATE TRIGGER %s_ad AFTER DELETE ON "%s" BEGIN %s END' % (fts, table_name, delete))
+    op.execute('CREATE TRIGGER %s_au AFTER UPDATE ON "%s" BEGIN %s %s END' % (fts, table_name, delete, insert))
+    op.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
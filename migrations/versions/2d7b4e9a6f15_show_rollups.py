@@ -0,0 +1,78 @@
+"""show rollups
+
+Revision ID: 2d7b4e9a6f15
+Revises: 9f4b2c6d8e13
+Create Date: 2026-10-19 01:12:37.604218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7b4e9a6f15'
+down_revision = '9f4b2c6d8e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('venue_show_rollup',
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('bucket', sa.Date(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('previous_shows', sa.Integer(), nullable=False),
+    sa.Column('trend', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'bucket', 'venue_id')
+    )
+    op.create_index('ix_venue_show_rollup_shows', 'venue_show_rollup', ['period', 'bucket', 'shows', 'venue_id'], unique=False)
+    op.create_index('ix_venue_show_rollup_trend', 'venue_show_rollup', ['period', 'bucket', 'trend', 'venue_id'], unique=False)
+    op.create_table('artist_show_rollup',
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('bucket', sa.Date(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('previous_shows', sa.Integer(), nullable=False),
+    sa.Column('trend', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'bucket', 'artist_id')
+    )
+    op.create_index('ix_artist_show_rollup_shows', 'artist_show_rollup', ['period', 'bucket', 'shows', 'artist_id'], unique=False)
+    op.create_index('ix_artist_show_rollup_trend', 'artist_show_rollup', ['period', 'bucket', 'trend', 'artist_id'], unique=False)
+    op.create_table('state_show_rollup',
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('bucket', sa.Date(), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('previous_shows', sa.Integer(), nullable=False),
+    sa.Column('trend', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'bucket', 'state')
+    )
+    op.create_table('genre_show_rollup',
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('bucket', sa.Date(), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('genre_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.Column('previous_shows', sa.Integer(), nullable=False),
+    sa.Column('trend', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('period', 'bucket', 'state', 'genre_id')
+    )
+    op.create_table('show_rollup_days',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # filled by `flask analytics rebuild` or the first scheduled refresh
+
+
+def downgrade():
+    op.drop_table('show_rollup_days')
+    op.drop_table('genre_show_rollup')
+    op.drop_table('state_show_rollup')
+    op.drop_index('ix_artist_show_rollup_trend', table_name='artist_show_rollup')
+    op.drop_index('ix_artist_show_rollup_shows', table_name='artist_show_rollup')
+    op.drop_table('artist_show_rollup')
+    op.drop_index('ix_venue_show_rollup_trend', table_name='venue_show_rollup')
+    op.drop_index('ix_venue_show_rollup_shows', table_name='venue_show_rollup')
+    op.drop_table('venue_show_rollup')
@@ -0,0 +1,62 @@
+"""show summaries
+
+Revision ID: 7d2e9f4a1c36
+Revises: 1a6f3c8e2b57
+Create Date: 2026-10-18 16:02:41.518093
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e9f4a1c36'
+down_revision = '1a6f3c8e2b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('venue_show_summary',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('past_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+    op.create_index(op.f('ix_venue_show_summary_next_show'), 'venue_show_summary', ['next_show'], unique=False)
+    op.create_index(op.f('ix_venue_show_summary_updated_at'), 'venue_show_summary', ['updated_at'], unique=False)
+    op.create_table('artist_show_summary',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('past_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id')
+    )
+    op.create_index(op.f('ix_artist_show_summary_next_show'), 'artist_show_summary', ['next_show'], unique=False)
+    op.create_index(op.f('ix_artist_show_summary_updated_at'), 'artist_show_summary', ['updated_at'], unique=False)
+
+    # the same recount as `flask summaries rebuild`
+    now = datetime.utcnow()
+    for table_name, key in (('venue_show_summary', 'venue_id'), ('artist_show_summary', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'INSERT INTO %s (%s, upcoming_shows, past_shows, next_show, updated_at) '
+            'SELECT %s, SUM(CASE WHEN start_time >= :now THEN 1 ELSE 0 END), '
+            'SUM(CASE WHEN start_time >= :now THEN 0 ELSE 1 END), '
+            'MIN(CASE WHEN start_time >= :now THEN start_time END), :now '
+            'FROM "Shows" WHERE %s IS NOT NULL GROUP BY %s' % (table_name, key, key, key, key)
+        ).bindparams(sa.bindparam('now', now, type_=sa.DateTime())))
+
+
+def downgrade():
+    op.drop_index(op.f('ix_artist_show_summary_updated_at'), table_name='artist_show_summary')
+    op.drop_index(op.f('ix_artist_show_summary_next_show'), table_name='artist_show_summary')
+    op.drop_table('artist_show_summary')
+    op.drop_index(op.f('ix_venue_show_summary_updated_at'), table_name='venue_show_summary')
+    op.drop_index(op.f('ix_venue_show_summary_next_show'), table_name='venue_show_summary')
+    op.drop_table('venue_show_summary')
@@ -0,0 +1,68 @@
+"""search indexes
+
+Revision ID: 8b3e5d27c941
+Revises: 4f1c2a9d7e10
+Create Date: 2026-10-18 10:04:17.562391
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e5d27c941'
+down_revision = '4f1c2a9d7e10'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ('name', 'city', 'genres')
+
+
+def fts_ddl(table_name):
+    fts = table_name.lower() + '_search'
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+    old_values = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+    delete = ("INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);"
+              % (fts, fts, columns, old_values))
+    insert = 'INSERT INTO %s(rowid, %s) VALUES (new.id, %s);' % (fts, columns, new_values)
+    return [
+        "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', tokenize='trigram')"
+        % (fts, columns, table_name),
+        'CREATE TRIGGER %s_ai AFTER INSERT ON "%s" BEGIN %s END' % (fts, table_name, insert),
+        'CREATE TRIGGER %s_ad AFTER DELETE ON "%s" BEGIN %s END' % (fts, table_name, delete),
+        'CREATE TRIGGER %s_au AFTER UPDATE ON "%s" BEGIN %s %s END' % (fts, table_name, delete, insert),
+        "INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts),
+    ]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for table_name in ('Venue', 'Artist'):
+            for statement in fts_ddl(table_name):
+                op.execute(statement)
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table_name in ('Venue', 'Artist'):
+        for column in ('name', 'city'):
+            op.create_index('ix_%s_%s_trgm' % (table_name, column), table_name, [column],
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], postgresql_using='gin')
+    op.create_index('ix_Artist_genres_trgm', 'Artist', ['genres'],
+                    postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for table_name in ('Venue', 'Artist'):
+            fts = table_name.lower() + '_search'
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute('DROP TRIGGER IF EXISTS %s_%s' % (fts, suffix))
+            op.execute('DROP TABLE IF EXISTS %s' % fts)
+        return
+
+    op.drop_index('ix_Artist_genres_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
+    for table_name in ('Venue', 'Artist'):
+        for column in ('name', 'city'):
+            op.drop_index('ix_%s_%s_trgm' % (table_name, column), table_name=table_name)
@@ -0,0 +1,49 @@
+"""recommendations
+
+Revision ID: 9f4b2c6d8e13
+Revises: 5c8d1e7f3a90
+Create Date: 2026-10-18 23:05:51.093372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f4b2c6d8e13'
+down_revision = '5c8d1e7f3a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('venue_recommendations',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'rank')
+    )
+    op.create_index(op.f('ix_venue_recommendations_artist_id'), 'venue_recommendations', ['artist_id'], unique=False)
+    op.create_table('artist_recommendations',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'rank')
+    )
+    op.create_index(op.f('ix_artist_recommendations_venue_id'), 'artist_recommendations', ['venue_id'], unique=False)
+    # filled by `flask recommendations rebuild` or the first scheduled refresh
+
+
+def downgrade():
+    op.drop_index(op.f('ix_artist_recommendations_venue_id'), table_name='artist_recommendations')
+    op.drop_table('artist_recommendations')
+    op.drop_index(op.f('ix_venue_recommendations_artist_id'), table_name='venue_recommendations')
+    op.drop_table('venue_recommendations')
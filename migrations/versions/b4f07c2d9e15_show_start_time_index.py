@@ -0,0 +1,23 @@
+"""show start_time index
+
+Revision ID: b4f07c2d9e15
+Revises: 7d2e9f4a1c36
+Create Date: 2026-10-18 17:11:05.240517
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f07c2d9e15'
+down_revision = '7d2e9f4a1c36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Shows_start_time_id', 'Shows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Shows_start_time_id', table_name='Shows')
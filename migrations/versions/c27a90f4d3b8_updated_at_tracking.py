@@ -0,0 +1,31 @@
+"""updated_at tracking
+
+Revision ID: c27a90f4d3b8
+Revises: 8b3e5d27c941
+Create Date: 2026-10-18 11:37:02.904415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27a90f4d3b8'
+down_revision = '8b3e5d27c941'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table_name in ('Venue', 'Artist', 'Shows'):
+        op.add_column(table_name, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # existing rows are stamped with the migration time
+        op.execute(sa.table(table_name, sa.column('updated_at')).update().values(updated_at=sa.func.now()))
+        op.create_index(op.f('ix_%s_updated_at' % table_name), table_name, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table_name in ('Shows', 'Artist', 'Venue'):
+        op.drop_index(op.f('ix_%s_updated_at' % table_name), table_name=table_name)
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.drop_column('updated_at')
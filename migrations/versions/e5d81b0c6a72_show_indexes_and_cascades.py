@@ -0,0 +1,41 @@
+"""show indexes and cascades
+
+Revision ID: e5d81b0c6a72
+Revises: c27a90f4d3b8
+Create Date: 2026-10-18 13:02:55.310864
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d81b0c6a72'
+down_revision = 'c27a90f4d3b8'
+branch_labels = None
+depends_on = None
+
+# SQLite foreign keys created by the initial schema are unnamed; the naming
+# convention lets batch mode find them while it rebuilds the table.
+naming_convention = {
+    'fk': '%(table_name)s_%(column_0_name)s_fkey',
+}
+
+
+def _replace_foreign_keys(ondelete):
+    with op.batch_alter_table('Shows', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('Shows_artist_id_fkey', type_='foreignkey')
+        batch_op.drop_constraint('Shows_venue_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key('Shows_artist_id_fkey', 'Artist', ['artist_id'], ['id'], ondelete=ondelete)
+        batch_op.create_foreign_key('Shows_venue_id_fkey', 'Venue', ['venue_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+    op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows')
+    op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows')
+    _replace_foreign_keys(None)
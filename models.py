@@ -1,16 +1,190 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+import sqlite3
+from database import Database
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
-db = SQLAlchemy()
+db = Database()
 
-Shows = db.Table("Shows",
-                 db.Column("id", db.Integer, primary_key=True),
-                 db.Column("artist_id", db.Integer, db.ForeignKey("Artist.id")),
-                 db.Column("venue_id", db.Integer, db.ForeignKey("Venue.id")),
-                 db.Column("start_time", db.DateTime, default=datetime.utcnow()))
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only honours ON DELETE CASCADE with foreign keys switched on
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, name):
+        # used by the `genres` proxies, so assigning a list of names reuses
+        # the existing rows
+        for pending in db.session.new:
+            if isinstance(pending, cls) and pending.name == name:
+                return pending
+        with db.session.no_autoflush:
+            return cls.query.filter_by(name=name).first() or cls(name=name)
+
+
+# (genre_id, <entity>_id) indexes serve the ?genre= listing filters
+venue_genres = db.Table('venue_genres',
+                        db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                                  primary_key=True),
+                        db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'),
+                                  primary_key=True),
+                        db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+                         db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                                   primary_key=True),
+                         db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'),
+                                   primary_key=True),
+                         db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'))
+
+
+class Show(db.Model):
+    __tablename__ = 'Shows'
+    __table_args__ = (
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows?from=&to= range scans in (start_time, id) cursor order
+        db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'))
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'))
+    start_time = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Relationships never load implicitly (lazy='raise'): a view that needs
+    # them asks for them with joinedload()/selectinload() options. Deleting a
+    # venue or artist leaves its shows to the ON DELETE cascade.
+    venue = db.relationship('Venue', lazy='raise',
+                            backref=db.backref('shows', lazy='raise', passive_deletes=True))
+    artist = db.relationship('Artist', lazy='raise',
+                             backref=db.backref('shows', lazy='raise', passive_deletes=True))
+
+
+# Show counts per venue/artist, maintained by summaries.py. "Upcoming" is as
+# of updated_at; the roll job recounts the rows whose next_show has started.
+venue_show_summary = db.Table('venue_show_summary',
+                              db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                                        primary_key=True),
+                              db.Column('upcoming_shows', db.Integer, nullable=False, default=0),
+                              db.Column('past_shows', db.Integer, nullable=False, default=0),
+                              db.Column('next_show', db.DateTime, index=True),
+                              db.Column('updated_at', db.DateTime, nullable=False, index=True))
+
+artist_show_summary = db.Table('artist_show_summary',
+                               db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                                         primary_key=True),
+                               db.Column('upcoming_shows', db.Integer, nullable=False, default=0),
+                               db.Column('past_shows', db.Integer, nullable=False, default=0),
+                               db.Column('next_show', db.DateTime, index=True),
+                               db.Column('updated_at', db.DateTime, nullable=False, index=True))
+
+# Top-K matches per venue/artist, ranked, from recommendations.py. The
+# detail pages read them by primary key prefix.
+venue_recommendations = db.Table('venue_recommendations',
+                                 db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                                           primary_key=True),
+                                 db.Column('rank', db.Integer, primary_key=True, autoincrement=False),
+                                 db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                                           nullable=False, index=True),
+                                 db.Column('score', db.Float, nullable=False),
+                                 db.Column('updated_at', db.DateTime, nullable=False))
+
+artist_recommendations = db.Table('artist_recommendations',
+                                  db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'),
+                                            primary_key=True),
+                                  db.Column('rank', db.Integer, primary_key=True, autoincrement=False),
+                                  db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'),
+                                            nullable=False, index=True),
+                                  db.Column('score', db.Float, nullable=False),
+                                  db.Column('updated_at', db.DateTime, nullable=False))
+
+# Shows per day, week and month (`period` 'day'/'week'/'month', `bucket` its
+# first day) per venue, artist, state and genre in a state, from
+# analytics.py, with the count of the bucket before and the difference
+# (`trend`). The (period, bucket, shows|trend, id) indexes give the busiest
+# and trending venues/artists of a bucket without sorting. There are no
+# foreign keys: the rows of a deleted venue or artist go with the next
+# refresh of the days it had shows on, and reads join the names.
+venue_show_rollup = db.Table('venue_show_rollup',
+                             db.Column('period', db.String(5), primary_key=True),
+                             db.Column('bucket', db.Date, primary_key=True),
+                             db.Column('venue_id', db.Integer, primary_key=True, autoincrement=False),
+                             db.Column('shows', db.Integer, nullable=False),
+                             db.Column('previous_shows', db.Integer, nullable=False),
+                             db.Column('trend', db.Integer, nullable=False),
+                             db.Index('ix_venue_show_rollup_shows', 'period', 'bucket', 'shows', 'venue_id'),
+                             db.Index('ix_venue_show_rollup_trend', 'period', 'bucket', 'trend', 'venue_id'))
+
+artist_show_rollup = db.Table('artist_show_rollup',
+                              db.Column('period', db.String(5), primary_key=True),
+                              db.Column('bucket', db.Date, primary_key=True),
+                              db.Column('artist_id', db.Integer, primary_key=True, autoincrement=False),
+                              db.Column('shows', db.Integer, nullable=False),
+                              db.Column('previous_shows', db.Integer, nullable=False),
+                              db.Column('trend', db.Integer, nullable=False),
+                              db.Index('ix_artist_show_rollup_shows', 'period', 'bucket', 'shows', 'artist_id'),
+                              db.Index('ix_artist_show_rollup_trend', 'period', 'bucket', 'trend', 'artist_id'))
+
+state_show_rollup = db.Table('state_show_rollup',
+                             db.Column('period', db.String(5), primary_key=True),
+                             db.Column('bucket', db.Date, primary_key=True),
+                             db.Column('state', db.String(120), primary_key=True),
+                             db.Column('shows', db.Integer, nullable=False),
+                             db.Column('previous_shows', db.Integer, nullable=False),
+                             db.Column('trend', db.Integer, nullable=False))
+
+# a show counts once for every genre of its artist
+genre_show_rollup = db.Table('genre_show_rollup',
+                             db.Column('period', db.String(5), primary_key=True),
+                             db.Column('bucket', db.Date, primary_key=True),
+                             db.Column('state', db.String(120), primary_key=True),
+                             db.Column('genre_id', db.Integer, primary_key=True, autoincrement=False),
+                             db.Column('shows', db.Integer, nullable=False),
+                             db.Column('previous_shows', db.Integer, nullable=False),
+                             db.Column('trend', db.Integer, nullable=False))
+
+# days that lost shows (deleted, or moved to another day) since the last
+# rollup refresh; the days that gained shows are found through
+# Shows.updated_at
+show_rollup_days = db.Table('show_rollup_days',
+                            db.Column('id', db.Integer, primary_key=True),
+                            db.Column('day', db.Date, nullable=False))
+
+# Background jobs (see jobs.py). Rows are written in the transaction of the
+# request that needs them and claimed by workers in (run_at, id) order;
+# `key` is unique so a periodic job is only queued once per interval.
+jobs = db.Table('jobs',
+                db.Column('id', db.Integer, primary_key=True),
+                db.Column('name', db.String(120), nullable=False),
+                db.Column('args', db.Text, nullable=False, default='{}'),
+                db.Column('key', db.String(200), unique=True),
+                db.Column('status', db.String(20), nullable=False, default='queued'),
+                db.Column('attempts', db.Integer, nullable=False, default=0),
+                db.Column('max_attempts', db.Integer, nullable=False, default=1),
+                db.Column('run_at', db.DateTime, nullable=False),
+                db.Column('created_at', db.DateTime, nullable=False),
+                db.Column('started_at', db.DateTime),
+                db.Column('finished_at', db.DateTime, index=True),
+                db.Column('locked_by', db.String(120)),
+                db.Column('error', db.Text),
+                db.Index('ix_jobs_status_run_at', 'status', 'run_at'))
 
 
 class Venue(db.Model):
@@ -24,13 +198,20 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String()))
     seeking_talent = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String())
     website_link = db.Column(db.String(500))
-    artists = db.relationship("Artist", secondary=Shows,
-                             backref=db.backref('Venue',
-                                                 cascade="all,delete"), lazy='joined')
+    # placed from city/state by geo.py; geohash is the 45 bit geohash of the
+    # point as an integer, for radius queries
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.BigInteger, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Show rows are owned by the Show model; these are read-only shortcuts
+    artists = db.relationship("Artist", secondary="Shows", lazy='raise', viewonly=True)
+    genre_objects = db.relationship(Genre, secondary=venue_genres, lazy='selectin', passive_deletes=True,
+                                    order_by=Genre.name)
+    genres = association_proxy('genre_objects', 'name', creator=Genre.named)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -43,13 +224,25 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     website_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    venues = db.relationship("Venue", secondary=Shows, backref="Artist", lazy='joined')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    venues = db.relationship("Venue", secondary="Shows", lazy='raise', viewonly=True)
+    genre_objects = db.relationship(Genre, secondary=artist_genres, lazy='selectin', passive_deletes=True,
+                                    order_by=Genre.name)
+    genres = association_proxy('genre_objects', 'name', creator=Genre.named)
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_updated_at(session, flush_context, instances):
+    # a genre-only edit changes no Venue/Artist column, so onupdate would
+    # not fire and the page validators would miss it
+    for instance in session.dirty:
+        if isinstance(instance, (Venue, Artist)) and session.is_modified(instance):
+            instance.updated_at = datetime.utcnow()
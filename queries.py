@@ -0,0 +1,400 @@
+from datetime import datetime
+from itertools import groupby
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, venue_show_summary, \
+    artist_show_summary, venue_recommendations, artist_recommendations
+from geo import within
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+
+YIELD_PER = 100
+
+
+class Page(object):
+    # Lazily iterates at most `limit` rows of an ordered query. Rows are
+    # fetched in batches of YIELD_PER, so a page can be streamed to the client
+    # without materialising it. Once iteration is done `next` holds the cursor
+    # of the following page, or None on the last page.
+
+    def __init__(self, query, limit, cursor, serialize):
+        self.query = query
+        self.limit = limit
+        self.cursor = cursor
+        self.serialize = serialize
+        self.next = None
+
+    def __iter__(self):
+        self.next = None
+        query = self.query
+        if self.limit:
+            query = query.limit(self.limit + 1)
+        last = None
+        for n, row in enumerate(query.yield_per(YIELD_PER)):
+            if self.limit and n == self.limit:
+                self.next = self.cursor(last)
+                break
+            last = row
+            yield self.serialize(row)
+
+
+class Fetched(list):
+    # a page read to the end, e.g. on a query worker thread (see aio.py),
+    # that can be rendered after its session is gone
+
+    def __init__(self, page):
+        list.__init__(self, page)
+        self.next = page.next
+
+
+class Days(object):
+    # groups a page of shows (ordered by start time) by day
+
+    def __init__(self, page):
+        self.page = page
+
+    @property
+    def next(self):
+        return self.page.next
+
+    def __iter__(self):
+        for day, shows in groupby(self.page, key=lambda show: show["start_time"].date()):
+            yield {"date": day, "shows": list(shows)}
+
+
+class Areas(object):
+    # groups a page of venue rows (ordered by state, city) into areas
+
+    def __init__(self, page):
+        self.page = page
+
+    @property
+    def next(self):
+        return self.page.next
+
+    def __iter__(self):
+        for (city, state), venues in groupby(self.page, key=lambda row: (row.city, row.state)):
+            yield {"city": city, "state": state,
+                   "venues": [{"id": venue.id, "name": venue.name, "updated_at": venue.updated_at,
+                               "num_upcoming_shows": venue.num_upcoming_shows}
+                              for venue in venues]}
+
+
+# ----------------------------------------------------------------------------#
+# Listings.
+# ----------------------------------------------------------------------------#
+
+def venue_areas(after=None, limit=None, genre=None, near=None):
+    # areas -> venues -> number of upcoming shows, in a single round trip.
+    # The counts come from venue_show_summary (see summaries.py); venues
+    # without shows have no summary row and count 0. `near` is a (latitude,
+    # longitude, radius_km) to keep to the venues around a point (geo.py).
+    summary = venue_show_summary
+    query = (db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.updated_at,
+                              db.func.coalesce(summary.c.upcoming_shows, 0).label("num_upcoming_shows"))
+             .outerjoin(summary, summary.c.venue_id == Venue.id)
+             .order_by(Venue.state, Venue.city, Venue.id))
+    if genre:
+        query = query.filter(Venue.id.in_(_with_genre(venue_genres.c.venue_id, venue_genres.c.genre_id, genre)))
+    if near:
+        query = query.filter(within(*near))
+    if after is not None:
+        last = db.session.query(Venue.state, Venue.city).filter(Venue.id == after).first()
+        if last is not None:
+            query = query.filter(db.or_(Venue.state > last.state,
+                                        db.and_(Venue.state == last.state, Venue.city > last.city),
+                                        db.and_(Venue.state == last.state, Venue.city == last.city,
+                                                Venue.id > after)))
+    return Areas(Page(query, limit, lambda row: row.id, lambda row: row))
+
+
+def artist_list(after=None, limit=None, genre=None):
+    query = db.session.query(Artist.id, Artist.name, Artist.updated_at).order_by(Artist.id)
+    if genre:
+        # walks ix_artist_genres_genre_id_artist_id in artist id order
+        query = (query.join(artist_genres, artist_genres.c.artist_id == Artist.id)
+                 .join(Genre, Genre.id == artist_genres.c.genre_id)
+                 .filter(Genre.name == genre))
+    if after is not None:
+        query = query.filter(Artist.id > after)
+    return Page(query, limit, lambda row: row.id,
+                lambda row: {"id": row.id, "name": row.name, "updated_at": row.updated_at})
+
+
+def _with_genre(entity_column, genre_column, genre):
+    return (db.select([entity_column])
+            .where(genre_column == db.select([Genre.id]).where(Genre.name == genre).as_scalar()))
+
+
+def show_list(after=None, limit=None, start=None, end=None, city=None, state=None, genre=None, near=None):
+    # shows in start time order, optionally within [start, end) at venues of
+    # a city/state or around a point (`near`, see venue_areas) or by artists
+    # of a genre. `after` is a (start_time, id) cursor; the range is served
+    # by ix_Shows_start_time_id, or by ix_Shows_venue_id_start_time under the
+    # venues of the city/state/area.
+    query = (db.session.query(Show.id, Show.start_time, Show.updated_at, Venue.id.label("venue_id"),
+                              Venue.name.label("venue_name"), Venue.updated_at.label("venue_updated_at"),
+                              Artist.id.label("artist_id"), Artist.name.label("artist_name"),
+                              Artist.image_link.label("artist_image_link"),
+                              Artist.updated_at.label("artist_updated_at"))
+             .join(Venue, Venue.id == Show.venue_id)
+             .join(Artist, Artist.id == Show.artist_id)
+             .order_by(Show.start_time, Show.id))
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if city:
+        query = query.filter(Venue.city == city)
+    if state:
+        query = query.filter(Venue.state == state)
+    if near:
+        query = query.filter(within(*near))
+    if genre:
+        query = query.filter(Show.artist_id.in_(_with_genre(artist_genres.c.artist_id, artist_genres.c.genre_id, genre)))
+    cursor = decode_show_cursor(after)
+    if cursor:
+        query = query.filter(db.or_(Show.start_time > cursor[0],
+                                    db.and_(Show.start_time == cursor[0], Show.id > cursor[1])))
+    return Page(query, limit, lambda row: encode_show_cursor(row.start_time, row.id),
+                lambda row: {"id": row.id, "venue_id": row.venue_id, "venue_name": row.venue_name,
+                             "artist_id": row.artist_id, "artist_name": row.artist_name,
+                             "artist_image_link": row.artist_image_link,
+                             "start_time": row.start_time, "updated_at": row.updated_at,
+                             "venue_updated_at": row.venue_updated_at,
+                             "artist_updated_at": row.artist_updated_at})
+
+
+# ----------------------------------------------------------------------------#
+# Detail pages.
+# ----------------------------------------------------------------------------#
+
+def venue_detail(venue_id):
+    # the venue's own fields as rendered on its page (and by the API)
+    venue = Venue.query.filter_by(id=venue_id).first()
+    if venue is None:
+        return None
+    return {"id": venue.id, "name": venue.name, "genres": list(venue.genres), "address": venue.address,
+            "city": venue.city, "state": venue.state, "phone": venue.phone,
+            "website": venue.website_link,
+            "facebook_link": venue.facebook_link, "seeking_talent": venue.seeking_talent,
+            "seeking_description": venue.seeking_description, "image_link": venue.image_link}
+
+
+def artist_detail(artist_id):
+    artist = Artist.query.filter_by(id=artist_id).first()
+    if artist is None:
+        return None
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": list(artist.genres),
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "facebook_link": artist.facebook_link,
+        "website": artist.website_link,
+        "image_link": artist.image_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+    }
+
+
+def recommended_artists(venue_id):
+    # the artists the venue could book, best first (see recommendations.py)
+    return _recommended(Artist, venue_recommendations, venue_recommendations.c.venue_id == venue_id,
+                        venue_recommendations.c.artist_id)
+
+
+def recommended_venues(artist_id):
+    return _recommended(Venue, artist_recommendations, artist_recommendations.c.artist_id == artist_id,
+                        artist_recommendations.c.venue_id)
+
+
+def _recommended(model, table, criterion, target_column):
+    rows = (db.session.query(model.id, model.name, model.updated_at, table.c.score)
+            .join(table, target_column == model.id)
+            .filter(criterion)
+            .order_by(table.c.rank))
+    return [{"id": row.id, "name": row.name, "updated_at": row.updated_at, "score": row.score} for row in rows]
+
+
+# ----------------------------------------------------------------------------#
+# Detail page shows.
+# ----------------------------------------------------------------------------#
+
+def venue_shows(venue_id, now=None, past_limit=None, past_before=None, upcoming=True, past=True):
+    # upcoming/past shows of a venue together with the performing artist.
+    return _split_shows(Artist, Show.artist_id, Show.venue_id == venue_id, "artist",
+                        now, past_limit, past_before, upcoming, past,
+                        venue_show_summary, venue_show_summary.c.venue_id == venue_id)
+
+
+def artist_shows(artist_id, now=None, past_limit=None, past_before=None, upcoming=True, past=True):
+    # upcoming/past shows of an artist together with the hosting venue.
+    return _split_shows(Venue, Show.venue_id, Show.artist_id == artist_id, "venue",
+                        now, past_limit, past_before, upcoming, past,
+                        artist_show_summary, artist_show_summary.c.artist_id == artist_id)
+
+
+def encode_show_cursor(start_time, show_id):
+    return "%s_%d" % (start_time.isoformat(), show_id)
+
+
+def decode_show_cursor(cursor):
+    try:
+        start_time, show_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _split_shows(entity, join_column, criterion, prefix, now, past_limit, past_before, upcoming, past,
+                 summary, summary_criterion):
+    # upcoming=False / past=False leave that half out, so both halves can be
+    # fetched concurrently by the async views
+    now = now or datetime.utcnow()
+    query = (db.session.query(Show.id, Show.start_time, Show.updated_at, entity.id, entity.name,
+                              entity.image_link, entity.updated_at)
+             .join(entity, entity.id == join_column)
+             .filter(criterion))
+
+    def show(row):
+        return {"id": row[0], prefix + "_id": row[3], prefix + "_name": row[4], prefix + "_image_link": row[5],
+                "start_time": row.start_time, "updated_at": row[2], prefix + "_updated_at": row[6]}
+
+    result = {}
+    if upcoming and past and not past_limit and not past_before:
+        # whole history in one round trip, split in a single pass
+        result.update(upcoming_shows=[], past_shows=[], past_shows_next=None)
+        for row in query.order_by(Show.start_time).all():
+            if row.start_time >= now:
+                result["upcoming_shows"].append(show(row))
+            else:
+                result["past_shows"].append(show(row))
+        result["past_shows"].reverse()
+        result["upcoming_shows_count"] = len(result["upcoming_shows"])
+        result["past_shows_count"] = len(result["past_shows"])
+        return result
+
+    if upcoming:
+        rows = query.filter(Show.start_time >= now).order_by(Show.start_time, Show.id).all()
+        result["upcoming_shows"] = [show(row) for row in rows]
+        result["upcoming_shows_count"] = len(rows)
+    if not past:
+        return result
+
+    # bounded past history: keyset page on (start_time, id), newest first
+    rows = query.filter(Show.start_time < now)
+    cursor = decode_show_cursor(past_before)
+    if cursor:
+        rows = rows.filter(db.or_(Show.start_time < cursor[0],
+                                  db.and_(Show.start_time == cursor[0], Show.id < cursor[1])))
+    rows = rows.order_by(Show.start_time.desc(), Show.id.desc())
+    if past_limit:
+        rows = rows.limit(past_limit + 1)
+    rows = rows.all()
+    result["past_shows_next"] = None
+    if past_limit and len(rows) > past_limit:
+        rows = rows[:past_limit]
+        result["past_shows_next"] = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+
+    if past_limit or past_before:
+        result["past_shows_count"] = _past_count(summary, summary_criterion, criterion, now,
+                                                 result.get("upcoming_shows_count"))
+    else:
+        result["past_shows_count"] = len(rows)
+    result["past_shows"] = [show(row) for row in rows]
+    return result
+
+
+def _past_count(summary, summary_criterion, criterion, now, upcoming_count):
+    # from the summary row: every show not upcoming right now is past, and
+    # the summary total only moves when shows are added or removed
+    row = db.session.query(summary.c.upcoming_shows, summary.c.past_shows, summary.c.next_show) \
+        .filter(summary_criterion).first()
+    if row is None:
+        return 0
+    if upcoming_count is not None:
+        return row.upcoming_shows + row.past_shows - upcoming_count
+    if row.next_show is None or row.next_show >= now:
+        return row.past_shows
+    # shows started since the last roll
+    return (db.session.query(db.func.count(Show.id))
+            .filter(criterion, Show.start_time < now)
+            .scalar())
+
+
+# ----------------------------------------------------------------------------#
+# Validators.
+# ----------------------------------------------------------------------------#
+
+# Each *_version() function returns (last_modified, token) for a page from a
+# single indexed aggregate query; the token changes whenever the rendered
+# page would. Row counts catch deletes, which leave no updated_at behind.
+# Shows are only ever deleted together with their venue or artist, so the
+# (large) Shows table never needs counting.
+
+def venues_version():
+    return _listing_version((Venue, True), (venue_show_summary, False))
+
+
+def artists_version():
+    return _listing_version((Artist, True))
+
+
+def shows_version():
+    return _listing_version((Show, False), (Venue, True), (Artist, True))
+
+
+def venue_version(venue_id, now=None):
+    return _detail_version(Venue, venue_id, Show.venue_id, Artist, Show.artist_id, now,
+                           venue_recommendations, venue_recommendations.c.venue_id,
+                           venue_recommendations.c.artist_id)
+
+
+def artist_version(artist_id, now=None):
+    return _detail_version(Artist, artist_id, Show.artist_id, Venue, Show.venue_id, now,
+                           artist_recommendations, artist_recommendations.c.artist_id,
+                           artist_recommendations.c.venue_id)
+
+
+def _listing_version(*tables):
+    columns = []
+    for table, counted in tables:
+        table = getattr(table, '__table__', table)
+        columns.append(db.select([db.func.max(table.c.updated_at)]).as_scalar())
+        if counted:
+            columns.append(db.select([db.func.count()]).select_from(table).as_scalar())
+    row = db.session.query(*columns).one()
+    last_modified = max((value for value in row if isinstance(value, datetime)), default=None)
+    return last_modified, tuple(row)
+
+
+def _detail_version(model, entity_id, show_column, other, other_column, now, recommendations, subject_column,
+                    target_column):
+    # the newest past start_time is part of the validators: a show moving
+    # from upcoming to past changes the page without touching any row. So
+    # are the recommendation list and the rows it links to.
+    now = now or datetime.utcnow()
+    recommended = other.__table__.alias()
+    row = (db.session.query(model.updated_at,
+                            db.func.count(Show.id),
+                            db.func.max(Show.updated_at),
+                            db.func.max(other.updated_at),
+                            db.func.max(db.case([(Show.start_time < now, Show.start_time)])),
+                            db.select([db.func.max(recommendations.c.updated_at)])
+                            .where(subject_column == entity_id).as_scalar(),
+                            db.select([db.func.max(recommended.c.updated_at)])
+                            .select_from(recommendations.join(recommended, recommended.c.id == target_column))
+                            .where(subject_column == entity_id).as_scalar())
+           .outerjoin(Show, show_column == model.id)
+           .outerjoin(other, other.id == other_column)
+           .filter(model.id == entity_id)
+           .group_by(model.id, model.updated_at)
+           .first())
+    if row is None:
+        return None
+    last_modified = max((value for value in row if isinstance(value, datetime)), default=None)
+    return last_modified, tuple(row)
@@ -0,0 +1,368 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import (db, Venue, Artist, Show, venue_genres, artist_genres, venue_show_summary, artist_show_summary,
+                    venue_recommendations, artist_recommendations)
+from jobs import task, last_done
+from cache import pages_changed
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+logger = logging.getLogger('fyyur.recommendations')
+
+
+# ----------------------------------------------------------------------------#
+# Scoring.
+# ----------------------------------------------------------------------------#
+
+# Every venue gets the artists it could book and every artist the venues it
+# could play, scored on
+#   genre    - Jaccard overlap of the genre lists
+#   location - 1 in the same city, 0.5 in the same state
+#   history  - the co-booking graph: how often the venues most like this one
+#              (cosine over the artists they booked) booked the artist, and
+#              the other way round; scaled to 1 per subject
+# weighted by RECOMMENDATION_WEIGHTS. Location alone recommends nothing,
+# pairs that already have a show are left out, and the other side seeking a
+# venue/talent multiplies the score by 1 + RECOMMENDATION_SEEKING_BOOST.
+#
+# Scores are computed with numpy/scipy over sparse genre and booking
+# matrices, a block of subjects at a time, and the top RECOMMENDATION_TOP_K
+# of each subject are stored. The pages read them by primary key.
+
+# subjects per block are chosen to keep each block's matrices under this
+# many cells
+BLOCK_CELLS = 2000000
+# largest targets x targets co-booking matrix computed up front
+TARGET_PAIRS = 25000000
+# writes committed shortly after the previous refresh started are covered
+# by the next one
+OVERLAP = timedelta(minutes=1)
+CHUNK = 1000
+
+
+class Side(object):
+    # the venues or the artists, in id order, as arrays
+
+    def __init__(self, model, association, key, seeking, places, states):
+        self.model, self.association, self.key, self.seeking_column = model, association, key, seeking
+        self.places, self.state_codes = places, states
+        rows = self._rows()
+        self.ids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+        self.index = dict((id_, n) for n, id_ in enumerate(self.ids.tolist()))
+        self.cities = numpy.array([self._city(row) for row in rows], dtype=numpy.int64)
+        self.states = numpy.array([self._state(row) for row in rows], dtype=numpy.int64)
+        self.seeking = numpy.array([bool(row[3]) for row in rows], dtype=bool)
+        links = [(self.index[row[0]], row[1]) for row in db.session.execute(
+            db.select([association.c[key], association.c.genre_id])) if row[0] in self.index]
+        self.genres = _matrix(links, (len(self.ids), max([genre for _, genre in links], default=0) + 1))
+        self.genre_counts = numpy.asarray(self.genres.sum(axis=1)).ravel()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self, ids=None):
+        query = db.session.query(self.model.id, self.model.city, self.model.state, self.seeking_column)
+        if ids is not None:
+            query = query.filter(self.model.id.in_(ids))
+        return query.order_by(self.model.id).all()
+
+    def _city(self, row):
+        return _code(self.places, ((row[2] or '').upper(), (row[1] or '').strip().lower())) \
+            if row[1] and row[2] else -1
+
+    def _state(self, row):
+        return _code(self.state_codes, (row[2] or '').upper()) if row[2] else -1
+
+    def update(self, ids):
+        # rereads the rows of `ids` (edited in place, new ones appended);
+        # False when the arrays cannot take the change and the model has to
+        # be loaded again: a row was deleted, a new id sorts before loaded
+        # ones, or a genre is newer than the genre columns
+        ids = sorted(set(ids))
+        rows, genres = [], {}
+        for offset in range(0, len(ids), CHUNK):
+            chunk = ids[offset:offset + CHUNK]
+            rows.extend(self._rows(chunk))
+            for id_, genre in db.session.execute(db.select([self.association.c[self.key], self.association.c.genre_id])
+                                                 .where(self.association.c[self.key].in_(chunk))):
+                genres.setdefault(id_, []).append(genre)
+        new = [row[0] for row in rows if row[0] not in self.index]
+        if len(rows) < len(ids) or (new and len(self) and new[0] <= self.ids[-1]):
+            return False
+        if any(genre >= self.genres.shape[1] for values in genres.values() for genre in values):
+            return False
+        if new:
+            self.index.update((id_, n) for n, id_ in enumerate(new, len(self)))
+            self.ids = numpy.concatenate([self.ids, numpy.array(new, dtype=numpy.int64)])
+            self.cities = numpy.concatenate([self.cities, numpy.full(len(new), -1, dtype=numpy.int64)])
+            self.states = numpy.concatenate([self.states, numpy.full(len(new), -1, dtype=numpy.int64)])
+            self.seeking = numpy.concatenate([self.seeking, numpy.zeros(len(new), dtype=bool)])
+            self.genres = numpy.vstack([self.genres, numpy.zeros((len(new), self.genres.shape[1]),
+                                                                 dtype=self.genres.dtype)])
+            self.genre_counts = numpy.concatenate([self.genre_counts, numpy.zeros(len(new),
+                                                                                  dtype=self.genre_counts.dtype)])
+        for row in rows:
+            n = self.index[row[0]]
+            self.cities[n], self.states[n], self.seeking[n] = self._city(row), self._state(row), bool(row[3])
+            self.genres[n] = 0
+            self.genres[n, genres.get(row[0], [])] = 1
+            self.genre_counts[n] = self.genres[n].sum()
+        # rows deleted since the model was loaded are still in it
+        return db.session.query(db.func.count(self.model.id)).scalar() == len(self)
+
+
+def _code(codes, value):
+    return codes.setdefault(value, len(codes))
+
+
+def _matrix(pairs, shape):
+    # binary CSR matrix with a 1 at every (row, column) pair
+    if not pairs:
+        return sparse.csr_matrix(shape, dtype=numpy.float32)
+    rows, columns = zip(*pairs)
+    matrix = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.float32), (rows, columns)), shape=shape)
+    matrix.data[:] = 1
+    return matrix
+
+
+def _normalized(matrix):
+    # rows scaled to unit length, for cosine similarity
+    norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def _co_bookings(booked):
+    # rows -> dense co-booking scores N[rows] N' B (N: `booked` with unit
+    # rows), and the widest matrix that takes per row. N' B (targets x
+    # targets) is computed once when it is small enough, otherwise each
+    # block goes through its subjects x subjects similarities.
+    normalized = _normalized(booked)
+    if booked.shape[1] ** 2 <= TARGET_PAIRS:
+        targets = normalized.T.dot(booked).tocsr()
+        return (lambda rows: normalized[rows].dot(targets).toarray()), booked.shape[1]
+    return (lambda rows: normalized[rows].dot(normalized.T).dot(booked).toarray()), max(booked.shape)
+
+
+class Model(object):
+    # everything a scoring run reads, loaded once per run
+
+    def __init__(self):
+        places, states = {}, {}
+        self.venues = Side(Venue, venue_genres, 'venue_id', Venue.seeking_talent, places, states)
+        self.artists = Side(Artist, artist_genres, 'artist_id', Artist.seeking_venue, places, states)
+        pairs = [(self.venues.index[venue_id], self.artists.index[artist_id]) for venue_id, artist_id in
+                 db.session.execute(db.select([Show.venue_id, Show.artist_id]).distinct())
+                 if venue_id in self.venues.index and artist_id in self.artists.index]
+        # venues x artists, 1 where they have a show together
+        self.booked = _matrix(pairs, (len(self.venues), len(self.artists)))
+        width = max(self.venues.genres.shape[1], self.artists.genres.shape[1])
+        # there are few genres: dense rows make the overlap a BLAS product
+        for side in (self.venues, self.artists):
+            side.genres.resize((len(side), width))
+            side.genres = side.genres.toarray()
+        config = current_app.config
+        self.weights = config['RECOMMENDATION_WEIGHTS']
+        self.boost = config['RECOMMENDATION_SEEKING_BOOST']
+        self.top_k = config['RECOMMENDATION_TOP_K']
+
+    def update(self, venue_ids, artist_ids):
+        # brings a model loaded by an earlier run up to date with the venues
+        # and artists that changed since (see stale()); False when it has to
+        # be loaded again instead, see Side.update
+        if not (self.venues.update(venue_ids) and self.artists.update(artist_ids)):
+            return False
+        # the bookings of the changed venues and artists are read again
+        shape = (len(self.venues), len(self.artists))
+        keep_rows, keep_columns = numpy.ones(shape[0], dtype=numpy.float32), numpy.ones(shape[1], dtype=numpy.float32)
+        keep_rows[[self.venues.index[id_] for id_ in venue_ids]] = 0
+        keep_columns[[self.artists.index[id_] for id_ in artist_ids]] = 0
+        pairs = set()
+        for column, ids in ((Show.venue_id, sorted(venue_ids)), (Show.artist_id, sorted(artist_ids))):
+            for offset in range(0, len(ids), CHUNK):
+                pairs.update((self.venues.index[venue_id], self.artists.index[artist_id]) for venue_id, artist_id in
+                             db.session.execute(db.select([Show.venue_id, Show.artist_id]).distinct()
+                                                .where(column.in_(ids[offset:offset + CHUNK])))
+                             if venue_id in self.venues.index and artist_id in self.artists.index)
+        self.booked.resize(shape)
+        self.booked = (sparse.diags(keep_rows).dot(self.booked).dot(sparse.diags(keep_columns))
+                       + _matrix(list(pairs), shape)).tocsr()
+        self.booked.eliminate_zeros()
+        self.booked.data[:] = 1
+        return True
+
+    def directions(self):
+        # (subjects, targets, subjects x targets bookings, table, subject key, target key)
+        booked_t = self.booked.T.tocsr()
+        return [(self.venues, self.artists, self.booked, venue_recommendations, 'venue_id', 'artist_id'),
+                (self.artists, self.venues, booked_t, artist_recommendations, 'artist_id', 'venue_id')]
+
+    def score(self, subjects, targets, booked, similar, rows):
+        # dense (len(rows) x len(targets)) scores of the subjects at `rows`
+        weights = self.weights
+        overlap = subjects.genres[rows].dot(targets.genres.T)
+        union = subjects.genre_counts[rows][:, None] + targets.genre_counts[None, :] - overlap
+        genre = numpy.divide(overlap, union, out=numpy.zeros_like(overlap), where=union > 0)
+        same_city = (subjects.cities[rows][:, None] == targets.cities[None, :]) & (targets.cities >= 0)[None, :]
+        same_state = (subjects.states[rows][:, None] == targets.states[None, :]) & (targets.states >= 0)[None, :]
+        location = numpy.where(same_city, 1.0, numpy.where(same_state, 0.5, 0.0)).astype(numpy.float32)
+        history = similar(rows)
+        peaks = history.max(axis=1, initial=0)
+        history /= numpy.where(peaks > 0, peaks, 1)[:, None]
+        scores = weights['genre'] * genre + weights['location'] * location + weights['history'] * history
+        scores[(genre == 0) & (history == 0)] = 0
+        scores *= numpy.where(targets.seeking, 1 + self.boost, 1.0)[None, :]
+        scores[booked[rows].toarray() > 0] = 0
+        return scores
+
+    def top(self, scores):
+        # per row: (column, score) of the best top_k positive scores
+        k = min(self.top_k, scores.shape[1])
+        if k == 0:
+            return [[] for _ in range(scores.shape[0])]
+        best = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = numpy.take_along_axis(scores, best, axis=1)
+        order = numpy.argsort(-best_scores, axis=1, kind='stable')
+        best, best_scores = numpy.take_along_axis(best, order, axis=1), numpy.take_along_axis(best_scores, order, axis=1)
+        return [[(column, score) for column, score in zip(columns, values) if score > 0]
+                for columns, values in zip(best.tolist(), best_scores.tolist())]
+
+
+def recompute(model, venue_ids=None, artist_ids=None):
+    # rewrites the recommendations of the given venues and artists (all of
+    # them for None); returns the number of subjects recomputed
+    now = datetime.utcnow()
+    done = 0
+    for (subjects, targets, booked, table, key, target_key), ids in zip(model.directions(), (venue_ids, artist_ids)):
+        if ids is None:
+            rows = numpy.arange(len(subjects))
+            db.session.execute(table.delete())
+        else:
+            rows = numpy.array(sorted(subjects.index[id_] for id_ in set(ids) if id_ in subjects.index),
+                               dtype=numpy.int64)
+        if not len(rows) or not len(targets):
+            continue
+        similar, width = _co_bookings(booked)
+        block = max(1, BLOCK_CELLS // width)
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            chunk_ids = subjects.ids[chunk].tolist()
+            if ids is not None:
+                db.session.execute(table.delete().where(table.c[key].in_(chunk_ids)))
+            best = model.top(model.score(subjects, targets, booked, similar, chunk))
+            values = [{key: subject_id, 'rank': rank, target_key: int(targets.ids[column]),
+                       'score': round(score, 4), 'updated_at': now}
+                      for subject_id, pairs in zip(chunk_ids, best) for rank, (column, score) in enumerate(pairs, 1)]
+            for offset in range(0, len(values), CHUNK):
+                db.session.execute(table.insert(), values[offset:offset + CHUNK])
+            done += len(chunk)
+    if done:
+        pages_changed(db.session)
+    return done
+
+
+def stale(since):
+    # venues and artists edited, or whose shows changed, since `since`
+    def changed(model, summary, key):
+        ids = set(row[0] for row in db.session.query(model.id).filter(model.updated_at >= since))
+        ids.update(row[0] for row in db.session.execute(
+            db.select([summary.c[key]]).where(summary.c.updated_at >= since)))
+        return ids
+    return (changed(Venue, venue_show_summary, 'venue_id'),
+            changed(Artist, artist_show_summary, 'artist_id'))
+
+
+def last_run():
+    # start of the newest refresh or rebuild that finished
+    return last_done(('recommendations.refresh', 'recommendations.rebuild'))
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+# `recommendations.refresh` (every RECOMMENDATION_REFRESH_INTERVAL seconds)
+# recomputes the venues and artists that changed, or had shows added, moved
+# or deleted, since the last run; `recommendations.rebuild` (daily)
+# recomputes all of them, which also picks up changes on the other side of
+# each list.
+#
+# Loading the model reads every venue, artist, genre link and booked pair,
+# so the process running the jobs keeps it between runs (a few arrays per
+# venue and artist, and the booked pairs) and a refresh only rereads the
+# rows that changed since it was last brought up to date. It is loaded
+# again when Model.update cannot patch it, e.g. after a delete.
+
+_kept = {'model': None, 'as_of': None}
+_kept_lock = threading.Lock()
+
+
+def kept_model():
+    # the model kept by an earlier run, brought up to date, or a new one
+    started = datetime.utcnow()
+    model, as_of = _kept['model'], _kept['as_of']
+    # dropped until the update finished, a failed one leaves it half patched
+    _kept.update(model=None, as_of=None)
+    if model is None or not model.update(*stale(as_of - OVERLAP)):
+        model = Model()
+    _kept.update(model=model, as_of=started)
+    return model
+
+
+@task('recommendations.refresh', retries=0)
+def refresh_task():
+    if numpy is None:
+        logger.warning('recommendations need numpy and scipy; skipped')
+        return
+    since = last_run()
+    with _kept_lock:
+        if since is None:
+            recompute(kept_model())
+            return
+        venue_ids, artist_ids = stale(since - OVERLAP)
+        if venue_ids or artist_ids:
+            recompute(kept_model(), venue_ids, artist_ids)
+
+
+@task('recommendations.rebuild', retries=0)
+def rebuild_task():
+    if numpy is None:
+        logger.warning('recommendations need numpy and scipy; skipped')
+        return
+    with _kept_lock:
+        _kept.update(model=None, as_of=None)
+        recompute(kept_model())
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+recommendations_cli = AppGroup('recommendations', help='Match venues and artists.')
+
+
+@recommendations_cli.command('rebuild', help='Recompute the recommendations of every venue and artist.')
+@click.option('--venue', 'venue_ids', type=int, multiple=True, help='Only this venue, repeatable.')
+@click.option('--artist', 'artist_ids', type=int, multiple=True, help='Only this artist, repeatable.')
+def rebuild_command(venue_ids, artist_ids):
+    if numpy is None:
+        raise click.ClickException('recommendations need numpy and scipy (pip install numpy scipy)')
+    started = time.perf_counter()
+    model = Model()
+    loaded = time.perf_counter() - started
+    if venue_ids or artist_ids:
+        done = recompute(model, venue_ids, artist_ids)
+    else:
+        done = recompute(model)
+    db.session.commit()
+    click.echo('recomputed %d venues/artists (load %.1fs, total %.1fs)'
+               % (done, loaded, time.perf_counter() - started))
@@ -0,0 +1,140 @@
+from sqlalchemy import DDL, event
+from models import db, Venue, Artist, Genre, venue_genres, artist_genres, venue_show_summary, artist_show_summary
+
+
+# ----------------------------------------------------------------------------#
+# Search indexes.
+# ----------------------------------------------------------------------------#
+
+# PostgreSQL uses pg_trgm GIN indexes on name/city (see the "search indexes"
+# migration), which serve the ILIKE '%term%' filters below. SQLite has no
+# trigram operator class, so each searchable table gets an FTS5
+# external-content table with the trigram tokenizer, kept in sync by
+# triggers. Genres are matched by name through the (small) Genre table and
+# the genre_id index of the association tables; those ids are unioned with
+# the index hits, so the entity table itself is never scanned.
+
+SEARCH_COLUMNS = ("name", "city")
+
+
+def fts_table(table_name):
+    return table_name.lower() + "_search"
+
+
+def fts_ddl(table_name):
+    fts = fts_table(table_name)
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join("new." + column for column in SEARCH_COLUMNS)
+    old_values = ", ".join("old." + column for column in SEARCH_COLUMNS)
+    delete = ("INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);"
+              % (fts, fts, columns, old_values))
+    insert = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (fts, columns, new_values)
+    return [
+        "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', tokenize='trigram')"
+        % (fts, columns, table_name),
+        'CREATE TRIGGER %s_ai AFTER INSERT ON "%s" BEGIN %s END' % (fts, table_name, insert),
+        'CREATE TRIGGER %s_ad AFTER DELETE ON "%s" BEGIN %s END' % (fts, table_name, delete),
+        'CREATE TRIGGER %s_au AFTER UPDATE ON "%s" BEGIN %s %s END' % (fts, table_name, delete, insert),
+        "INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts),
+    ]
+
+
+def fts_drop_ddl(table_name):
+    fts = fts_table(table_name)
+    return ["DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix) for suffix in ("ai", "ad", "au")] + \
+           ["DROP TABLE IF EXISTS %s" % fts]
+
+
+# keep db.create_all() (local SQLite databases) in line with the migration
+for _model in (Venue, Artist):
+    for _statement in fts_ddl(_model.__tablename__):
+        event.listen(_model.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+    for _statement in fts_drop_ddl(_model.__tablename__):
+        event.listen(_model.__table__, "before_drop", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+# ----------------------------------------------------------------------------#
+# Search queries.
+# ----------------------------------------------------------------------------#
+
+def search_venues(search_term, page=1, per_page=20):
+    return _search(Venue, venue_show_summary, venue_show_summary.c.venue_id, search_term, page, per_page)
+
+
+def search_artists(search_term, page=1, per_page=20):
+    return _search(Artist, artist_show_summary, artist_show_summary.c.artist_id, search_term, page, per_page)
+
+
+def _search(model, summary, summary_key, search_term, page, per_page):
+    # ranked matches, their upcoming show counts (from the show summaries)
+    # and the total number of hits all come back from one statement
+    search_term = (search_term or "").strip()
+    page = max(page or 1, 1)
+    query = (db.session.query(model.id, model.name, model.updated_at,
+                              db.func.coalesce(summary.c.upcoming_shows, 0).label("num_upcoming_shows"),
+                              db.func.count().over().label("total"))
+             .outerjoin(summary, summary_key == model.id))
+
+    if search_term:
+        if db.engine.dialect.name == "sqlite":
+            query = _sqlite_match(query, model, search_term)
+        else:
+            query = _postgres_match(query, model, search_term)
+    else:
+        query = query.order_by(model.name, model.id)
+
+    rows = query.limit(per_page).offset((page - 1) * per_page).all()
+    count = rows[0].total if rows else 0
+    return {"count": count,
+            "page": page,
+            "pages": -(-count // per_page),
+            "data": [{"id": row.id, "name": row.name, "updated_at": row.updated_at,
+                      "num_upcoming_shows": row.num_upcoming_shows}
+                     for row in rows]}
+
+
+def _like_pattern(search_term):
+    escaped = search_term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + escaped + "%"
+
+
+def _postgres_match(query, model, search_term):
+    pattern = _like_pattern(search_term)
+    hits = db.union(*[db.select([model.id.label("id")]).where(getattr(model, column).ilike(pattern, escape="\\"))
+                      for column in SEARCH_COLUMNS],
+                    _genre_hits(model, search_term)).alias("hits")
+    rank = db.func.greatest(db.func.similarity(model.name, search_term),
+                            db.func.similarity(model.city, search_term))
+    return query.join(hits, hits.c.id == model.id).order_by(rank.desc(), model.id)
+
+
+def _sqlite_match(query, model, search_term):
+    pattern = _like_pattern(search_term)
+    if len(search_term) < 3:
+        # terms shorter than a trigram can only be scanned
+        criteria = [getattr(model, column).like(pattern, escape="\\") for column in SEARCH_COLUMNS]
+        criteria.append(model.id.in_(_genre_hits(model, search_term)))
+        return query.filter(db.or_(*criteria)).order_by(model.name, model.id)
+
+    # trigram MATCH is served by the FTS index; rank is bm25, genre-only
+    # hits have none and come last
+    fts = fts_table(model.__tablename__)
+    phrase = '"%s"' % search_term.replace('"', '""')
+    matches = (db.text("SELECT rowid AS id, rank FROM %s WHERE %s MATCH :phrase" % (fts, fts))
+               .bindparams(phrase=phrase)
+               .columns(db.column("id"), db.column("rank"))
+               .alias("matches"))
+    genres = _genre_hits(model, search_term).alias("genres")
+    both = db.union_all(db.select([matches.c.id, matches.c.rank]),
+                        db.select([genres.c.id, db.null().label("rank")])).alias("both")
+    hits = (db.select([both.c.id, db.func.min(both.c.rank).label("rank")])
+            .group_by(both.c.id).alias("hits"))
+    return (query.join(hits, hits.c.id == model.id)
+            .order_by(hits.c.rank.is_(None), hits.c.rank, model.id))
+
+
+def _genre_hits(model, search_term):
+    # SELECT id of the rows with a genre whose name contains the term
+    association, key = (venue_genres, "venue_id") if model is Venue else (artist_genres, "artist_id")
+    genres = db.select([Genre.id]).where(Genre.name.ilike(_like_pattern(search_term), escape="\\"))
+    return db.select([association.c[key].label("id")]).where(association.c.genre_id.in_(genres))
@@ -0,0 +1,197 @@
+import math
+import random
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+import click
+from flask.cli import with_appcontext
+from forms import genres_choice, states_choice
+from models import db, Venue, Artist, Show
+from bulk import insert_chunk, sync_sequence
+from cache import pages_changed
+import analytics
+import summaries
+from geo import locate, KM_PER_DEGREE
+
+
+# ----------------------------------------------------------------------------#
+# Distributions.
+# ----------------------------------------------------------------------------#
+
+# Generated data for benchmarks and local development. Venues and artists are
+# spread over the states of the forms in proportion to their population
+# (2020 census, millions); inside a state a few large cities take most of
+# them. Genres, and which venues/artists get booked, follow a Zipf curve so
+# the listings have the long tail real data has.
+STATE_POPULATION = {
+    'AL': 5.0, 'AK': 0.7, 'AZ': 7.2, 'AR': 3.0, 'CA': 39.5, 'CO': 5.8, 'CT': 3.6, 'DE': 1.0,
+    'DC': 0.7, 'FL': 21.5, 'GA': 10.7, 'HI': 1.5, 'ID': 1.8, 'IL': 12.8, 'IN': 6.8, 'IA': 3.2,
+    'KS': 2.9, 'KY': 4.5, 'LA': 4.7, 'ME': 1.4, 'MT': 1.1, 'NE': 2.0, 'NV': 3.1, 'NH': 1.4,
+    'NJ': 9.3, 'NM': 2.1, 'NY': 20.2, 'NC': 10.4, 'ND': 0.8, 'OH': 11.8, 'OK': 4.0, 'OR': 4.2,
+    'MD': 6.2, 'MA': 7.0, 'MI': 10.1, 'MN': 5.7, 'MS': 3.0, 'MO': 6.2, 'PA': 13.0, 'RI': 1.1,
+    'SC': 5.1, 'SD': 0.9, 'TN': 6.9, 'TX': 29.1, 'UT': 3.3, 'VT': 0.6, 'VA': 8.6, 'WA': 7.7,
+    'WV': 1.8, 'WI': 5.9, 'WY': 0.6,
+}
+CITIES_PER_MILLION = 2
+CITY_SPREAD_KM = 150
+NAME_WORDS = ['Blue', 'Red', 'Golden', 'Silver', 'Electric', 'Velvet', 'Wild', 'Lucky', 'Midnight',
+              'Crystal', 'Iron', 'Neon', 'Paper', 'Broken', 'Little', 'Big', 'Lost', 'Howling']
+VENUE_WORDS = ['Room', 'Hall', 'Tavern', 'Lounge', 'Club', 'Theatre', 'Garden', 'Ballroom', 'Bar']
+ARTIST_WORDS = ['Band', 'Quartet', 'Collective', 'Orchestra', 'Trio', 'Project', 'Brothers', 'Sisters']
+
+
+class Weighted(object):
+    # rng.choices() with the cumulative weights computed once
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.cumulative = list(accumulate(weights))
+
+    def pick(self, rng):
+        return self.items[bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+    def sample(self, rng, k):
+        return rng.choices(self.items, cum_weights=self.cumulative, k=k)
+
+
+def zipf(items, rng, s=1.0):
+    items = list(items)
+    rng.shuffle(items)
+    return Weighted(items, [1.0 / rank ** s for rank in range(1, len(items) + 1)])
+
+
+class Generator(object):
+
+    def __init__(self, rng):
+        self.rng = rng
+        states = [value for value, label in states_choice]
+        self.states = Weighted(states, [STATE_POPULATION.get(state, 1.0) for state in states])
+        self.cities = dict((state, zipf(['%s City %d' % (state, n) for n in range(
+            1, max(2, int(STATE_POPULATION.get(state, 1.0) * CITIES_PER_MILLION)) + 1)], rng))
+            for state in states)
+        self.genres = zipf([label for value, label in genres_choice], rng)
+        self.points = {}
+
+    def place(self):
+        state = self.states.pick(self.rng)
+        return self.cities[state].pick(self.rng), state
+
+    def point(self, city, state):
+        # the made-up cities are scattered up to CITY_SPREAD_KM around the
+        # gazetteer centroid of their state
+        if (city, state) not in self.points:
+            latitude, longitude = locate(city, state)
+            if latitude is not None:
+                spread = CITY_SPREAD_KM / KM_PER_DEGREE
+                latitude += self.rng.uniform(-spread, spread)
+                longitude += self.rng.uniform(-spread, spread) / max(math.cos(math.radians(latitude)), 0.1)
+            self.points[(city, state)] = latitude, longitude
+        return self.points[(city, state)]
+
+    def genre_list(self):
+        return sorted(set(self.genres.sample(self.rng, self.rng.randint(1, 3))))
+
+    def phone(self):
+        return '%03d-%03d-%04d' % (self.rng.randint(200, 999), self.rng.randint(200, 999),
+                                   self.rng.randint(0, 9999))
+
+    def name(self, words):
+        return '%s %s %s' % (self.rng.choice(NAME_WORDS), self.rng.choice(NAME_WORDS), self.rng.choice(words))
+
+    def venue(self):
+        city, state = self.place()
+        latitude, longitude = self.point(city, state)
+        return {'name': 'The ' + self.name(VENUE_WORDS), 'city': city, 'state': state,
+                'latitude': latitude, 'longitude': longitude,
+                'address': '%d Main Street' % self.rng.randint(1, 9999), 'phone': self.phone(),
+                'image_link': None, 'facebook_link': None, 'website_link': None,
+                'seeking_talent': self.rng.random() < 0.3, 'seeking_description': None,
+                'genres': self.genre_list()}
+
+    def artist(self):
+        city, state = self.place()
+        return {'name': self.name(ARTIST_WORDS), 'city': city, 'state': state, 'phone': self.phone(),
+                'image_link': None, 'facebook_link': None, 'website_link': None,
+                'seeking_venue': self.rng.random() < 0.3, 'seeking_description': None,
+                'genres': self.genre_list()}
+
+    def show(self, venues, artists, start, days):
+        # an evening slot on a random day of the window
+        day = start + timedelta(days=self.rng.randrange(days))
+        return {'venue_id': venues.pick(self.rng), 'artist_id': artists.pick(self.rng),
+                'start_time': day.replace(hour=self.rng.randint(18, 23), minute=self.rng.choice((0, 30)))}
+
+
+# ----------------------------------------------------------------------------#
+# Command.
+# ----------------------------------------------------------------------------#
+
+def delete_all():
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    pages_changed(db.session)
+    db.session.commit()
+
+
+def insert(entity, rows, chunk_size):
+    # inserts through the bulk import writer; returns the new ids
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        insert_chunk(entity, chunk, summaries=False)
+        ids.extend(row['id'] for row in chunk)
+    return ids
+
+
+def seed(venues, artists, shows, upcoming=0.2, days=365, random_seed=0, chunk_size=5000):
+    # generates and inserts the rows; returns (venues, artists, shows) counts
+    rng = random.Random(random_seed)
+    generator = Generator(rng)
+    venue_ids = insert('venues', [generator.venue() for _ in range(venues)], chunk_size)
+    artist_ids = insert('artists', [generator.artist() for _ in range(artists)], chunk_size)
+    if not venue_ids or not artist_ids:
+        shows = 0
+    if shows:
+        booked_venues, booked_artists = zipf(venue_ids, rng, 0.8), zipf(artist_ids, rng, 0.8)
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        ahead = max(1, days // 4)
+        for start in range(0, shows, chunk_size):
+            count = min(chunk_size, shows - start)
+            rows = []
+            for _ in range(count):
+                if rng.random() < upcoming:
+                    rows.append(generator.show(booked_venues, booked_artists, today + timedelta(days=1), ahead))
+                else:
+                    rows.append(generator.show(booked_venues, booked_artists, today - timedelta(days=days), days))
+            insert_chunk('shows', rows, summaries=False)
+    # one recount at the end instead of one per chunk
+    summaries.rebuild(db.session.connection())
+    analytics.rebuild(db.session.connection(), as_job=True)
+    db.session.commit()
+    for model in (Venue, Artist, Show):
+        sync_sequence(model.__table__)
+    return len(venue_ids), len(artist_ids), shows
+
+
+@click.command('seed', help='Generate venues, artists and shows for benchmarks and local development.')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=50000, show_default=True)
+@click.option('--upcoming', default=0.2, show_default=True, help='Share of the shows still to come.')
+@click.option('--days', default=365, show_default=True, help='Shows are spread over this many days back '
+              'and, for the upcoming ones, up to a quarter of it ahead.')
+@click.option('--random-seed', default=0, show_default=True, help='Same seed, same data.')
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--reset', is_flag=True, help='Delete every venue, artist and show first.')
+@click.option('--yes', is_flag=True, help='Do not ask before --reset.')
+@with_appcontext
+def seed_command(venues, artists, shows, upcoming, days, random_seed, chunk_size, reset, yes):
+    if reset:
+        if not yes:
+            click.confirm('Delete every venue, artist and show in %s?' % db.engine.url, abort=True)
+        delete_all()
+    started = time.perf_counter()
+    counts = seed(venues, artists, shows, upcoming, days, random_seed, chunk_size)
+    click.echo('seeded %d venues, %d artists and %d shows in %.1fs'
+               % (counts + (time.perf_counter() - started,)), err=True)
@@ -0,0 +1,216 @@
+import sys
+from datetime import datetime
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import db, Venue, Artist, Show, venue_show_summary, artist_show_summary
+from jobs import task, enqueue
+from cache import pages_changed
+
+
+# ----------------------------------------------------------------------------#
+# Refresh.
+# ----------------------------------------------------------------------------#
+
+# Listings and search read the upcoming/past show counts of a venue or artist
+# from its summary row instead of counting Shows. A row is recounted (with
+# the (venue_id|artist_id, start_time) indexes) whenever one of its shows is
+# added, moved or deleted, and by `flask summaries roll` once its next show
+# has started.
+
+shows = Show.__table__
+SUMMARIES = {
+    'venue_id': venue_show_summary,
+    'artist_id': artist_show_summary,
+}
+CHUNK = 1000
+
+
+def recount(key, ids=None, now=None):
+    # SELECT of the summary rows of `ids` (every venue/artist with shows
+    # when None), as of `now`
+    now = now or datetime.utcnow()
+    column = shows.c[key]
+    upcoming = shows.c.start_time >= now
+    select = (db.select([column,
+                         db.func.sum(db.case([(upcoming, 1)], else_=0)),
+                         db.func.sum(db.case([(upcoming, 0)], else_=1)),
+                         db.func.min(db.case([(upcoming, shows.c.start_time)])),
+                         db.literal(now, db.DateTime)])
+              .where(column.isnot(None))
+              .group_by(column))
+    if ids is not None:
+        select = select.where(column.in_(ids))
+    return select
+
+
+def refresh(connection, key, ids=None, now=None):
+    # replaces the summary rows of `ids`; everything when ids is None
+    summary = SUMMARIES[key]
+    if ids is None:
+        connection.execute(summary.delete())
+        connection.execute(summary.insert().from_select(
+            [key, 'upcoming_shows', 'past_shows', 'next_show', 'updated_at'], recount(key, now=now)))
+        return
+    ids = sorted(id_ for id_ in set(ids) if id_ is not None)
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        connection.execute(summary.delete().where(summary.c[key].in_(chunk)))
+        connection.execute(summary.insert().from_select(
+            [key, 'upcoming_shows', 'past_shows', 'next_show', 'updated_at'], recount(key, chunk, now)))
+
+
+def refresh_shows(connection, venue_ids=(), artist_ids=(), now=None):
+    refresh(connection, 'venue_id', venue_ids, now)
+    refresh(connection, 'artist_id', artist_ids, now)
+
+
+def rebuild(connection, now=None):
+    for key in SUMMARIES:
+        refresh(connection, key, None, now)
+
+
+def roll(connection, now=None):
+    # recounts the rows whose next upcoming show has started; returns how
+    # many were rolled over
+    now = now or datetime.utcnow()
+    rolled = 0
+    for key, summary in SUMMARIES.items():
+        ids = [row[0] for row in connection.execute(
+            db.select([summary.c[key]]).where(summary.c.next_show < now))]
+        refresh(connection, key, ids, now)
+        rolled += len(ids)
+    return rolled
+
+
+def check(connection, now=None):
+    # compares every summary row with a full recount; rows waiting for the
+    # roll job are reported separately. Returns {key: (mismatched ids, stale ids)}.
+    now = now or datetime.utcnow()
+    report = {}
+    for key, summary in SUMMARIES.items():
+        expected = dict((row[0], tuple(row[1:4])) for row in connection.execute(recount(key, now=now)))
+        mismatched, stale = [], []
+        rows = connection.execute(db.select([summary.c[key], summary.c.upcoming_shows,
+                                             summary.c.past_shows, summary.c.next_show]))
+        for row in rows:
+            id_, values = row[0], tuple(row[1:4])
+            if row.next_show is not None and row.next_show < now:
+                stale.append(id_)
+            elif expected.get(id_) != values:
+                mismatched.append(id_)
+            expected.pop(id_, None)
+        mismatched.extend(expected)
+        report[key] = (sorted(mismatched), sorted(stale))
+    return report
+
+
+# ----------------------------------------------------------------------------#
+# Session hooks.
+# ----------------------------------------------------------------------------#
+
+def _pending(session):
+    return session.info.setdefault('show_summaries', {'venue_id': set(), 'artist_id': set()})
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_summaries(session, flush_context, instances):
+    # the venues/artists whose counts this flush changes. Deleting a venue
+    # removes its shows through ON DELETE CASCADE, so the artists that
+    # played there are looked up before it goes (and vice versa).
+    pending = None
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, Show):
+            pending = pending or _pending(session)
+            state = inspect(instance)
+            for key in SUMMARIES:
+                history = state.attrs[key].history
+                pending[key].update(history.added or (), history.deleted or (), history.unchanged or ())
+        elif isinstance(instance, (Venue, Artist)) and instance in session.deleted:
+            pending = pending or _pending(session)
+            own, other = ('venue_id', 'artist_id') if isinstance(instance, Venue) else ('artist_id', 'venue_id')
+            rows = session.execute(db.select([shows.c[other]]).distinct().where(shows.c[own] == instance.id))
+            pending[other].update(row[0] for row in rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_summaries(session, flush_context):
+    # SUMMARIES_REFRESH = 'job' leaves the recount to a background job queued
+    # in the same transaction, so the request returns after its own commit
+    pending = session.info.pop('show_summaries', None)
+    if not pending:
+        return
+    shows_changed(session.connection(), pending['venue_id'], pending['artist_id'])
+
+
+def shows_changed(connection, venue_ids=(), artist_ids=()):
+    # recounts now, or in a job queued in the same transaction; for Core
+    # writes to Shows, which skip the session hooks
+    venue_ids = sorted(set(id_ for id_ in venue_ids if id_ is not None))
+    artist_ids = sorted(set(id_ for id_ in artist_ids if id_ is not None))
+    if has_app_context() and current_app.config.get('SUMMARIES_REFRESH') == 'job':
+        enqueue('summaries.refresh', {'venue_ids': venue_ids, 'artist_ids': artist_ids}, connection=connection)
+    else:
+        refresh_shows(connection, venue_ids, artist_ids)
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+@task('summaries.refresh')
+def refresh_task(venue_ids=(), artist_ids=()):
+    refresh_shows(db.session.connection(), venue_ids, artist_ids)
+    pages_changed(db.session)
+
+
+@task('summaries.roll', retries=0)
+def roll_task():
+    if roll(db.session.connection()):
+        pages_changed(db.session)
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+summaries_cli = AppGroup('summaries', help='Maintain the per venue/artist show count summaries.')
+
+
+@summaries_cli.command('rebuild', help='Recount every summary row from Shows.')
+def rebuild_command():
+    rebuild(db.session.connection())
+    pages_changed(db.session)
+    db.session.commit()
+    click.echo('summaries rebuilt')
+
+
+@summaries_cli.command('roll', help='Move started shows from upcoming to past; run it every few minutes.')
+def roll_command():
+    rolled = roll(db.session.connection())
+    if rolled:
+        pages_changed(db.session)
+    db.session.commit()
+    click.echo('rolled %d summary rows' % rolled)
+
+
+@summaries_cli.command('check', help='Compare the summaries with a full recount; exits 1 on mismatches.')
+@click.option('--fix', is_flag=True, help='Recount the rows that do not match.')
+def check_command(fix):
+    connection = db.session.connection()
+    report = check(connection)
+    failed = False
+    for key, (mismatched, stale) in report.items():
+        click.echo('%s: %d mismatched, %d waiting for roll' % (key, len(mismatched), len(stale)))
+        if mismatched:
+            failed = True
+            click.echo('  %s' % ', '.join(str(id_) for id_ in mismatched[:50]))
+            if fix:
+                refresh(connection, key, mismatched)
+    if fix:
+        pages_changed(db.session)
+        db.session.commit()
+    if failed and not fix:
+        sys.exit(1)
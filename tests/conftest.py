@@ -0,0 +1,39 @@
+import os
+import sys
+import pytest
+
+# the testing profile (no page cache, query budgets raise) against a SQLite
+# file per test
+os.environ['FYYUR_ENV'] = 'testing'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from app import app as fyyur  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    fyyur.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(tmp_path / 'test.db')
+    with fyyur.app_context():
+        db.create_all()
+        yield fyyur
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def reseed(app):
+    # reseed(venues, artists, shows) empties the database and generates
+    # that much data, over a month, with `flask seed`'s generator
+    import seed
+
+    def reseed(venues, artists, shows):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        return seed.seed(venues, artists, shows, days=30)
+    return reseed
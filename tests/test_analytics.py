@@ -0,0 +1,29 @@
+import pytest
+import analytics
+from models import Show
+
+
+@pytest.mark.parametrize('path', ['/api/v1/analytics/venues', '/api/v1/analytics/artists',
+                                  '/api/v1/analytics/states', '/api/v1/analytics/genres',
+                                  '/api/v1/analytics/genres/by-state'])
+def test_analytics_api_with_orjson(client, reseed, path):
+    orjson = pytest.importorskip('orjson')
+    reseed(10, 10, 60)
+    day = Show.query.order_by(Show.start_time).first().start_time.date()
+    response = client.get('%s?period=month&date=%s' % (path, day.isoformat()))
+    assert response.status_code == 200
+    data = orjson.loads(response.data)['data']
+    assert data
+    assert all(isinstance(key, str) for row in data for key in row)
+
+
+def test_command_rebuild_moves_the_validator(app, client, reseed):
+    reseed(5, 5, 20)
+    assert analytics.last_run() is not None
+    etag = client.get('/api/v1/analytics/venues').headers['ETag']
+    assert client.get('/api/v1/analytics/venues', headers={'If-None-Match': etag}).status_code == 304
+    result = app.test_cli_runner().invoke(args=['analytics', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    response = client.get('/api/v1/analytics/venues', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
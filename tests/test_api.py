@@ -0,0 +1,67 @@
+import pytest
+from models import db, Venue, Artist, Show
+
+
+def get_json(client, path, status=200):
+    response = client.get(path)
+    assert response.status_code == status, response.data
+    return response.get_json()
+
+
+def walk(client, path):
+    # every item of a list endpoint, following next_cursor; and the pages
+    items, pages = [], 0
+    cursor = None
+    while True:
+        separator = '&' if '?' in path else '?'
+        body = get_json(client, path + (separator + 'cursor=' + cursor if cursor else ''))
+        items.extend(body['data'])
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return items, pages
+
+
+@pytest.mark.parametrize('path, model', [('/api/v1/venues', Venue), ('/api/v1/artists', Artist),
+                                         ('/api/v1/shows', Show)])
+def test_cursors_walk_every_row_once(client, reseed, path, model):
+    reseed(23, 23, 50)
+    items, pages = walk(client, path + '?limit=5')
+    ids = [item['id'] for item in items]
+    assert sorted(ids) == sorted(row[0] for row in db.session.query(model.id))
+    assert len(set(ids)) == len(ids)
+    assert pages == -(-len(ids) // 5)
+    assert get_json(client, path + '?limit=500')['next_cursor'] is None
+
+
+def test_last_page_has_no_next_cursor(client, reseed):
+    reseed(10, 10, 0)
+    body = get_json(client, '/api/v1/artists?limit=10')
+    assert len(body['data']) == 10 and body['next_cursor'] is None
+    last = body['data'][-1]['id']
+    assert get_json(client, '/api/v1/artists?cursor=%d' % last) == {'data': [], 'next_cursor': None}
+
+
+@pytest.mark.parametrize('path', ['/api/v1/venues?cursor=abc', '/api/v1/artists?cursor=1.5',
+                                  '/api/v1/shows?cursor=abc', '/api/v1/shows?cursor=2030-01-01_x'])
+def test_invalid_cursors_are_rejected(client, path):
+    assert get_json(client, path, 400) == {'error': 'invalid cursor'}
+
+
+def test_fieldsets_pick_fields(client, reseed):
+    reseed(5, 5, 20)
+    for item in get_json(client, '/api/v1/venues?fields=id,name')['data']:
+        assert set(item) == {'id', 'name'}
+    for item in get_json(client, '/api/v1/shows?fields=id, start_time')['data']:
+        assert set(item) == {'id', 'start_time'}
+    venue = get_json(client, '/api/v1/venues/1?fields=name,upcoming_shows_count')
+    assert set(venue) == {'name', 'upcoming_shows_count'}
+    assert set(get_json(client, '/api/v1/artists/1')) == set(
+        ('id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link', 'seeking_venue',
+         'seeking_description', 'image_link', 'upcoming_shows', 'past_shows', 'upcoming_shows_count',
+         'past_shows_count', 'past_shows_next'))
+
+
+def test_unknown_fields_are_rejected(client):
+    assert get_json(client, '/api/v1/venues?fields=id,password', 400) == {'error': 'unknown fields: password'}
+    assert get_json(client, '/api/v1/artists/1?fields=secret', 400) == {'error': 'unknown fields: secret'}
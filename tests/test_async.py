@@ -0,0 +1,29 @@
+import pytest
+
+PATHS = [
+    '/venues?limit=2',
+    '/venues?limit=2&near=37.77,-122.42&radius=500',
+    '/venues/search?search_term=the',
+    '/venues/1',
+    '/venues/1?past_limit=1',
+    '/artists?limit=2',
+    '/artists/search?search_term=band',
+    '/artists/1',
+    '/shows?limit=5',
+]
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_async_pages_match_their_views(client, reseed, path):
+    reseed(20, 5, 40)
+    response = client.get('/async' + path)
+    assert response.status_code == 200
+    # only the filter forms, which submit to the page they are on, differ
+    body = response.get_data().replace(b'action="/async/', b'action="/')
+    assert body == client.get(path).get_data()
+
+
+def test_async_detail_pages_404(client, reseed):
+    reseed(1, 1, 1)
+    assert client.get('/async/venues/404').status_code == 404
+    assert client.get('/async/artists/404').status_code == 404
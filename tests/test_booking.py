@@ -0,0 +1,71 @@
+from datetime import datetime
+import pytest
+from sqlalchemy.dialects import postgresql
+import booking
+from models import db, Venue, Show
+
+
+@pytest.mark.parametrize('value', [1.9, True, '  3 ', '1e3', '٣', None])
+def test_parse_row_rejects_ids_int_would_coerce(value):
+    row, error = booking.parse_row(1, value, 2, '2026-11-01 20:00')
+    assert row is None and 'whole numbers' in error
+
+
+def test_parse_row_converts_offsets_to_utc():
+    row, error = booking.parse_row(1, 3, '4', '2026-11-01T20:00:00-05:00')
+    assert error is None
+    assert (row.artist_id, row.venue_id, row.start_time) == (3, 4, datetime(2026, 11, 2, 1, 0))
+    assert booking.parse_row(1, 3, 4, '2026-11-01 20:00')[0].start_time == datetime(2026, 11, 1, 20, 0)
+
+
+def test_api_books_offset_times_at_the_right_instant(client, reseed):
+    reseed(1, 1, 0)
+    response = client.post('/api/v1/shows', json={'shows': [
+        {'artist_id': 1, 'venue_id': 1, 'start_time': '2030-06-01T21:00:00+02:00'},
+        {'artist_id': 1.0, 'venue_id': 1, 'start_time': '2030-07-01T21:00:00'}]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == ['row 2: artist and venue ids must be whole numbers']
+    response = client.post('/api/v1/shows', json={'shows': [
+        {'artist_id': 1, 'venue_id': '1', 'start_time': '2030-06-01T21:00:00+02:00'}]})
+    assert response.status_code == 201
+    assert db.session.query(Show.start_time).scalar() == datetime(2030, 6, 1, 19, 0)
+
+
+def test_booking_locks_conflict_with_each_other(app):
+    # FOR KEY SHARE locks would not; the slot check relies on this
+    query = booking.lock(db.session.query(Venue.id).filter(Venue.id == 1))
+    assert str(query.statement.compile(dialect=postgresql.dialect())).endswith('FOR NO KEY UPDATE')
+
+
+def test_booking_rejects_overlaps_with_shows_and_each_other(app, reseed):
+    reseed(2, 2, 0)
+    app.config['SHOW_BOOKING_WINDOW'] = 180
+    assert booking.book([booking.parse_row(1, 1, 1, '2030-06-01 20:00')[0]]) == []
+    rows = [booking.parse_row(1, 2, 1, '2030-06-01 22:00')[0],
+            booking.parse_row(2, 2, 2, '2030-06-02 20:00')[0],
+            booking.parse_row(3, 2, 2, '2030-06-02 21:00')[0],
+            booking.parse_row(4, 1, 2, '2030-06-01 23:30')[0]]
+    assert booking.book(rows) == ['row 1: venue 1 is already booked at 2030-06-01 20:00',
+                                  'row 3: artist 2 is already booked at 2030-06-02 20:00 (row 2)',
+                                  'row 3: venue 2 is already booked at 2030-06-02 20:00 (row 2)']
+    assert Show.query.count() == 1
+    assert booking.book([rows[3]]) == []
+    assert Show.query.count() == 2
+
+
+def test_booking_rejects_unknown_venues_and_artists(reseed):
+    reseed(1, 1, 0)
+    rows = [booking.parse_row(1, 1, 1, '2030-06-01 20:00')[0],
+            booking.parse_row(2, 7, 1, '2030-06-05 20:00')[0],
+            booking.parse_row(3, 1, 9, '2030-06-09 20:00')[0]]
+    assert booking.book(rows) == ['row 2: there is no artist 7', 'row 3: there is no venue 9']
+    assert Show.query.count() == 0
+
+
+def test_bulk_form_rejects_coerced_ids(client, reseed):
+    reseed(1, 1, 0)
+    response = client.post('/shows/bulk', data={'shows': '1, 1, 2030-06-01 20:00\n1.0, 1, 2030-06-02 20:00\n'
+                                                          '1, true, 2030-06-03 20:00'})
+    assert b'row 2: artist and venue ids must be whole numbers' in response.data
+    assert b'row 3: artist and venue ids must be whole numbers' in response.data
+    assert Show.query.count() == 0
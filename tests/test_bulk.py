@@ -0,0 +1,49 @@
+from models import db, Venue
+
+HEADER = 'id,name,city,state,address,phone,website_link,facebook_link,genres,seeking_talent\n'
+
+
+def venue_row(id_, name, seeking_talent):
+    return '%d,%s,Austin,TX,%d Main St,512-555-0100,https://example.com,https://facebook.com/x,Jazz,%s\n' % (
+        id_, name, id_, seeking_talent)
+
+
+def test_csv_round_trip_keeps_boolean_flags(app, reseed, tmp_path):
+    for id_, seeking_talent in ((1, True), (2, False)):
+        db.session.add(Venue(id=id_, name='Venue %d' % id_, city='Austin', state='TX', address='Main St',
+                             phone='512-555-0100', website_link='https://example.com',
+                             facebook_link='https://facebook.com/x', genres=['Jazz'],
+                             seeking_talent=seeking_talent))
+    db.session.commit()
+    path = str(tmp_path / 'venues.csv')
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['export', 'venues', path]).exit_code == 0
+    reseed(0, 0, 0)
+    result = runner.invoke(args=['import', 'venues', path])
+    assert 'rejected' not in result.output
+    assert dict(db.session.query(Venue.id, Venue.seeking_talent)) == {1: True, 2: False}
+
+
+def test_import_rejects_bad_booleans_and_taken_ids(app, reseed, tmp_path):
+    reseed(1, 0, 0)
+    path = tmp_path / 'venues.csv'
+    path.write_text(HEADER + venue_row(1, 'Taken', 'no') + venue_row(2, 'Maybe', 'maybe')
+                    + venue_row(3, 'Fine', 'No') + venue_row(3, 'Twice', 'yes') + venue_row(4, 'Yes', 'YES'))
+    result = app.test_cli_runner().invoke(args=['import', 'venues', str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'id 1 is already taken' in result.output
+    assert 'id 3 is already taken' in result.output
+    assert 'row 2 rejected' in result.output and 'seeking_talent' in result.output
+    assert 'rejected 3 rows' in result.output
+    assert dict(db.session.query(Venue.id, Venue.seeking_talent).filter(Venue.id > 1)) == {3: False, 4: True}
+
+
+def test_import_rejects_non_numeric_ids(app, reseed, tmp_path):
+    reseed(0, 0, 0)
+    path = tmp_path / 'venues.csv'
+    path.write_text(HEADER + venue_row(1, 'First', 'no')
+                    + venue_row(2, 'Bad', 'no').replace('2,', 'abc,', 1) + venue_row(3, 'Third', 'yes'))
+    result = app.test_cli_runner().invoke(args=['import', 'venues', str(path), '--chunk-size', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'row 2 rejected' in result.output and 'must be an integer' in result.output
+    assert sorted(row[0] for row in db.session.query(Venue.name)) == ['First', 'Third']
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import pytest
+import jobs
+from cache import LRUCache, pages_changed
+from models import db, Venue, Show
+
+
+@pytest.fixture
+def page_cache(app, reseed):
+    reseed(5, 5, 20)
+    cache = app.extensions['cache']
+    backend, cache.backend = cache.backend, LRUCache()
+    yield cache.backend
+    cache.backend = backend
+
+
+def test_job_commits_keep_cached_pages(client, page_cache):
+    client.get('/venues')
+    jobs.enqueue('jobs.purge')
+    db.session.commit()
+    client.get('/venues')
+    assert page_cache.stats.invalidations == 0
+    assert page_cache.stats.hits == 1
+
+
+def test_catalogue_commits_clear_cached_pages(client, page_cache):
+    client.get('/venues')
+    db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA'))
+    db.session.commit()
+    assert page_cache.stats.invalidations == 1
+    pages_changed(db.session)
+    db.session.commit()
+    assert page_cache.stats.invalidations == 2
+    pages_changed(db.session)
+    db.session.rollback()
+    db.session.commit()
+    assert page_cache.stats.invalidations == 2
+
+
+def test_stats_need_debug_or_config(app, client):
+    assert client.get('/_stats/cache').status_code == 404
+    app.config['STATS_ENDPOINTS'] = True
+    try:
+        assert client.get('/_stats/cache').status_code == 200
+    finally:
+        app.config['STATS_ENDPOINTS'] = False
+
+
+def test_cached_pages_follow_their_validators(client, page_cache):
+    # a show starting changes the venue page without a commit to clear the
+    # cache; the page must not come back from the cache under the new ETag
+    show = Show.query.filter(Show.start_time > datetime.utcnow()).first()
+    path = '/venues/%d' % show.venue_id
+    before = client.get(path)
+    db.session.execute(Show.__table__.update().where(Show.id == show.id)
+                       .values(start_time=datetime.utcnow() - timedelta(minutes=1), updated_at=show.updated_at))
+    db.session.commit()
+    after = client.get(path)
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert after.data != before.data
+    assert client.get(path).data == after.data
+    assert page_cache.stats.hits == 1
@@ -0,0 +1,57 @@
+import json
+import logging
+import pytest
+from instrumentation import QueryBudgetExceeded
+from test_listings import query_count
+
+
+def test_hot_endpoints_stay_within_their_budgets(client, reseed):
+    reseed(20, 20, 100)
+    for path in ('/venues', '/venues?after=5', '/artists', '/shows', '/shows/calendar', '/venues/1?past_limit=2',
+                 '/artists/1', '/api/v1/venues', '/api/v1/venues?cursor=5', '/api/v1/venues/1', '/api/v1/artists/1?past_limit=2'):
+        assert client.get(path).status_code == 200, path
+
+
+def test_going_over_a_budget_fails_in_tests(app, client):
+    budgets = app.config['QUERY_BUDGETS']
+    app.config['QUERY_BUDGETS'] = dict(budgets, venues=0)
+    try:
+        with pytest.raises(QueryBudgetExceeded):
+            client.get('/venues')
+    finally:
+        app.config['QUERY_BUDGETS'] = budgets
+
+
+def test_server_timing_names_statements_only_when_asked(app, client):
+    assert 'sql1' not in client.get('/venues').headers['Server-Timing']
+    app.config['SERVER_TIMING_STATEMENTS'] = True
+    try:
+        assert 'sql1' in client.get('/venues').headers['Server-Timing']
+    finally:
+        del app.config['SERVER_TIMING_STATEMENTS']
+
+
+@pytest.mark.parametrize('path', ['/venues?limit=500', '/artists?limit=500', '/api/v1/venues', '/api/v1/shows'])
+def test_streamed_responses_count_their_queries(app, client, reseed, caplog, path):
+    reseed(20, 20, 100)
+    caplog.set_level(logging.INFO, 'fyyur.queries')
+    count = query_count(client, path)
+    caplog.clear()
+    response = client.get(path + '&stream=1' if '?' in path else path + '?stream=1')
+    assert response.get_data()
+    response.close()
+    assert 'Server-Timing' not in response.headers
+    logged = [json.loads(record.getMessage()) for record in caplog.records if record.levelno == logging.INFO]
+    assert [line['queries'] for line in logged] == [count]
+
+
+def test_streamed_responses_are_held_to_the_budget(app, client):
+    budgets = app.config['QUERY_BUDGETS']
+    app.config['QUERY_BUDGETS'] = dict(budgets, venues=0)
+    try:
+        with pytest.raises(QueryBudgetExceeded):
+            response = client.get('/venues?stream=1')
+            response.get_data()
+            response.close()
+    finally:
+        app.config['QUERY_BUDGETS'] = budgets
@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import jobs
+from cache import LRUCache
+
+
+@pytest.fixture
+def commits():
+    counted = []
+
+    def count(session):
+        counted.append(session)
+    event.listen(Session, 'after_commit', count)
+    yield counted
+    event.remove(Session, 'after_commit', count)
+
+
+def test_idle_worker_does_not_commit_or_clear_the_page_cache(app, commits):
+    jobs._scheduled.clear()
+    cache = app.extensions['cache']
+    backend, cache.backend = cache.backend, LRUCache()
+    app.config['JOB_SCHEDULE'], schedule = {'jobs.purge': 86400}, app.config['JOB_SCHEDULE']
+    try:
+        worker = jobs.Worker(app)
+        assert worker.work(0) == 1
+        del commits[:]
+        for _ in range(3):
+            assert worker.work(0) == 0
+        assert commits == []
+        assert cache.backend.stats.invalidations == 0
+    finally:
+        cache.backend = backend
+        app.config['JOB_SCHEDULE'] = schedule
+        jobs._scheduled.clear()
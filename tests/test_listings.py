@@ -0,0 +1,18 @@
+import re
+import pytest
+
+
+def query_count(client, path):
+    # statements the request ran, from the Server-Timing header
+    response = client.get(path)
+    assert response.status_code == 200
+    return int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+
+
+@pytest.mark.parametrize('path', ['/venues?limit=500', '/artists?limit=500'])
+def test_listing_queries_do_not_grow_with_rows(client, reseed, path):
+    counts = []
+    for size in (20, 200):
+        reseed(size, size, size * 5)
+        counts.append(query_count(client, path))
+    assert counts[0] == counts[1]
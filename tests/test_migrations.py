@@ -0,0 +1,48 @@
+import os
+from flask_migrate import upgrade, downgrade
+from models import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def test_upgrade_and_downgrade_from_an_empty_database(app):
+    # the whole revision chain has to run on SQLite too, search indexes
+    # (FTS5) included
+    db.drop_all()
+    upgrade(directory=MIGRATIONS)
+    tables = set(db.inspect(db.engine).get_table_names())
+    assert {'Venue', 'Artist', 'Shows', 'venue_search', 'jobs', 'venue_show_rollup'} <= tables
+    downgrade(directory=MIGRATIONS, revision='base')
+    assert set(db.inspect(db.engine).get_table_names()) <= {'alembic_version'}
+    upgrade(directory=MIGRATIONS)
+
+
+def test_genre_normalization_converts_existing_rows(app):
+    # the genre lists of the previous schema (array literals, or plain
+    # comma-separated text) become Genre rows and links, and come back
+    db.drop_all()
+    upgrade(directory=MIGRATIONS, revision='e5d81b0c6a72')
+    db.session.execute('INSERT INTO "Venue" (id, name, genres) VALUES '
+                       '(1, \'Hop\', \'{Jazz,"Rock n Roll"}\'), (2, \'Park\', \'Folk, Jazz\'), (3, \'Bare\', NULL)')
+    db.session.execute('INSERT INTO "Artist" (id, name, genres) VALUES '
+                       '(1, \'Petals\', \'{"Rock n Roll"}\'), (2, \'Matt\', \'{}\')')
+    db.session.commit()
+
+    upgrade(directory=MIGRATIONS, revision='1a6f3c8e2b57')
+    links = 'SELECT a.%s, g.name FROM %s a JOIN "Genre" g ON g.id = a.genre_id ORDER BY 1, 2'
+    assert [tuple(row) for row in db.session.execute(links % ('venue_id', 'venue_genres'))] == [
+        (1, 'Jazz'), (1, 'Rock n Roll'), (2, 'Folk'), (2, 'Jazz')]
+    assert [tuple(row) for row in db.session.execute(links % ('artist_id', 'artist_genres'))] == [
+        (1, 'Rock n Roll')]
+    assert db.session.execute('SELECT count(*) FROM "Genre"').scalar() == 3
+    assert [row[0] for row in db.session.execute('SELECT rowid FROM venue_search WHERE venue_search MATCH \'Hop\'')] \
+        == [1]
+    db.session.commit()
+
+    downgrade(directory=MIGRATIONS, revision='e5d81b0c6a72')
+    assert dict(db.session.execute('SELECT id, genres FROM "Venue"').fetchall()) == {
+        1: '{Jazz,"Rock n Roll"}', 2: '{Folk,Jazz}', 3: None}
+    assert dict(db.session.execute('SELECT id, genres FROM "Artist"').fetchall()) == {
+        1: '{"Rock n Roll"}', 2: None}
+    db.session.commit()
+    upgrade(directory=MIGRATIONS)
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, Venue, Artist, Show, venue_recommendations, artist_recommendations
+import recommendations
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+
+def stored():
+    return [sorted((row[0], row[1], row[2], round(row[3], 3)) for row in db.session.execute(
+        db.select([table.c[key], table.c.rank, table.c[target], table.c.score])))
+        for table, key, target in ((venue_recommendations, 'venue_id', 'artist_id'),
+                                   (artist_recommendations, 'artist_id', 'venue_id'))]
+
+
+def test_updated_model_matches_a_fresh_one(reseed):
+    reseed(30, 30, 200)
+    model = recommendations.Model()
+    since = datetime.utcnow() - timedelta(seconds=1)
+    venue, artist = Venue.query.order_by(Venue.id).first(), Artist.query.order_by(Artist.id).first()
+    venue.city, venue.state, venue.genres = 'Elsewhere', 'TX', list(artist.genres)
+    artist.seeking_venue = not artist.seeking_venue
+    new = Artist(name='New artist', city=venue.city, state=venue.state, genres=list(artist.genres))
+    db.session.add(new)
+    db.session.flush()
+    db.session.add(Show(venue_id=venue.id, artist_id=new.id, start_time=datetime.utcnow() + timedelta(days=1)))
+    db.session.delete(Show.query.order_by(Show.id).first())
+    db.session.commit()
+
+    assert model.update(*recommendations.stale(since))
+    recommendations.recompute(model)
+    updated = stored()
+    recommendations.recompute(recommendations.Model())
+    assert stored() == updated
+
+
+def test_model_is_reloaded_after_a_delete(reseed):
+    reseed(10, 10, 40)
+    model = recommendations.Model()
+    since = datetime.utcnow() - timedelta(seconds=1)
+    db.session.delete(Artist.query.order_by(Artist.id).first())
+    db.session.commit()
+    assert not model.update(*recommendations.stale(since))
@@ -0,0 +1,71 @@
+import time
+import pytest
+from sqlalchemy import create_engine
+from cache import LRUCache
+from database import PINNED
+from models import db, Venue
+
+# a second SQLite file stands in for the replica; it never catches up, so
+# whatever a request reads from it is easy to tell apart
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    url = 'sqlite:///' + str(tmp_path / 'replica.db')
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    engine.execute(Venue.__table__.insert().values(id=1, name='Replica Hall', city='Austin', state='TX'))
+    db.session.add(Venue(id=1, name='Primary Hall', city='Austin', state='TX'))
+    db.session.commit()
+    binds = app.config['SQLALCHEMY_BINDS']
+    app.config['SQLALCHEMY_BINDS'] = {'replica': url}
+    yield engine
+    app.config['SQLALCHEMY_BINDS'] = binds
+    engine.dispose()
+
+
+def test_get_pages_read_from_the_replica(client, replica):
+    page = client.get('/venues').data
+    assert b'Replica Hall' in page and b'Primary Hall' not in page
+
+
+def test_writes_pin_the_browser_to_the_primary(client, replica):
+    # /venues/<id>/delete writes on GET: it must find the primary's row
+    response = client.get('/venues/1/delete')
+    assert response.status_code == 302
+    assert Venue.query.count() == 0
+    page = client.get('/venues').data
+    assert b'Replica Hall' not in page
+    with client.session_transaction() as session:
+        session[PINNED] = time.time() - 1
+    assert b'Replica Hall' in client.get('/venues').data
+    with client.session_transaction() as session:
+        assert PINNED not in session
+
+
+def test_core_writes_go_to_the_primary(app, replica):
+    db.use_replica(True)
+    try:
+        assert db.session.query(Venue.name).scalar() == 'Replica Hall'
+        db.session.commit()
+        db.session.execute(Venue.__table__.insert().values(id=2, name='Core Hall'))
+        assert sorted(row[0] for row in db.session.query(Venue.name)) == ['Core Hall', 'Primary Hall']
+        db.session.commit()
+    finally:
+        db.use_replica(False)
+    assert [row[0] for row in replica.execute('SELECT name FROM "Venue"')] == ['Replica Hall']
+
+
+def test_pages_read_right_after_a_write_are_not_cached(app, client, replica):
+    cache = app.extensions['cache']
+    backend, cache.backend = cache.backend, LRUCache()
+    try:
+        db.session.add(Venue(id=3, name='New Hall', city='Austin', state='TX'))
+        db.session.commit()
+        client.get('/venues')
+        assert len(cache.backend) == 0
+        cache.invalidated_at -= app.config['DB_REPLICA_LAG']
+        client.get('/venues')
+        assert len(cache.backend) == 1
+    finally:
+        cache.backend = backend
@@ -0,0 +1,38 @@
+from sqlalchemy import event
+from models import db, Venue, Artist
+import search
+
+
+def search_plan(function, term):
+    # EXPLAIN QUERY PLAN of the search statement
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        function(term)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    statement, parameters = statements[-1]
+    return [row[-1] for row in db.engine.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+def test_search_matches_names_cities_and_genres(app):
+    db.session.add_all([Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz']),
+                        Venue(name='Park Square', city='Jazzville', state='CA', genres=['Folk']),
+                        Venue(name='Dueling Pianos', city='New York', state='NY', genres=['Blues']),
+                        Artist(name='Guns N Petals', city='Jazz Town', state='CA', genres=['Rock n Roll'])])
+    db.session.commit()
+    assert [row['name'] for row in search.search_venues('jazz')['data']] == ['Park Square', 'The Musical Hop']
+    assert [row['name'] for row in search.search_venues('ja')['data']] == ['Park Square', 'The Musical Hop']
+    assert search.search_venues('rock')['count'] == 0
+    assert [row['name'] for row in search.search_artists('roll')['data']] == ['Guns N Petals']
+
+
+def test_search_does_not_scan_the_table(reseed):
+    reseed(50, 50, 100)
+    for function in (search.search_venues, search.search_artists):
+        plan = search_plan(function, 'rock')
+        assert not [step for step in plan if step.startswith('SCAN Venue') or step.startswith('SCAN Artist')]
+        assert any('_search VIRTUAL TABLE' in step for step in plan)
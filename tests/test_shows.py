@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, Venue, Artist, Show
+
+
+@pytest.fixture
+def shows(app):
+    # two venues in different cities, a jazz and a rock artist, and shows
+    # on the edges of the days around 2030-06-02
+    austin = Venue(name='Austin Hall', city='Austin', state='TX')
+    portland = Venue(name='Portland Room', city='Portland', state='OR')
+    jazz = Artist(name='Jazz Trio', genres=['Jazz'])
+    rock = Artist(name='Rock Band', genres=['Rock n Roll'])
+    db.session.add_all([austin, portland, jazz, rock])
+    db.session.flush()
+    times = [(austin, jazz, datetime(2030, 6, 1, 0, 0)),
+             (portland, rock, datetime(2030, 6, 1, 20, 0)),
+             (austin, rock, datetime(2030, 6, 2, 23, 30)),
+             (portland, jazz, datetime(2030, 6, 3, 0, 0))]
+    db.session.add_all([Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time)
+                        for venue, artist, start_time in times])
+    db.session.commit()
+
+
+def show_times(client, query):
+    response = client.get('/api/v1/shows?limit=500&' + query)
+    assert response.status_code == 200, response.data
+    return [datetime.fromisoformat(item['start_time']) for item in response.get_json()['data']]
+
+
+def test_date_range_boundaries(client, shows):
+    # `from` is inclusive; a date-only `to` takes in the whole day, a time
+    # `to` is exclusive
+    assert show_times(client, 'from=2030-06-01&to=2030-06-02') == [
+        datetime(2030, 6, 1, 0, 0), datetime(2030, 6, 1, 20, 0), datetime(2030, 6, 2, 23, 30)]
+    assert show_times(client, 'from=2030-06-01T20:00&to=2030-06-03T00:00') == [
+        datetime(2030, 6, 1, 20, 0), datetime(2030, 6, 2, 23, 30)]
+    assert show_times(client, 'from=2030-06-03') == [datetime(2030, 6, 3, 0, 0)]
+    assert show_times(client, 'to=2030-05-31') == []
+
+
+def test_place_and_genre_filters(client, shows):
+    assert show_times(client, 'city=Austin') == [datetime(2030, 6, 1, 0, 0), datetime(2030, 6, 2, 23, 30)]
+    assert show_times(client, 'state=OR&genre=Jazz') == [datetime(2030, 6, 3, 0, 0)]
+    assert show_times(client, 'genre=Rock n Roll&from=2030-06-02') == [datetime(2030, 6, 2, 23, 30)]
+    assert show_times(client, 'city=Nowhere') == []
+
+
+@pytest.mark.parametrize('query', ['from=June', 'to=2030-13-01'])
+def test_bad_dates_are_rejected(client, query):
+    assert client.get('/api/v1/shows?' + query).status_code == 400
+    assert client.get('/shows?' + query).status_code == 400
+
+
+def test_calendar_groups_by_day_and_keeps_filters_across_pages(client, shows):
+    page = client.get('/shows/calendar?from=2030-06-01&limit=2').get_data(as_text=True)
+    assert page.count('<h3>') == 1 and 'Saturday June 1, 2030' in page
+    assert 'Jazz Trio' in page and 'Rock Band' in page
+    assert 'from=2030-06-01' in page.split('Next page')[0].rsplit('href=', 1)[1]
+    page = client.get('/shows/calendar?from=2030-06-01&state=TX').get_data(as_text=True)
+    assert page.count('<h3>') == 2 and 'Portland Room' not in page
+    assert 'Next page' not in page
+
+
+def test_calendar_starts_at_the_start_of_today(client, app):
+    venue, artist = Venue(name='Hall', city='Austin', state='TX'), Artist(name='Band')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    for start_time in (today - timedelta(minutes=1), today, today + timedelta(days=1)):
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time))
+    db.session.commit()
+    page = client.get('/shows/calendar').get_data(as_text=True)
+    assert page.count('<h3>') == 2
+    yesterday = (today - timedelta(days=1)).strftime('%B %-d, %Y')
+    assert yesterday not in page
+    assert today.strftime('%B %-d, %Y') in page
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import pytest
+from models import db, Venue, Artist, Show
+
+
+def summaries_check(app, *args):
+    result = app.test_cli_runner().invoke(args=['summaries', 'check'] + list(args))
+    return result.exit_code, result.output
+
+
+@pytest.fixture
+def seeded(reseed):
+    # (id, venue_id, artist_id) of the shows; the check command ends the
+    # session, so the tests load rows again after each run
+    reseed(10, 10, 60)
+    return db.session.query(Show.id, Show.venue_id, Show.artist_id).order_by(Show.id).all()
+
+
+def test_summaries_match_a_recount_after_edits_and_deletes(app, seeded):
+    now = datetime.utcnow()
+
+    def show(id_):
+        return Show.query.get(id_)
+    edits = [
+        lambda: db.session.add(Show(venue_id=seeded[0].venue_id, artist_id=seeded[0].artist_id,
+                                    start_time=now + timedelta(days=3))),
+        lambda: setattr(show(seeded[1].id), 'venue_id', seeded[2].venue_id),
+        lambda: setattr(show(seeded[3].id), 'start_time', now - timedelta(days=2)),
+        lambda: setattr(show(seeded[4].id), 'start_time', now + timedelta(days=2)),
+        lambda: db.session.delete(show(seeded[5].id)),
+        lambda: db.session.delete(Venue.query.get(seeded[6].venue_id)),
+        lambda: db.session.delete(Artist.query.get(seeded[7].artist_id)),
+    ]
+    for edit in edits:
+        edit()
+        db.session.commit()
+        code, output = summaries_check(app)
+        assert code == 0, output
+        assert 'venue_id: 0 mismatched' in output and 'artist_id: 0 mismatched' in output
+
+
+def test_check_reports_and_fixes_writes_that_skip_the_hooks(app, seeded):
+    db.session.execute(Show.__table__.delete().where(Show.id == seeded[0].id))
+    db.session.commit()
+    code, output = summaries_check(app)
+    assert code == 1
+    assert 'venue_id: 1 mismatched' in output and 'artist_id: 1 mismatched' in output
+    code, output = summaries_check(app, '--fix')
+    assert code == 0
+    assert summaries_check(app) == (0, 'venue_id: 0 mismatched, 0 waiting for roll\n'
+                                       'artist_id: 0 mismatched, 0 waiting for roll\n')